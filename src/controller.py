@@ -8,12 +8,33 @@ import matplotlib.pyplot as plt
 import numpy as np
 from dateutil import tz
 from mpl_toolkits.basemap import Basemap
+from PySide6.QtCore import QObject, QThreadPool, QTimer, Signal
 from skyfield.api import Timescale, load
 
 from controller_protocol import ControllerProtocol
-from model import Earth, Satellite, TLEManager
+from model import Earth, OrbitPath, Satellite, TLEManager
+from services.ephemeris_service import EphemerisCache
+from services.sun_service import SunService
+from services.time_service import TimeService
 from view import Globe3DView, MainView
 
+MAX_CONSTELLATION = 10000 # satellites drawn as points, one snapshot of 10000 takes about 7 ms of each frame
+
+
+class OrbitPathSignals(QObject):
+    """Carries finished orbit path windows from the worker thread back to the GUI thread."""
+    finished = Signal(object, object) # (satellite, vertices)
+
+
+class SelectionSignals(QObject):
+    """Carries prepared satellite selections from the worker thread back to the GUI thread."""
+    finished = Signal(int, object) # (generation, selection dict or None)
+
+
+class TLERefreshSignals(QObject):
+    """Carries RefreshEvents from the TLE freshness scheduler thread to the GUI thread."""
+    refreshed = Signal(object) # RefreshEvent
+
 
 class ApplicationController(ControllerProtocol):
     def __init__(self, app):
@@ -23,22 +44,58 @@ class ApplicationController(ControllerProtocol):
         self.current_satellite = None # current satellite being tracked
         self.orbit_data = None # orbit data for the current satellite
         self.ground_path = None # ground path for the current satellite
-        self.Timescale = load.timescale() # a timescale is an abstraction representing a linear timeline independent from any constraints from human-made time standards
+        self.orbit_path = None # sliding orbit path window behind ground_path
+        self.orbit_path_busy = False # an orbit path job is running on the thread pool
+        self.orbit_path_pending = False # the controls or the clock changed while it was running
+        self.selection_generation = 0 # bumped by every selection, jobs of older generations are dropped
+        self.selection_busy = False # a selection job is running on the thread pool
+        self.selection_pending = None # the latest catalog ID selected while it was running
+        self.selection_refreshed = set() # catalog numbers refreshed while it was running, re-applied once it lands
+        self.Timescale = TimeService() # a timescale is an abstraction representing a linear timeline independent from any constraints from human-made time standards
         self.isDebug = False
 
         self.local_time = self.Timescale.now().astimezone(tz.tzlocal()).strftime('%Y-%m-%d %H:%M:%S %Z')
 
         # models
+        self.SunService = SunService(self.Timescale) # DE421 loaded once, interpolated Sun vectors and shadow tests
         self.Earth = Earth(self, self.scale)
         self.TLEManager = TLEManager(self)
+        self.EphemerisCache = EphemerisCache(self.Timescale) # interpolated per-frame positions shared by the views
+        self.constellation = None # the catalog, or constellation_group, propagated once per frame and drawn as points
+        self.constellation_group = None # a catalog group to draw instead of the whole catalog, e.g. 'starlink'
+        self.loadConstellation()
 
         # views
         self.MainView = MainView(self)
         self.Globe3DView = Globe3DView(self, self.Earth)
 
+        # orbit path window, recomputed off the GUI thread when the controls settle or the clock advances
+        self.orbit_path_signals = OrbitPathSignals()
+        self.orbit_path_signals.finished.connect(self.applyOrbitPath)
+        self.orbit_path_debounce = QTimer()
+        self.orbit_path_debounce.setSingleShot(True)
+        self.orbit_path_debounce.setInterval(300) # ms of quiet before the controls are applied
+        self.orbit_path_debounce.timeout.connect(self.configureOrbitPath)
+        self.orbit_path_clock = QTimer()
+        self.orbit_path_clock.setInterval(10 * 1000) # slide the window forward every 10 seconds
+        self.orbit_path_clock.timeout.connect(self.scheduleOrbitPath)
+        self.orbit_path_clock.timeout.connect(self.refreshSatOrbit) # getOrbit only recomputes once the elements have drifted
+        for spinbox in (self.MainView.hours_behind_spinbox, self.MainView.hours_ahead_spinbox, self.MainView.increment_spinbox):
+            spinbox.valueChanged.connect(self.orbit_path_debounce.start)
+
+        # satellite selection is prepared off the GUI thread and swapped in when ready
+        self.selection_signals = SelectionSignals()
+        self.selection_signals.finished.connect(self.applySelection)
+
+        # element sets are refreshed in the background, fresh ones replace the cached orbits on the GUI thread
+        self.tle_refresh_signals = TLERefreshSignals()
+        self.tle_refresh_signals.refreshed.connect(self.applyTLERefresh)
+        self.TLEManager.scheduler.subscribe(self.tle_refresh_signals.refreshed.emit)
+        self.app.aboutToQuit.connect(self.TLEManager.scheduler.stop)
+
         # set up the default satellite
         self.MainView.current_sat_id_spinbox.setValue(25544)
-        self.track_Satellite()
+        self.track_Satellite(wait=True) # nothing is rendered yet, so the first satellite is loaded before the view starts
         #self.calcSatOrbit(self.current_satellite)
 
         # bind the signals
@@ -55,6 +112,8 @@ class ApplicationController(ControllerProtocol):
 
     def run(self):
         self.MainView.restoreSettings()
+        self.orbit_path_clock.start()
+        self.TLEManager.scheduler.start()
         self.Globe3DView.run()
 
     def sat_categories(self):
@@ -115,23 +174,97 @@ class ApplicationController(ControllerProtocol):
         return categories
 
     def refresh_sat_combobox(self):
+        """Bring the satellite combobox in line with the catalog index, touching only the rows that changed."""
+        combobox = self.MainView.satellite_combobox
+        index = self.TLEManager.index
+        added, removed, renamed = index.refresh()
+        if combobox.count() == 0 or len(added) + len(removed) + len(renamed) > 64: # every findText() below is O(rows)
+            self.build_sat_combobox()
+        else:
+            for key, name in removed.items():
+                if index.id_of(name) is None: # another satellite with the same name keeps the row
+                    combobox.removeItem(combobox.findText(name))
+            for key, (old_name, new_name) in renamed.items():
+                combobox.setItemText(combobox.findText(old_name), new_name)
+            categories = self.sat_category_of()
+            for key, name in added.items():
+                if combobox.findText(name) != -1:
+                    continue
+                category = categories.get(key)
+                if category is not None: # right below its category header
+                    combobox.insertItem(combobox.findText(f'-------- {category.capitalize()} --------') + 1, name)
+                else:
+                    combobox.addItem(name) # the rest of the satellites
+
+        if self.current_satellite is not None:
+            combobox.setCurrentIndex(combobox.findText(self.current_satellite.name))
+
+    def build_sat_combobox(self):
+        index = self.TLEManager.index
+        rows = []
+        listed = set()
+        for category, satellites in self.sat_categories().items():
+            rows.append(f'-------- {category.capitalize()} --------')
+            for key, sat_name in index.members(satellites):
+                if sat_name not in listed:
+                    rows.append(sat_name)
+                    listed.add(sat_name)
+        rows.append('--- Other ---') # the rest of the satellites
+        rows.extend(sat_name for sat_name in index.ids if sat_name not in listed)
         self.MainView.satellite_combobox.clear()
-        satellites_by_name = self.TLEManager.tle_name_dict()
-        satellites_by_id = {v: k for k, v in satellites_by_name.items()}
-        categories = self.sat_categories()
-        for category, satellites in categories.items():
-            category = category.capitalize()
-            self.MainView.satellite_combobox.addItem(f'-------- {category} --------')
-            for sat_id in satellites:
-                if sat_id in satellites_by_id:
-                    sat_name = satellites_by_id[sat_id]
-                    self.MainView.satellite_combobox.addItem(sat_name)
-        self.MainView.satellite_combobox.addItem('--- Other ---') # the rest of the satellites
-        for sat_name in satellites_by_name:
-            if self.MainView.satellite_combobox.findText(sat_name) == -1: # only add if not already in the list
-                self.MainView.satellite_combobox.addItem(sat_name)
-
-        self.MainView.satellite_combobox.setCurrentIndex(self.MainView.satellite_combobox.findText(self.current_satellite.name))
+        self.MainView.satellite_combobox.addItems(rows)
+
+    def applyTLERefresh(self, event):
+        """Swap in the fresh element sets of a scheduler RefreshEvent, rebuilding the tracked satellite if it was refreshed."""
+        satellite = self.current_satellite
+        if self.selection_busy: # the running job may have read the old set, see applySelection()
+            self.selection_refreshed.update(event.updated)
+        elif satellite is not None and int(satellite.catalog_id) in event.updated:
+            # reselecting reads the fresh set from the catalog, and a new Satellite drops its ephemeris table, orbit and orbit path
+            self.selectSatellite(satellite.catalog_id)
+        if self.constellation_group: # a refresh may also add members to the group
+            members = self.TLEManager.catalog.group_members(self.constellation_group.lower())
+            if not set(event.updated).isdisjoint(members):
+                self.loadConstellation()
+        elif event.updated: # every updated satellite is in the whole catalog
+            self.loadConstellation()
+        self.refresh_sat_combobox()
+
+    def loadConstellation(self):
+        """Pack the local element sets of the whole catalog, or of constellation_group, into the constellation drawn each frame.
+
+        At most MAX_CONSTELLATION satellites are packed, the category satellites first and then the rest in catalog order.
+        """
+        if self.constellation_group:
+            members = self.TLEManager.catalog.group_members(self.constellation_group.lower())
+        else:
+            members = sorted(self.TLEManager.index.names)
+        listed = {int(sat_id) for satellites in self.sat_categories().values() for sat_id in satellites}
+        catalog_ids = [key for key in members if key in listed] + [key for key in members if key not in listed]
+        if len(catalog_ids) > MAX_CONSTELLATION:
+            print(f"Drawing {MAX_CONSTELLATION} of the {len(catalog_ids)} satellites of the constellation.")
+            catalog_ids = catalog_ids[:MAX_CONSTELLATION]
+        try:
+            self.constellation = self.TLEManager.getConstellation(catalog_ids, dtype=np.float32) # GL vertex buffers are float32
+        except Exception as e:
+            print("Error occurred while loading the constellation:", str(e))
+            self.constellation = None
+
+    def setConstellationGroup(self, group: str = None):
+        """Draw the members of a catalog group as the constellation, or the whole catalog for None."""
+        self.constellation_group = group
+        self.loadConstellation()
+
+    def get_constellation_positions(self, time):
+        """Return the scaled ECI positions of the constellation at a time as an (M,3) float32 array, failed satellites left out."""
+        if self.constellation is None or not len(self.constellation):
+            return None
+        positions, errors = self.Earth.getConstellationECICoordinates(self.constellation, time)
+        return positions[errors == 0]
+
+    def sat_category_of(self):
+        """Return {catalog number: category} for every satellite listed in a category."""
+        return {int(sat_id): category for category, satellites in self.sat_categories().items() for sat_id in satellites}
 
     def refresh_quality_combobox(self):
         self.MainView.quality_combobox.clear()
@@ -139,14 +272,102 @@ class ApplicationController(ControllerProtocol):
             self.MainView.quality_combobox.addItem(str(quality))
         self.MainView.quality_combobox.setCurrentIndex(self.MainView.quality_combobox.findText(str(self.Globe3DView.quality)))
 
-    def track_Satellite(self):
+    def track_Satellite(self, wait: bool = False):
+        """Select the satellite of the Catalog ID spinbox.
+
+        The TLE lookup (and a download if the satellite is not in the catalog), its ephemeris table, orbit and ground path
+        are prepared on the thread pool while the current satellite keeps rendering, then swapped in at once.
+
+        Args:
+            wait (bool, optional): Prepare and apply the selection before returning. Defaults to False.
+        """
         text = self.MainView.current_sat_id_spinbox.textFromValue(self.MainView.current_sat_id_spinbox.value())
-        sat = self.TLEManager.getSatellite(text)
-        if sat is None:
+        self.selectSatellite(text, wait)
+
+    def selectSatellite(self, catalog_id: str, wait: bool = False):
+        """Start preparing the selection of a Catalog ID, superseding every selection still in progress."""
+        self.selection_generation += 1
+        if wait:
+            selection = self.prepareSelection(catalog_id, self.orbitPathControls())
+            if selection is not None:
+                self.commitSelection(selection)
             return
-        else:
-            self.setCurrentSatellite(sat)
-            self.Globe3DView.setScene(self.Globe3DView.SceneView.EXPLORE_VIEW)
+        self.selection_pending = catalog_id
+        if not self.selection_busy:
+            self.startSelection()
+
+    def startSelection(self):
+        """Run the pending selection on the thread pool, only one job runs at a time and only the latest one is kept."""
+        catalog_id, self.selection_pending = self.selection_pending, None
+        self.selection_busy = True
+        generation = self.selection_generation
+        controls = self.orbitPathControls() # widgets are only read on the GUI thread
+
+        def job():
+            try:
+                selection = self.prepareSelection(catalog_id, controls, generation)
+            except Exception as e:
+                print("Error occurred while selecting satellite " + catalog_id + ":", str(e))
+                selection = None
+            self.selection_signals.finished.emit(generation, selection)
+
+        QThreadPool.globalInstance().start(job)
+
+    def prepareSelection(self, catalog_id: str, controls, generation: int = None):
+        """Build everything a selection needs without touching the state the views render from.
+
+        Args:
+            catalog_id (str): The Catalog ID to select.
+            controls (tuple): The orbit path controls, see orbitPathControls().
+            generation (int, optional): The selection generation of the job, it stops between steps once a newer
+                selection was made. Defaults to None, never stop.
+
+        Returns:
+            dict: The satellite, its ephemeris table, orbit vertices, orbit path and ground path, or None if the satellite
+            could not be loaded or the job was superseded.
+        """
+        def superseded():
+            return generation is not None and generation != self.selection_generation
+
+        satellite = self.TLEManager.getSatellite(catalog_id)
+        if satellite is None or superseded():
+            return None
+        return self.selectionOf(satellite, controls, superseded)
+
+    def selectionOf(self, satellite: Satellite, controls, superseded=lambda: False):
+        """Propagate the ephemeris table, orbit and ground path of a loaded satellite, checking `superseded()` between steps."""
+        time = self.Timescale.now()
+        table = self.EphemerisCache.prepare(satellite, time)
+        if superseded():
+            return None
+        orbit = self.calcSatOrbit(satellite)
+        if superseded():
+            return None
+        orbit_path = OrbitPath(self.Earth, satellite, *controls)
+        ground_path = orbit_path.update(time)
+        return {"satellite": satellite, "table": table, "orbit": orbit, "orbit_path": orbit_path, "ground_path": ground_path}
+
+    def applySelection(self, generation: int, selection):
+        """Receive a finished selection job on the GUI thread, committing it unless it was superseded, then start the next one."""
+        self.selection_busy = False
+        if generation == self.selection_generation and selection is not None:
+            self.commitSelection(selection)
+        refreshed, self.selection_refreshed = self.selection_refreshed, set()
+        if self.selection_pending is not None: # a newer selection reads the catalog again anyway
+            self.startSelection()
+        elif self.current_satellite is not None and int(self.current_satellite.catalog_id) in refreshed:
+            self.selectSatellite(self.current_satellite.catalog_id) # its set was refreshed while the job ran
+
+    def commitSelection(self, selection):
+        """Swap in a prepared selection in one step, between two frames."""
+        if self.current_satellite is not None:
+            self.EphemerisCache.untrack(self.current_satellite)
+        self.EphemerisCache.adopt(selection["table"])
+        self.current_satellite = selection["satellite"]
+        self.orbit_data = selection["orbit"]
+        self.orbit_path = selection["orbit_path"]
+        self.ground_path = selection["ground_path"]
+        self.Globe3DView.setScene(self.Globe3DView.SceneView.EXPLORE_VIEW)
         self.refresh_sat_combobox()
 
     def display_2D_map(self):
@@ -168,7 +389,9 @@ class ApplicationController(ControllerProtocol):
         plt.show()
 
     def sat_combobox_activated(self, index):
-        value = int(self.get_satellite_dict()[self.MainView.satellite_combobox.currentText()])
+        value = self.TLEManager.index.id_of(self.MainView.satellite_combobox.currentText())
+        if value is None: # a category header
+            return
 
         self.MainView.current_sat_id_spinbox.setValue(value)
 
@@ -186,19 +409,57 @@ class ApplicationController(ControllerProtocol):
     def get_satellite_dict(self):
         return self.TLEManager.tle_name_dict()
 
-    def setCurrentSatellite(self, satellite: Satellite):
-        self.current_satellite = satellite
-        self.orbit_data = self.calcSatOrbit(satellite)
-        length = 1 # hours
-        res = length * 60 # minutes
-        self.ground_path = self.Earth.calcSatelliteGroundPath(satellite, self.Timescale.now(), length, res)
+    def orbitPathControls(self):
+        """Return the (hours behind, hours ahead, increment minutes) set in the Orbit Path controls."""
+        return (self.MainView.hours_behind_spinbox.value(),
+                self.MainView.hours_ahead_spinbox.value(),
+                self.MainView.increment_spinbox.value())
+
+    def configureOrbitPath(self):
+        if self.orbit_path is None:
+            return
+        self.orbit_path_pending = True # applied by the next job so the window is never mutated while a job runs
+        self.scheduleOrbitPath()
+
+    def scheduleOrbitPath(self):
+        """Update the orbit path window on the thread pool, coalescing requests that arrive while a job is running."""
+        if self.orbit_path is None:
+            return
+        if self.orbit_path_busy:
+            self.orbit_path_pending = True
+            return
+        self.orbit_path_busy = True
+        orbit_path = self.orbit_path
+        controls = self.orbitPathControls() if self.orbit_path_pending else None
+        self.orbit_path_pending = False
+        time = self.Timescale.now()
+
+        def job():
+            try:
+                if controls is not None:
+                    orbit_path.configure(*controls)
+                vertices = orbit_path.update(time)
+            except Exception as e:
+                print("Error occurred while updating the orbit path:", str(e))
+                vertices = None
+            self.orbit_path_signals.finished.emit(orbit_path.satellite, vertices)
+
+        QThreadPool.globalInstance().start(job)
+
+    def applyOrbitPath(self, satellite, vertices):
+        """Swap in a finished orbit path on the GUI thread, ignoring results for a satellite that is no longer tracked."""
+        self.orbit_path_busy = False
+        if satellite is self.current_satellite and vertices is not None:
+            self.ground_path = vertices
+        if self.orbit_path_pending or (self.orbit_path is not None and self.orbit_path.satellite is not satellite):
+            self.scheduleOrbitPath()
 
 
 
     def get_current_satellite_translation(self):
         if self.current_satellite is None:
             return None
-        return self.current_satellite.calc_sat_pos_xyz()
+        return self.EphemerisCache.position(self.current_satellite, self.Timescale.now()) * self.scale
 
     def toggleDebug(self, event):
         self.isDebug = not self.isDebug
@@ -232,4 +493,8 @@ class ApplicationController(ControllerProtocol):
         return
 
     def calcSatOrbit(self, satellite):
-        return satellite.getOrbit()
\ No newline at end of file
+        return satellite.getOrbit(self.Timescale.now(), self.Earth.scale)
+
+    def refreshSatOrbit(self):
+        if self.current_satellite is not None:
+            self.orbit_data = self.calcSatOrbit(self.current_satellite)
\ No newline at end of file
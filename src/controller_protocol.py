@@ -15,10 +15,10 @@ class ControllerProtocol(Protocol):
         pass
     def get_satellite_dict(self):
         pass
-    def setCurrentSatellite(self, satellite):
-        pass
     def get_current_satellite_translation(self):
         pass
+    def get_constellation_positions(self, time):
+        pass
     def toggle_quality(self):
         pass
     def toggle_scene():
@@ -351,34 +351,24 @@ class EarthMapView3D(QOpenGLWidget):
     def calcSatelliteOrbit(self, satellite_name):
         satellite = []
         satellite.append(self.trackerService.fetch_or_use_local_tle(satellite_name))
-        points = self.trackerService.calculate_orbit_points_around_globe(satellite[0])
-        translations = []
-        for point in points:
-            theta = point.longitude.degrees
-            phi = point.latitude.degrees
-
-            elevation = self.earthRadius + point.elevation.km
-
-            translations.append([elevation * cos(radians(phi)) * cos(radians(theta)),
-                                 elevation * cos(radians(phi)) * sin(radians(theta)),
-                                 elevation * sin(radians(phi))])
-
-        return translations
+        lats, lons, alts = self.trackerService.calculate_orbit_points_around_globe(satellite[0])
+        return self.calcTranslations(lats, lons, alts)
 
     def calcSatellitePositionAtTime(self, satellite_name, time):
-        points = self.trackerService.calculate_satellite_position_at_time(self.trackerService.fetch_or_use_local_tle(satellite_name), time)
-        translations = []
-        for point in points:
-            theta = point.longitude.degrees
-            phi = point.latitude.degrees
+        lats, lons, alts = self.trackerService.calculate_satellite_position_at_time(self.trackerService.fetch_or_use_local_tle(satellite_name), time)
+        return self.calcTranslations(lats, lons, alts)
 
-            elevation = self.earthRadius + point.elevation.km
+    def calcTranslations(self, lats, lons, alts):
+        """Place latitude, longitude and altitude arrays around the sphere of radius earthRadius, all points at once."""
+        theta = np.radians(lons)
+        phi = np.radians(lats)
 
-            translations.append([elevation * cos(radians(phi)) * cos(radians(theta)),
-                                 elevation * cos(radians(phi)) * sin(radians(theta)),
-                                 elevation * sin(radians(phi))])
+        elevation = self.earthRadius + np.asarray(alts) * self.scale # altitudes are in km
 
-        return translations
+        translations = np.stack([elevation * np.cos(phi) * np.cos(theta),
+                                 elevation * np.cos(phi) * np.sin(theta),
+                                 elevation * np.sin(phi)], axis=-1)
+        return translations.tolist()
 
     def drawSatelliteOrbit(self):
         if not self.translations:
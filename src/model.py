@@ -1,7 +1,6 @@
-import asyncio
 import datetime
 import os
-import socket
+import threading
 from ast import List
 from calendar import c
 from math import (
@@ -31,6 +30,14 @@ from skyfield.positionlib import Geocentric
 from skyfield.toposlib import Geoid
 
 from config import map_textures
+from services.archive_service import TLEArchive
+from services.catalog_service import CatalogIndex, TLECatalog, norad_id
+from services.download_service import FAILED, MISSING, TLEDownloader
+from services.frame_service import GMST, ITRS, FrameTransformer, ecef_to_geodetic, geodetic_to_ecef
+from services.freshness_service import FreshnessScheduler
+from services.ingest_service import GroupIngestor
+from services.propagation_service import ConstellationPropagator, propagate
+from services.satellite_store import SatelliteRecord, SatelliteStore
 
 ''' In MVC, the model is the part of the application that is responsible for managing the data.
 It receives requests from the controller and returns the data to the controller.
@@ -39,6 +46,7 @@ The model is not aware of the view, so the data returned by the model is indepen
 For space-map, the Model has several components:
 - Satellite: A class representing a satellite object. It holds all data related to a satellite and methods for basic calculations using it.
 - Earth: A class representing the Earth globe and all parameters related to it, as well as methods for basic calculations with it.
+- OrbitPath: A sliding window of ground path vertices driven by the Past, Future and Resolution orbit path controls.
 - TLEManager: Manages TLE orbital data; Reading from file, validating Epoch, requesting new data from Celestrak, and building Satellite objects.
 - Observer: A class representing an observer on the Earth's surface. It holds data such as location and methods for calculating satellite visibility.
 
@@ -368,13 +376,23 @@ The result should be a satellite object that behaves exactly as though it had be
 
 class Satellite(EarthSatellite): # Inherit from EarthSatellite
     """Custom Satellite class to extend the Skyfield EarthSatellite class with additional functionality.
+
+    A Satellite is the full Skyfield object, for the satellite being tracked. Catalog-scale sets of satellites are loaded as
+    SatelliteRecords of a SatelliteStore instead, which build a Satellite only when one is needed.
     """
-    def __init__(self, controller, catalog_id, line1, line2, name="Unnamed Satellite", metadata=None):
-        print("Satellite object created for: " + name, "Catalog ID: " + catalog_id)
-        super().__init__(line1, line2, name)
-        self.controller = controller
+    orbit_lock = threading.Lock() # getOrbit() runs on the GUI thread and on selection jobs
+
+    def __init__(self, catalog_id, line1, line2, name="Unnamed Satellite", ts=None):
+        super().__init__(line1, line2, name, ts)
         self.catalog_id = catalog_id
-        self.metadata = metadata if metadata is not None else {}
+
+    @classmethod
+    def from_record(cls, record: SatelliteRecord):
+        """Materialize the Satellite of a SatelliteRecord straight from its elements, the factory of the TLEManager's stores."""
+        satellite = cls.from_satrec(record.satrec(), record.store.ts)
+        satellite.name = record.name
+        satellite.catalog_id = record.catalog_id
+        return satellite
 
     def epoch_valid_at(self, time: datetime.datetime, margin: int = 14):
         """Check if the Satellite's epoch is valid at a given time, default margin for validity is 2 weeks before and after the epoch.
@@ -398,45 +416,70 @@ class Satellite(EarthSatellite): # Inherit from EarthSatellite
             return False
         return True
 
-    def getOrbit(self):
-        # Constants and orbital elements
-        orbits_per_minute = self.model.no_kozai / 6.283185307179586476925287 # Convert mean motion to orbits per minute
-        orbits_per_day = 24 * 60 * orbits_per_minute
-        n = orbits_per_day * 2 * np.pi / 86400  # Convert to radians per second
-
-        # Calculate the elements of the osculating satellite orbit
-        elements = osculating_elements_of(self.at(self.controller.Timescale.now()))
-        a = elements.semi_major_axis.km * self.controller.Earth.scale  # Semi-major axis
-        e = elements.eccentricity
-        i = elements.inclination.radians
-        Omega = elements.longitude_of_ascending_node.radians
-        omega = elements.argument_of_periapsis.radians
-        b = elements.semi_minor_axis.km * self.controller.Earth.scale  # Semi-minor axis
-
-        # Define u and v
-        u = np.array([
+    def getOrbit(self, now: Time, scale: float, drift_tolerance: float = 0.1):
+        """Return the vertices of the satellite's osculating orbit ellipse, cached until the elements drift.
+
+        The cache is keyed on the TLE epoch and the Earth scale, and is recomputed once the secular drift of the ascending node
+        or the argument of perigee since the cached elements exceeds drift_tolerance degrees.
+
+        Args:
+            now (Time): The time of the osculating elements.
+            scale (float): The scale of the Earth model.
+            drift_tolerance (float, optional): Allowed drift of the orbit orientation in degrees. Defaults to 0.1.
+
+        Returns:
+            np.ndarray: The (251,3) ellipse vertices, closed so the last vertex repeats the first.
+        """
+        key = (self.model.jdsatepoch, self.model.jdsatepochF, scale)
+        with Satellite.orbit_lock: # the cache is checked and replaced as one step
+            cache = getattr(self, "_orbit_cache", None)
+            if cache is not None and cache["key"] == key:
+                minutes = abs(now.tt - cache["tt"]) * 1440
+                drift = max(abs(self.model.nodedot), abs(self.model.argpdot)) * minutes # secular rates are in radians per minute
+                if degrees(drift) <= drift_tolerance:
+                    return cache["positions"]
+
+            # Calculate the elements of the osculating satellite orbit
+            elements = osculating_elements_of(self.at(now))
+            positions = self.orbitVertices(
+                elements.semi_major_axis.km * scale,
+                elements.eccentricity,
+                elements.inclination.radians,
+                elements.longitude_of_ascending_node.radians,
+                elements.argument_of_periapsis.radians,
+            )
+            self._orbit_cache = {"key": key, "tt": now.tt, "positions": positions}
+            return positions
+
+    @staticmethod
+    def orbitVertices(a, e, i, Omega, omega, num: int = 250):
+        """Build closed orbit ellipses from Keplerian elements with NumPy broadcasting.
+
+        Scalars return a single (num+1,3) ellipse and (M,) arrays return an (M,num+1,3) stack, one ellipse per satellite.
+        """
+        a, e, i, Omega, omega = (np.asarray(x, dtype=np.float64)[..., None] for x in (a, e, i, Omega, omega))
+
+        # Define u and v, the in-plane unit vectors towards periapsis and 90 degrees ahead of it
+        u = np.stack([
             np.cos(Omega) * np.cos(omega) - np.sin(Omega) * np.sin(omega) * np.cos(i),
             np.sin(Omega) * np.cos(omega) + np.cos(Omega) * np.sin(omega) * np.cos(i),
             np.sin(omega) * np.sin(i)
-        ])
+        ], axis=-1)
 
-        v = np.array([
+        v = np.stack([
             -np.cos(Omega) * np.sin(omega) - np.sin(Omega) * np.cos(omega) * np.cos(i),
             -np.sin(Omega) * np.sin(omega) + np.cos(Omega) * np.cos(omega) * np.cos(i),
             np.cos(omega) * np.sin(i)
-        ])
+        ], axis=-1)
 
-        # Calculate positions
-        t = np.linspace(-2 * np.pi, 2 * np.pi, 500)
+        # Only one revolution is drawn, so only its half of the original 2 * num sample grid is generated
+        t = np.linspace(-2 * np.pi, 2 * np.pi, 2 * num)[:num]
         r = a * (1 - e**2) / (1 + e * np.cos(t))  # Radius vector in the orbital plane
 
-        positions = np.array([r[j] * np.cos(t[j]) * u + r[j] * np.sin(t[j]) * v for j in range(len(t))])
+        positions = (r * np.cos(t))[..., None] * u + (r * np.sin(t))[..., None] * v
 
-        # Only take half of the orbit and make the first position the same as the last to close the orbit
-        positions = positions[:len(positions) // 2]
-        positions = np.append(positions, [positions[0]], axis=0)
-
-        return positions
+        # make the first position the same as the last to close the orbit
+        return np.concatenate([positions, positions[..., :1, :]], axis=-2)
 
 
 class Earth(Geoid):
@@ -458,6 +501,7 @@ class Earth(Geoid):
         self.karman_line = self.radius.km + 100 * scale  # Karman Line in km
         self.van_allen_belt = self.radius.km + 640 * scale  # Inner Van Allen Belt in km
         self.upVector = np.array([0, 1, 0]) # +y aligned
+        self.frames = FrameTransformer() # cached ECI <-> ECEF rotation stacks
 
         self.textures_8k = {
             "earth_daymap": os.path.join(map_textures, "blue_marble_NASA_land_ocean_ice_8192.png"),
@@ -477,7 +521,7 @@ class Earth(Geoid):
             "stars_milky_way": os.path.join(map_textures, "2k_stars_milky_way.jpg")
         }
 
-        self.de421 = load('de421.bsp') # load the DE421 ephemeris for planetary positions
+        self.de421 = self.controller.SunService.ephemeris # the DE421 ephemeris for planetary positions, loaded once by the sun service
         self.sun_eph = self.de421['sun']
         self.earth_eph = self.de421['earth']
         self.eph = self.de421
@@ -601,14 +645,17 @@ class Earth(Geoid):
         '''
 
     def calculateRotation(self, time: Time):
-        """Calculate the rotation of the earth at a given time. This is a 3x3 rotation matrix that defines the relationship between the Earth's ICRS frame and the Ecliptic frame."""
+        """Calculate the rotation angle of the earth at a given time in degrees, for glRotatef. The frame service works in radians, see gmst_angle()."""
         return time.gmst * 15 # GMST is in hours, convert to degrees
 
     def isSunlit(self, satellite: Satellite, time: Time):
-        """Check if a satellite is in sunlight at a given time."""
-        # an ephemeris is required to compute the Sun's position
-        eph = load('de421.bsp')
-        return satellite.at(time).is_sunlit(eph)
+        """Check if a satellite is in sunlight at a given time or Time array, using the conical shadow model of the sun service.
+
+        The position comes from the controller's EphemerisCache, the interpolated position already drawn this frame,
+        instead of a fresh SGP4 call.
+        """
+        position = self.controller.EphemerisCache.position(satellite, time)
+        return self.controller.SunService.is_sunlit(position, time.tt)
 
     def get2DCartesianCoordinates(self, satellite: Satellite, time: Time):
         """
@@ -623,30 +670,68 @@ class Earth(Geoid):
         """
         # Compute the geocentric position of the satellite at the given time
         geocentric_position = satellite.at(time)
+        return self.geographicCoordinatesOf(geocentric_position)
 
-        # Use the Skyfield API's method to get latitude and longitude from the geocentric position
-        latitude, longitude = self.latlon_of(geocentric_position)
-        altitude = (geocentric_position.distance().km * self.scale) - self.radius.km
+    def geographicCoordinatesOf(self, geocentric_position: Geocentric):
+        """ Return the latitude, longitude and scaled altitude of an already computed geocentric position, e.g. one from the EphemerisCache. """
+        latitude, longitude, altitude = self.geodeticOf(geocentric_position.position.km.T, geocentric_position.t, memoize=False) # a per-frame time
+        if not geocentric_position.t.shape: # a single time returns single values, also for (3,1) cached positions
+            latitude, longitude, altitude = latitude.reshape(()), longitude.reshape(()), altitude.reshape(())
+        return Angle(degrees=latitude), Angle(degrees=longitude), altitude
 
-        return latitude, longitude, altitude
+    def geodeticOf(self, positions: np.ndarray, time: Time, memoize: bool = True):
+        """ Convert unscaled GCRS positions straight from propagation into geodetic coordinates, without any per-point Skyfield objects.
+
+        Args:
+            positions (np.ndarray): GCRS positions in km shaped (3,), (N,3) or (M,N,3).
+            time (Time): The matching Time or Time array of N times.
+            memoize (bool, optional): Cache the rotation stack of the times, False for times that are never repeated. Defaults to True.
+
+        Returns:
+            tuple: (latitude, longitude, altitude) arrays, latitude and longitude in degrees and the altitude above the ellipsoid in scaled km.
+        """
+        ecef = self.ECItoECEF(np.asarray(positions) * self.scale, time, ITRS, memoize)
+        latitude, longitude, altitude = ecef_to_geodetic(ecef, self.radius.km, self.inverse_flattening)
+        return np.degrees(latitude), np.degrees(longitude), altitude
+
+    def surfacePoints(self, latitude, longitude, altitude):
+        """ Convert geodetic latitude and longitude in degrees and scaled altitude into (..., 3) scaled ECEF vertices. """
+        return geodetic_to_ecef(np.radians(latitude), np.radians(longitude), altitude, self.radius.km, self.inverse_flattening)
 
     def getECEFCoordinates(self, satellite: Satellite, times):
         """ Calculate the Earth-Centered Earth-Fixed (ECEF) coordinates of the satellite at the given time or times. """
 
-        xyz = []
-        if isinstance(times, Time): # convert to list if single time is provided
+        if isinstance(times, Time) and not times.shape: # a single time returns its GeographicPosition
             lat, lon, alt = self.get2DCartesianCoordinates(satellite, times)
             return self.latlon(lat, lon, alt)
 
-        elif isinstance(times, list): # if a list of times is provided
-            for time in times:
-                lat, lon, alt = self.get2DCartesianCoordinates(satellite, time)
-                geocentric = self.latlon(lat.degrees, lon.degrees, alt)
+        elif isinstance(times, (Time, list, np.ndarray)): # a Time array, a list of times, or an array of Julian dates
+            times = self.timeArray(times)
+            positions, velocities = self.propagate(satellite, times)
+            return self.ECItoECEF(positions, times, ITRS) # (N,3) ECEF coordinates
+
+    def timeArray(self, times):
+        """ Return a single Time array for a Time, a list of Time objects, or an array of Terrestrial Time Julian dates. """
+        if isinstance(times, Time):
+            return times
+        if isinstance(times, list) and times and isinstance(times[0], Time):
+            whole = np.array([time.whole for time in times])
+            fraction = np.array([time.tt_fraction for time in times])
+            return self.controller.Timescale.tt_jd(whole, fraction)
+        return self.controller.Timescale.tt_jd(np.asarray(times, dtype=np.float64))
 
-                xyz.append(geocentric.at(time).position.km ) # append the ECEF coordinates to the list
-            return np.array(xyz)
+    def propagate(self, satellite: Satellite, times):
+        """ Propagate the satellite over a whole time span with a single SGP4 call.
 
+        Args:
+            satellite (Satellite): The satellite to propagate.
+            times (Time | list | np.ndarray): A Time array, a list of Time objects, or an array of Terrestrial Time Julian dates.
 
+        Returns:
+            tuple: (positions, velocities) as (N,3) ECI arrays in scaled km and scaled km/s.
+        """
+        positions, velocities, errors = propagate(satellite, self.timeArray(times))
+        return positions * self.scale, velocities * self.scale
 
     def getECICoordinatesSingle(self, satellite: Satellite, time: Time):
         """ Calculate the Earth-Centered Inertial (ECI) coordinates of the satellite at a given time. """
@@ -662,73 +747,152 @@ class Earth(Geoid):
     def getECICoordinates(self, satellite: Satellite, times):
         """ Calculate the Earth-Centered Inertial (ECI) coordinates of the satellite at the given time or times. """
 
-        xyz = [] # list to store the ECI coordinates
-        if isinstance(times, Time): # convert to list if single time is provided
+        if isinstance(times, Time) and not times.shape: # a single time returns a single position
             geocentric = satellite.at(times)
             return np.array(geocentric.position.km * self.scale)
 
-        elif isinstance(times, list): # if a list of times is provided
-            for time in times: # iterate over each time in the list
-                geocentric = satellite.at(time)
-                xyz.append(geocentric.position.km * self.scale) # append the ECI coordinates to the list
-            return np.array(xyz)
+        elif isinstance(times, (Time, list, np.ndarray)): # every time in the span is propagated in one call
+            positions, velocities = self.propagate(satellite, times)
+            return positions
 
         else:
             print("Invalid time format provided.")
             return np.array([0, 0, 0])
 
-    def ECEFtoECI(self, ecef_pos: np.array, time: Time): # applies earths rotation to convert ECEF to ECI
-        """ Convert Earth-Centered Earth-Fixed (ECEF) coordinates to Earth-Centered Inertial (ECI) coordinates at a given time. """
-        rotation = self.calculateRotation(time)
-        rotation_matrix = np.array([[np.cos(rotation), -np.sin(rotation), 0],
-                                    [np.sin(rotation), np.cos(rotation), 0],
-                                    [0, 0, 1]])
-        return np.dot(rotation_matrix, ecef_pos)
-
-    def ECItoECEF(self, eci_pos: np.array, time: Time): # negatively applies earths rotation to convert ECI to ECEF
-        """ Convert Earth-Centered Inertial (ECI) coordinates to Earth-Centered Earth-Fixed (ECEF) coordinates at a given time. """
-        rotation = self.calculateRotation(time)
-        rotation_matrix = np.array([[np.cos(rotation), np.sin(rotation), 0],
-                                    [-np.sin(rotation), np.cos(rotation), 0],
-                                    [0, 0, 1]])
-        return np.dot(rotation_matrix, eci_pos)
+    def getConstellationECICoordinates(self, constellation: ConstellationPropagator, time: Time):
+        """ Calculate the ECI coordinates of every satellite in a constellation at a single time with one vectorized SGP4 call.
+
+        Args:
+            constellation (ConstellationPropagator): The packed satellites to propagate.
+            time (Time): The time at which to calculate the positions.
+
+        Returns:
+            tuple: (positions, errors) as an (M,3) array in scaled km and an (M,) array of sgp4 error codes.
+        """
+        positions, errors = constellation.snapshot(time)
+        positions *= self.scale
+        return positions, errors
+
+    def ECEFtoECI(self, ecef_pos: np.array, time: Time, model: str = GMST, memoize: bool = True): # applies earths rotation to convert ECEF to ECI
+        """ Convert Earth-Centered Earth-Fixed (ECEF) coordinates to Earth-Centered Inertial (ECI) coordinates at a given time.
+
+        A (3,) position takes a single Time; (N,3) positions or an (M,N,3) batch take a Time array of N times and are rotated in one call.
+        """
+        return self.frames.ecef_to_eci(ecef_pos, time, model, memoize)
+
+    def ECItoECEF(self, eci_pos: np.array, time: Time, model: str = GMST, memoize: bool = True): # negatively applies earths rotation to convert ECI to ECEF
+        """ Convert Earth-Centered Inertial (ECI) coordinates to Earth-Centered Earth-Fixed (ECEF) coordinates at a given time.
+
+        A (3,) position takes a single Time; (N,3) positions or an (M,N,3) batch take a Time array of N times and are rotated in one call.
+        """
+        return self.frames.eci_to_ecef(eci_pos, time, model, memoize)
 
     def calcSatelliteOrbitVertices(self, satellite, epoch: Time):
         """ Calculate the satellite's mean orbital path for 1 revolution as vertex positions at a resolution of 1 minute. """
-        minutes = np.linspace(0, satellite.model.no_kozai * 1440, num=1000) # average positions around 1 revolution in minutes
-        timestamps = [epoch + datetime.timedelta(minutes=m) for m in minutes] # create a list of timestamps for each minute
+        minutes = satellite.model.no_kozai * 1440 # average positions around 1 revolution in minutes
+        timestamps = self.controller.Timescale.span(epoch, minutes * 60, 1000) # one memoized Time array for the whole revolution
         coords = self.getECICoordinates(satellite, timestamps) # get the ECI coordinates for each timestamp
         return  coords
 
     def calcSatelliteGroundPath(self, satellite, epoch: Time, len: int = 60, res: int = 60):
         """ Calculate the satellite's ground path for len hrs at a resolution of res mins. """
-        minutes = np.linspace(0, len * 60, num=res) # average positions around 1 hour in minutes
         #minutes = np.linspace(0, (satellite.model.no_kozai * 1440), num=1000)
-        timestamps = [epoch + datetime.timedelta(minutes=m) for m in minutes]
-        coords2D = [self.get2DCartesianCoordinates(satellite, t) for t in timestamps]
+        timestamps = self.controller.Timescale.span(epoch, len * 3600, res) # average positions around 1 hour
+        return self.calcGroundPathAt(satellite, timestamps)
 
-        # map the lat and lon on the earth's surface manually
+    def calcGroundPathAt(self, satellite, timestamps: Time):
+        """ Calculate the satellite's ground path vertices at each time of a Time array. """
+        positions, velocities, errors = propagate(satellite, timestamps)
+        lat, lon, alt = self.geodeticOf(positions, timestamps)
 
-        geocentrics = np.array([self.latlon(lat.degrees, lon.degrees, 50 * self.scale * 1000) for lat, lon, alt in coords2D])
-        coords3D = np.array([geocentric.at(t).position.km for geocentric, t in zip(geocentrics, timestamps)])
-        coordsECEF = np.array([self.ECItoECEF(coord, t) for coord, t in zip(coords3D, timestamps)])
+        # map the lat and lon on the earth's surface, 50 km above the ellipsoid
+        coordsECEF = self.surfacePoints(lat, lon, 50 * self.scale)
 
         return coordsECEF
 
 
+class OrbitPath:
+    """A sliding window of ground path vertices for the Past / Future / Resolution orbit path controls.
+
+    Vertices sit on a fixed grid of `increment` minutes, so as time advances or the window is widened only the newly exposed
+    grid nodes are propagated and expired ones are dropped. Changing the increment moves the grid and recomputes the window.
+    """
+    def __init__(self, earth: Earth, satellite: Satellite, hours_behind: float, hours_ahead: float, increment: float):
+        self.Earth = earth
+        self.satellite = satellite
+        self.first_node = 0
+        self.vertices = np.empty((0, 3))
+        self.lock = threading.Lock() # selection and orbit path jobs run on the thread pool
+        self.configure(hours_behind, hours_ahead, increment)
+
+    def configure(self, hours_behind: float, hours_ahead: float, increment: float):
+        """Set the window from the control values, hours behind and ahead of now at a resolution of increment minutes."""
+        with self.lock:
+            if getattr(self, "increment", None) != increment:
+                self.vertices = np.empty((0, 3)) # the grid moved, nothing cached is reusable
+            self.hours_behind = hours_behind
+            self.hours_ahead = hours_ahead
+            self.increment = increment
+            self.step_days = increment / 1440
+
+    def update(self, time: Time):
+        """Slide the window to `time`, propagating only grid nodes that are not cached yet.
+
+        Returns:
+            np.ndarray: The (N,3) ground path vertices from hours_behind before to hours_ahead after `time`.
+        """
+        with self.lock:
+            node = int(np.floor(time.tt / self.step_days))
+            new_first = node - int(np.ceil(self.hours_behind * 60 / self.increment))
+            new_last = node + int(np.ceil(self.hours_ahead * 60 / self.increment)) # inclusive
+
+            first = self.first_node
+            last = first + len(self.vertices) - 1
+            if not len(self.vertices) or new_first > last or new_last < first: # no overlap, compute the whole window
+                self.vertices = self.calcNodes(new_first, new_last)
+            else:
+                parts = []
+                if new_first < first:
+                    parts.append(self.calcNodes(new_first, first - 1))
+                parts.append(self.vertices[max(new_first, first) - first:min(new_last, last) - first + 1])
+                if new_last > last:
+                    parts.append(self.calcNodes(last + 1, new_last))
+                self.vertices = np.concatenate(parts)
+
+            self.first_node = new_first
+            return self.vertices
+
+    def calcNodes(self, first: int, last: int):
+        """Calculate the ground path vertices for grid nodes first..last (inclusive)."""
+        timestamps = self.Earth.controller.Timescale.nodes(first, last, self.increment * 60)
+        return self.Earth.calcGroundPathAt(self.satellite, timestamps)
+
+
 class TLEManager:
     """Manages TLE orbital data; Reading from .TLE files, validating Epoch, requesting new data from Celestrak, and building Satellite objects.
     """
-    def __init__(self, controller, tle_dir: str = "src/data/tle_data"):
+    def __init__(self, controller, tle_dir: str = "src/data/tle_data", catalog_path: str = "src/data/tle_catalog.sqlite",
+                 archive_dir: str = "src/data/tle_archive"):
         super().__init__()
         self.controller = controller
         self.tle_dir = tle_dir
         if not os.path.exists(self.tle_dir):
             os.makedirs(self.tle_dir)
 
+        self.archive = TLEArchive(archive_dir) # history of every element set, for times far from the current epoch
+        self.catalog = TLECatalog(catalog_path, self.archive) # indexed store of the latest element set, keyed by NORAD ID
+        if not len(self.archive): # start the history with what the catalog already holds
+            self.archive.append_rows(self.catalog.records())
+        self.index = CatalogIndex(self.catalog, self.tle_dir) # resident name <-> ID index, imports new or changed .tle files
+        self.ingestor = GroupIngestor(self.catalog) # whole Celestrak groups in one request each
+        self.downloader = TLEDownloader(self.catalog) # single Catalog IDs, concurrent over a keep-alive session
+        self.scheduler = FreshnessScheduler(self.catalog, self.downloader, ingestor=self.ingestor) # background refresh before epochs go stale, see start()
+
     def path_from_ID(self, catalog_id: str):
         """Get the path to the TLE file for a given Catalog ID.
 
+        Only a file named exactly after the Catalog ID, with or without zero padding, matches, so '0544' never matches '00544.tle'.
+
         Args:
             catalog_id (str): The Catalog ID of the satellite.
 
@@ -739,26 +903,44 @@ class TLEManager:
             str: The path to the TLE file.
         """
         if catalog_id:
-            for filename in os.listdir(self.tle_dir):
-                if catalog_id in filename:
-                    return os.path.join(self.tle_dir, filename)
+            for filename in (catalog_id + ".tle", f"{norad_id(catalog_id):05d}.tle"):
+                path = os.path.join(self.tle_dir, filename)
+                if os.path.exists(path):
+                    return path
             return None
         else:
            print("No CatalogID provided.")
            return None
 
     def tle_name_dict(self):
-        """Get the TLE directory as a dictionary with Catalog IDs as keys and the names of the satellite as values.
+        """Get the TLE catalog as a dictionary with the names of the satellites as keys and their Catalog IDs as values.
+
+        The dictionary is read from the catalog index as of its last refresh, the refresh and its diff belong to the
+        satellite combobox.
 
         Returns:
-            dict: The TLE directory as a dictionary.
+            dict: The TLE catalog as a dictionary.
         """
-        tle_dict = {}
-        for filename in os.listdir(self.tle_dir):
-            with open(os.path.join(self.tle_dir, filename), 'r') as file:
-                tle_data = file.readlines()
-                tle_dict[tle_data[0].strip()] = filename.replace(".tle", "")
-        return tle_dict
+        return self.index.name_dict()
+
+    def ingest_group(self, group: str):
+        """Download a whole Celestrak group (e.g. 'stations') into the catalog with one request and one bulk write.
+
+        Args:
+            group (str): The GROUP query of the family, see satellite_families.json.
+
+        Returns:
+            int: The number of element sets written, 0 if the download failed.
+        """
+        try:
+            return self.ingestor.ingest_group(group)
+        except OSError as e:
+            print("Error occurred while downloading group " + group + ":", str(e))
+            return 0
+
+    def tle_lines(self, catalog_id: str):
+        """Get [name, line1, line2] for a Catalog ID from the catalog, or None if it is not stored."""
+        return self.catalog.lines(catalog_id)
 
     def open_tle_file(self, path: str):
         """Open a TLE file and return the data.
@@ -781,48 +963,65 @@ class TLEManager:
             return None
 
     def download_tle(self, catalog_id: str):
-        """Download TLE data from Celestrak for a given Catalog ID.
+        """Download TLE data from Celestrak for a given Catalog ID into the catalog.
 
         Args:
             catalog_id (str): The Catalog ID of the satellite.
 
-        Raises:
-            FileNotFoundError: If the TLE file is not found after downloading.
-            ValueError: If no TLE data is found for the Catalog ID.
-            ValueError: If no satellite is found in the Celestrak database for the Catalog ID.
-
         Returns:
-            list: The TLE data as a list of strings for each line.
+            list: [name, line1, line2] of the stored element set, or None if Celestrak has no data for the Catalog ID.
         """
         if not catalog_id:
             return None
-        import urllib.request
-
-        async def download_tle_data(catalog_id: str):
-            url = "https://celestrak.org/NORAD/elements/gp.php?CATNR=" + catalog_id + "&FORMAT=TLE"
-            try:
-                socket.setdefaulttimeout(8)
-                response = await asyncio.get_event_loop().run_in_executor(None, urllib.request.urlopen, url)
-                data = await asyncio.get_event_loop().run_in_executor(None, response.read)
-                with open(os.path.join("src/data/tle_data", catalog_id + ".tle"), 'wb') as file:
-                    file.write(data)
-            except Exception as e:
-                print("Error occurred while loading TLE file:", str(e))
-
-        asyncio.run(download_tle_data(catalog_id))
-        path = self.path_from_ID(catalog_id)
-        if path:
-            tle_data = self.open_tle_file(path)
-            if not tle_data:
-                print("No TLE data found for catalog_id: " + catalog_id, "in path: " + path)
-                return None
-            else:
-                if "No GP data found" in tle_data:
-                    os.remove(path)
-                    print("No satellite found in Celestrak database for catalog_id: " + catalog_id)
-                    return None
-                else:
-                    return tle_data
+        result = self.downloader.download_all([catalog_id])[f"{norad_id(catalog_id):05d}"]
+        if result.status == FAILED:
+            print("Error occurred while downloading TLE data for catalog_id " + catalog_id + ":", result.error)
+        elif result.status == MISSING:
+            print("No satellite found in Celestrak database for catalog_id: " + catalog_id)
+        return self.catalog.lines(catalog_id)
+
+    def download_tles(self, catalog_ids: list):
+        """Download many Catalog IDs concurrently into the catalog, each written as soon as it arrives.
+
+        Args:
+            catalog_ids (list): The Catalog IDs to refresh.
+
+        Returns:
+            dict: Catalog ID -> DownloadResult.
+        """
+        results = self.downloader.download_all(catalog_ids)
+        failed = [key for key, result in results.items() if result.status == FAILED]
+        if failed:
+            print(f"Failed to download TLE data for {len(failed)} of {len(results)} catalog_ids: " + ", ".join(failed))
+        return results
+
+    def getStore(self, catalog_ids: list = None):
+        """Load many satellites as lightweight SatelliteRecords sharing one array of element sets.
+
+        Each satellite costs one row of orbital elements and its name, its Satellite object is built on first use.
+
+        Args:
+            catalog_ids (list, optional): The Catalog IDs of the satellites. Defaults to None, the whole catalog.
+
+        Returns:
+            SatelliteStore: The store of every Catalog ID that is in the catalog.
+        """
+        records = self.catalog.records(catalog_ids)
+        if catalog_ids is not None and len(records) < len(catalog_ids):
+            print(f"No local TLE data for {len(catalog_ids) - len(records)} catalog_ids, skipping them.")
+        return SatelliteStore.from_catalog_records(records, factory=Satellite.from_record, timescale=self.controller.Timescale.ts)
+
+    def getConstellation(self, catalog_ids: list, dtype=np.float64):
+        """Pack the local TLE data for many Catalog IDs into one ConstellationPropagator without building Satellite objects.
+
+        Args:
+            catalog_ids (list): The Catalog IDs of the satellites.
+            dtype (np.dtype, optional): Output dtype of the propagated arrays, float64 or float32. Defaults to float64.
+
+        Returns:
+            ConstellationPropagator: The propagator for every Catalog ID that has a local TLE file.
+        """
+        return self.getStore(catalog_ids).constellation(dtype=dtype)
 
     def getSatellite(self, catalog_id: str):
         """Get a Satellite object for a given Catalog ID.
@@ -842,23 +1041,20 @@ class TLEManager:
             print("No catalog_id provided.")
             return None
 
-        path = self.path_from_ID(catalog_id)
-        if not path:
-            print("No existing TLE file found for catalog_id " + catalog_id, "downloading new TLE file from Celestrak database.")
+        tle_data = self.tle_lines(catalog_id)
+        if not tle_data:
+            print("No existing TLE data found for catalog_id " + catalog_id, "downloading new TLE file from Celestrak database.")
             tle_data = self.download_tle(catalog_id)
-            path = self.path_from_ID(catalog_id)
-        else:
-            tle_data = self.open_tle_file(path)
 
         if not tle_data == None:
-            satellite = Satellite(self.controller, catalog_id, tle_data[1], tle_data[2], name=tle_data[0].strip())
+            satellite = Satellite(catalog_id, tle_data[1], tle_data[2], name=tle_data[0].strip(), ts=self.controller.Timescale.ts)
             if not satellite:
                 print("Failed to build Satellite object for catalog_id: " + catalog_id, "with TLE data: " + tle_data)
                 return None
-            if not satellite.epoch_valid_at(datetime.datetime.now(), margin=14):
-                print("Epoch is invalid for satellite with catalog ID: " + catalog_id, "within a margin of " + str(14), "days. Requesting fresh TLE data.")
-                tle_data = self.download_tle(catalog_id)
-                satellite = Satellite(self.controller, catalog_id, tle_data[1], tle_data[2], name=tle_data[0].strip())
+            if not satellite.epoch_valid_at(datetime.datetime.now(), margin=self.scheduler.margin):
+                # the stale element set is used until the scheduler's refresh event brings the fresh one
+                print("Epoch is invalid for satellite with catalog ID: " + catalog_id, "within a margin of " + str(self.scheduler.margin), "days. Requesting fresh TLE data.")
+                self.scheduler.request([catalog_id])
             return satellite
         else:
             print("Failed to build Satellite object for catalog_id: " + catalog_id, "because the TLE data returned None.")
@@ -0,0 +1,263 @@
+'''
+The archive service keeps every element set ever seen for an object, so times far from the current epoch can still be
+propagated with the element set that was valid then.
+
+Each NORAD catalog number has two append-only files in the archive directory:
+
+    * <id>.tlez holds the element sets, each as its own raw deflate stream of 'name\\nline1\\nline2'. Every set after
+      the first is compressed against the first one as a preset dictionary, so the columns that never change for an
+      object cost almost nothing, and any single set can still be read on its own.
+    * <id>.idx is the epoch index, a packed array of (epoch as UTC Julian date, offset, length) sorted by epoch. Lookups
+      memory-map it and binary search the epoch column, so they read a few pages whatever the length of the history.
+
+A set that is newer than everything archived is appended to both files. An older one (a backfill) is still appended to
+the data file, and the index is rewritten in order through a temporary file. Sets whose epoch is already archived are
+skipped, so the same download can be offered any number of times.
+
+Between two archived epochs the set with the nearest epoch is used, so propagation over a long window switches sets at
+the midpoints between consecutive epochs.
+'''
+
+import os
+import threading
+import zlib
+
+import numpy as np
+from sgp4.api import Satrec
+from skyfield.constants import DAY_S
+
+from .catalog_service import norad_id
+from .propagation_service import TEME_to_GCRS, propagate_TEME, to_time
+from .satellite_store import utc_jd
+
+INDEX_DTYPE = np.dtype([("epoch", "<f8"), ("offset", "<u8"), ("length", "<u4")])
+
+# archive directory -> the write lock of every TLEArchive opened on it in this process
+_directory_locks = {}
+_directory_locks_lock = threading.Lock()
+
+
+def directory_lock(directory: str):
+    """Return the write lock shared by every archive on a directory, so two archives never interleave their writes."""
+    key = os.path.realpath(directory)
+    with _directory_locks_lock:
+        return _directory_locks.setdefault(key, threading.Lock())
+
+
+def as_jd(time):
+    """Return a UTC Julian date for a Julian date, a datetime or a Time."""
+    if isinstance(time, (int, float, np.floating)):
+        return float(time)
+    return utc_jd(time)
+
+
+def segment_of(epochs, jd):
+    """Return the position of the nearest epoch for every Julian date, i.e. which set is used between two epochs.
+
+    Args:
+        epochs (np.ndarray): Sorted epochs, shape (M,), M > 0.
+        jd (float | np.ndarray): Julian dates.
+    """
+    midpoints = (epochs[:-1] + epochs[1:]) / 2
+    return np.searchsorted(midpoints, jd, side="right")
+
+
+class TLEArchive:
+    """Append-only, compressed history of element sets per NORAD catalog number.
+
+    The archive is shared between threads, writes are serialized with a lock. The lock belongs to the directory, so
+    archives opened separately on the same directory, e.g. by the application and the tracker service, share it too.
+
+    Args:
+        directory (str, optional): The archive directory. Defaults to src/data/tle_archive.
+    """
+    def __init__(self, directory: str = "src/data/tle_archive"):
+        self.directory = directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.lock = directory_lock(directory)
+        self.indexes = {} # catalog number -> memory-mapped index, reopened when the file changes
+        self.dictionaries = {} # catalog number -> first archived set, the preset dictionary of the others
+
+    def __contains__(self, catalog_id):
+        return len(self.index(catalog_id)) > 0
+
+    def __len__(self):
+        return sum(1 for filename in os.listdir(self.directory) if filename.endswith(".idx"))
+
+    def path(self, catalog_id, extension: str):
+        return os.path.join(self.directory, f"{norad_id(catalog_id):05d}{extension}")
+
+    def index(self, catalog_id):
+        """Return the memory-mapped (epoch, offset, length) index of a catalog number, empty if nothing is archived."""
+        key = norad_id(catalog_id)
+        path = self.path(key, ".idx")
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        cached = self.indexes.get(key)
+        if cached is not None and cached[0] == size:
+            return cached[1]
+        index = np.memmap(path, dtype=INDEX_DTYPE, mode="r") if size else np.empty(0, dtype=INDEX_DTYPE)
+        self.indexes[key] = (size, index)
+        return index
+
+    def epochs(self, catalog_id):
+        """Return the archived epochs of a catalog number as sorted UTC Julian dates."""
+        return self.index(catalog_id)["epoch"]
+
+    def dictionary(self, catalog_id):
+        key = norad_id(catalog_id)
+        dictionary = self.dictionaries.get(key)
+        if dictionary is None:
+            entry = self.index(key)
+            entry = entry[entry["offset"] == 0]
+            if not len(entry):
+                return None
+            with open(self.path(key, ".tlez"), "rb") as file:
+                dictionary = self.decompress(file.read(int(entry["length"][0])))
+            self.dictionaries[key] = dictionary
+        return dictionary
+
+    @staticmethod
+    def compress(data: bytes, dictionary: bytes = None):
+        if dictionary is None:
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        else:
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=dictionary)
+        return compressor.compress(data) + compressor.flush()
+
+    @staticmethod
+    def decompress(data: bytes, dictionary: bytes = None):
+        if dictionary is None:
+            return zlib.decompressobj(-15).decompress(data)
+        return zlib.decompressobj(-15, zdict=dictionary).decompress(data)
+
+    def append(self, name: str, line1: str, line2: str, epoch: float):
+        """Archive one element set. Returns False if a set with the same epoch is already archived."""
+        return self.append_rows([(norad_id(line1[2:7]), name, epoch, line1, line2)]) == 1
+
+    def append_rows(self, rows):
+        """Archive many element sets, e.g. catalog record_row() rows or TLERecords, grouped into one write per object.
+
+        Args:
+            rows (iterable): Rows starting with (norad_id, name, epoch, line1, line2).
+
+        Returns:
+            int: The number of element sets added, sets already archived are not counted.
+        """
+        objects = {}
+        for row in rows:
+            objects.setdefault(row[0], []).append(row)
+        added = 0
+        with self.lock:
+            for key, sets in objects.items():
+                added += self.write(key, sets)
+        return added
+
+    def write(self, key: int, rows):
+        index = self.index(key)
+        epochs = index["epoch"]
+        new = {}
+        for _, name, epoch, line1, line2, *_ in rows:
+            i = np.searchsorted(epochs, epoch)
+            if (i < len(epochs) and epochs[i] == epoch) or epoch in new:
+                continue
+            new[epoch] = f"{name.strip()}\n{line1.strip()}\n{line2.strip()}".encode()
+        if not new:
+            return 0
+
+        entries = np.empty(len(new), dtype=INDEX_DTYPE)
+        data_path = self.path(key, ".tlez")
+        with open(data_path, "ab" if len(epochs) else "wb") as file: # drop bytes a crash left without an index
+            offset = file.tell()
+            for entry, epoch in zip(entries, sorted(new)):
+                dictionary = self.dictionary(key) if offset else None # the first set of an object is the dictionary
+                blob = self.compress(new[epoch], dictionary)
+                file.write(blob)
+                entry["epoch"], entry["offset"], entry["length"] = epoch, offset, len(blob)
+                if not offset:
+                    self.dictionaries[key] = new[epoch]
+                offset += len(blob)
+
+        index_path = self.path(key, ".idx")
+        self.indexes.pop(key, None) # release the mapping before the file changes
+        if not len(epochs) or entries["epoch"][0] > epochs[-1]:
+            with open(index_path, "ab") as file:
+                file.write(entries.tobytes())
+        else: # a backfill, keep the index sorted
+            merged = np.concatenate([np.array(index), entries])
+            merged = merged[np.argsort(merged["epoch"], kind="stable")]
+            del index, epochs
+            temporary = index_path + ".tmp"
+            with open(temporary, "wb") as file:
+                file.write(merged.tobytes())
+            os.replace(temporary, index_path)
+        return len(new)
+
+    def read(self, catalog_id, positions):
+        """Return the (name, line1, line2) element sets at positions of the index of a catalog number."""
+        key = norad_id(catalog_id)
+        index = self.index(key)
+        dictionary = self.dictionary(key)
+        sets = []
+        with open(self.path(key, ".tlez"), "rb") as file:
+            for position in np.atleast_1d(positions).tolist():
+                offset, length = int(index["offset"][position]), int(index["length"][position])
+                file.seek(offset)
+                text = self.decompress(file.read(length), dictionary if offset else None)
+                sets.append(tuple(text.decode().split("\n")))
+        return sets
+
+    def nearest(self, catalog_id, time):
+        """Return the (name, line1, line2) element set whose epoch is nearest to a time, or None if nothing is archived.
+
+        Args:
+            catalog_id (str): The Catalog ID of the satellite.
+            time (float | datetime | Time): The time, a UTC Julian date, a datetime or a Skyfield Time.
+        """
+        epochs = self.epochs(catalog_id)
+        if not len(epochs):
+            return None
+        return self.read(catalog_id, segment_of(epochs, as_jd(time)))[0]
+
+    def between(self, catalog_id, start, end):
+        """Return every element set used between two times, i.e. the nearest sets at start and end and all in between.
+
+        Returns:
+            tuple: (epochs as UTC Julian dates, list of (name, line1, line2)), in epoch order.
+        """
+        epochs = self.epochs(catalog_id)
+        if not len(epochs):
+            return np.empty(0), []
+        first, last = sorted(segment_of(epochs, [as_jd(start), as_jd(end)]).tolist())
+        return np.array(epochs[first:last + 1]), self.read(catalog_id, np.arange(first, last + 1))
+
+    def propagate(self, catalog_id, times, ts):
+        """Propagate over a time span of any length, each time with the archived set of the nearest epoch.
+
+        Args:
+            catalog_id (str): The Catalog ID of the satellite.
+            times (Time | np.ndarray): A Skyfield Time array, or an array of Terrestrial Time Julian dates.
+            ts (Timescale): The timescale of Julian date arrays.
+
+        Returns:
+            tuple: (positions (N,3) km, velocities (N,3) km/s, error codes (N,)) in the GCRS frame, like
+                propagation_service.propagate(), or None if nothing is archived.
+        """
+        epochs = self.epochs(catalog_id)
+        if not len(epochs):
+            return None
+        time = to_time(times, ts)
+        jd = np.atleast_1d(time.whole)
+        fr = np.atleast_1d(time.tai_fraction - time._leap_seconds() / DAY_S)
+        segments = segment_of(epochs, jd + fr)
+
+        positions = np.empty((len(jd), 3))
+        velocities = np.empty((len(jd), 3))
+        errors = np.empty(len(jd), dtype=np.uint8)
+        used = np.unique(segments)
+        for segment, (name, line1, line2) in zip(used.tolist(), self.read(catalog_id, used)):
+            mask = segments == segment
+            satrec = Satrec.twoline2rv(line1, line2)
+            positions[mask], velocities[mask], errors[mask] = propagate_TEME(satrec, jd[mask], fr[mask])
+        positions, velocities = TEME_to_GCRS(positions, velocities, time)
+        return positions, velocities, errors
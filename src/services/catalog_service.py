@@ -0,0 +1,460 @@
+'''
+The catalog service keeps every known element set in a single SQLite database keyed by NORAD catalog number.
+
+Lookups by catalog number go through the integer primary key, so they cost the same with a hundred objects or with the whole
+public catalog, and ranges of catalog numbers are read with one indexed scan. Each record keeps the satellite name, the TLE
+epoch as a UTC Julian date, both element lines, where the set came from and when it was fetched. A newer element set
+replaces an older one for the same object, and an older one never overwrites a newer one.
+
+The legacy directory of one .tle file per object can be imported in one transaction with import_directory(), and whole
+download groups are written with write_group(), which also records which groups each object belongs to. With an archive,
+every element set written is also kept in its history, including the ones older than the stored set.
+
+Triggers keep a change log of one row per object with the sequence number of its latest insert, update or delete, so
+readers such as CatalogIndex can fetch only what changed since they last looked.
+'''
+
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from sgp4.alpha5 import from_alpha5
+from sgp4.functions import jday
+
+TLERecord = namedtuple("TLERecord", ["norad_id", "name", "epoch", "line1", "line2", "source", "fetched"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tle (
+    norad_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    epoch REAL NOT NULL,
+    line1 TEXT NOT NULL,
+    line2 TEXT NOT NULL,
+    source TEXT,
+    fetched REAL
+);
+CREATE INDEX IF NOT EXISTS tle_name ON tle (name);
+CREATE INDEX IF NOT EXISTS tle_epoch ON tle (epoch);
+CREATE TABLE IF NOT EXISTS groups (
+    group_name TEXT PRIMARY KEY,
+    fetched REAL,
+    count INTEGER
+);
+CREATE TABLE IF NOT EXISTS membership (
+    group_name TEXT NOT NULL,
+    norad_id INTEGER NOT NULL,
+    PRIMARY KEY (group_name, norad_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS membership_norad_id ON membership (norad_id);
+CREATE TABLE IF NOT EXISTS http_cache (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT
+);
+CREATE TABLE IF NOT EXISTS changes (
+    norad_id INTEGER PRIMARY KEY,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_seq ON changes (seq);
+CREATE TRIGGER IF NOT EXISTS tle_inserted AFTER INSERT ON tle BEGIN
+    INSERT INTO changes VALUES (NEW.norad_id, (SELECT IFNULL(MAX(seq), 0) + 1 FROM changes))
+        ON CONFLICT (norad_id) DO UPDATE SET seq = excluded.seq;
+END;
+CREATE TRIGGER IF NOT EXISTS tle_updated AFTER UPDATE ON tle BEGIN
+    INSERT INTO changes VALUES (NEW.norad_id, (SELECT IFNULL(MAX(seq), 0) + 1 FROM changes))
+        ON CONFLICT (norad_id) DO UPDATE SET seq = excluded.seq;
+END;
+CREATE TRIGGER IF NOT EXISTS tle_deleted AFTER DELETE ON tle BEGIN
+    INSERT INTO changes VALUES (OLD.norad_id, (SELECT IFNULL(MAX(seq), 0) + 1 FROM changes))
+        ON CONFLICT (norad_id) DO UPDATE SET seq = excluded.seq;
+END;
+"""
+
+UPSERT = """
+INSERT INTO tle (norad_id, name, epoch, line1, line2, source, fetched) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (norad_id) DO UPDATE SET
+    name = excluded.name, epoch = excluded.epoch, line1 = excluded.line1, line2 = excluded.line2,
+    source = excluded.source, fetched = excluded.fetched
+WHERE excluded.epoch >= tle.epoch
+"""
+
+
+def norad_id(catalog_id):
+    """Normalize a catalog number given as '00544', '544', 544 or in Alpha-5 as 'A0001' to the integer key, so zero padding never matters."""
+    if isinstance(catalog_id, (int, np.integer)):
+        return int(catalog_id)
+    return from_alpha5(str(catalog_id).strip())
+
+
+def tle_epoch(line1: str):
+    """Return the epoch of a TLE as a UTC Julian date, read straight from the fixed-width columns of line 1."""
+    year = int(line1[18:20])
+    year += 2000 if year < 57 else 1900
+    day = float(line1[20:32])
+    whole, fraction = jday(year, 1, 1, 0, 0, 0)
+    return whole + fraction + day - 1
+
+
+def record_row(name: str, line1: str, line2: str, source: str, fetched: float):
+    """Build the database row of one element set."""
+    return (norad_id(line1[2:7]), name.strip(), tle_epoch(line1), line1.strip(), line2.strip(), source, fetched)
+
+
+def parse_tle_lines(lines):
+    """Yield (name, line1, line2) for every element set in an iterable of 2 or 3 line TLE lines, e.g. a streamed response.
+
+    A line is a name unless it is a line 1 directly followed by a line 2.
+    """
+    name = previous = None
+    for line in lines:
+        line = line.rstrip()
+        if not line.strip():
+            continue
+        if previous is not None and previous.startswith("1 ") and line.startswith("2 "):
+            yield (name or previous[2:7].strip()), previous, line
+            name = previous = None
+            continue
+        if previous is not None:
+            name = previous.strip()
+        previous = line
+
+
+def parse_tle_text(text: str):
+    """Yield (name, line1, line2) for every element set in a 2 or 3 line TLE text."""
+    return parse_tle_lines(text.splitlines())
+
+
+class TLECatalog:
+    """SQLite store of the latest element set per NORAD catalog number.
+
+    Every thread gets its own connection, so a read never sees the uncommitted rows of a write in progress on another
+    thread, and with WAL it is not blocked by it either. Writes are serialized with a lock.
+
+    Args:
+        path (str, optional): The database file. Defaults to src/data/tle_catalog.sqlite.
+        archive (TLEArchive, optional): Keeps the history of every element set written. Defaults to None, no history.
+    """
+    def __init__(self, path: str = "src/data/tle_catalog.sqlite", archive=None):
+        self.path = path
+        self.archive = archive
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.lock = threading.Lock()
+        self.local = threading.local() # the connection of each thread
+        self.connections = [] # every connection opened, closed by close()
+        self.connections_lock = threading.Lock() # not self.lock, a thread may open its connection while writing
+        self.connection.execute("PRAGMA journal_mode=WAL") # readers are not blocked while a bulk import is written
+        self.connection.executescript(SCHEMA)
+
+    @property
+    def connection(self):
+        """The connection of the calling thread, opened on first use."""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.local.connection = connection
+            with self.connections_lock:
+                self.connections.append(connection)
+        return connection
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM tle").fetchone()[0]
+
+    def __contains__(self, catalog_id):
+        return self.connection.execute("SELECT 1 FROM tle WHERE norad_id = ?", (norad_id(catalog_id),)).fetchone() is not None
+
+    def close(self):
+        with self.connections_lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections.clear()
+        self.local = threading.local()
+
+    def put(self, name: str, line1: str, line2: str, source: str = None, fetched: float = None):
+        """Store one element set, keeping whichever of the stored and the new set has the later epoch."""
+        self.put_many([(name, line1, line2)], source, fetched)
+
+    def put_many(self, element_sets, source: str = None, fetched: float = None):
+        """Store many (name, line1, line2) element sets in one transaction.
+
+        Args:
+            element_sets (iterable): The (name, line1, line2) tuples, e.g. from parse_tle_text().
+            source (str, optional): Where the sets came from, e.g. a URL or a file name. Defaults to None.
+            fetched (float, optional): Unix time of the download. Defaults to now.
+
+        Returns:
+            int: The number of element sets offered to the store.
+        """
+        fetched = time.time() if fetched is None else fetched
+        return self.write([record_row(name, line1, line2, source, fetched) for name, line1, line2 in element_sets])
+
+    def write(self, rows):
+        """Upsert prepared record_row() rows in one transaction and return how many were offered."""
+        with self.lock, self.connection:
+            self.connection.executemany(UPSERT, rows)
+        if self.archive is not None:
+            self.archive.append_rows(rows)
+        return len(rows)
+
+    def write_group(self, group: str, rows, fetched: float = None):
+        """Upsert the rows of a whole group in one transaction and make them the group's members.
+
+        The rows can be a generator, e.g. one parsing a download as it streams in, they are consumed inside the transaction.
+        If reading them fails, nothing is written and the previous members of the group are kept.
+
+        Args:
+            group (str): The group name, e.g. the Celestrak GROUP query 'stations'.
+            rows (iterable): record_row() rows.
+            fetched (float, optional): Unix time of the download. Defaults to now.
+
+        Returns:
+            int: The number of element sets written.
+        """
+        fetched = time.time() if fetched is None else fetched
+        members = []
+        archived = []
+
+        def collect(rows):
+            for row in rows:
+                members.append(row[0])
+                if self.archive is not None:
+                    archived.append(row)
+                yield row
+
+        with self.lock, self.connection:
+            self.connection.executemany(UPSERT, collect(rows))
+            self.connection.execute("DELETE FROM membership WHERE group_name = ?", (group,))
+            self.connection.executemany("INSERT OR IGNORE INTO membership VALUES (?, ?)", [(group, key) for key in members])
+            self.connection.execute("INSERT OR REPLACE INTO groups VALUES (?, ?, ?)", (group, fetched, len(set(members))))
+        if archived:
+            self.archive.append_rows(archived)
+        return len(members)
+
+    def groups(self):
+        """Return {group: (fetched, count)} for every group ingested so far."""
+        rows = self.connection.execute("SELECT group_name, fetched, count FROM groups ORDER BY group_name")
+        return {group: (fetched, count) for group, fetched, count in rows}
+
+    def group_members(self, group: str):
+        """Return the catalog numbers of a group, in catalog order."""
+        rows = self.connection.execute("SELECT norad_id FROM membership WHERE group_name = ? ORDER BY norad_id", (group,))
+        return [key for (key,) in rows]
+
+    def groups_of(self, catalog_id):
+        """Return the names of the groups a catalog number belongs to."""
+        rows = self.connection.execute("SELECT group_name FROM membership WHERE norad_id = ? ORDER BY group_name", (norad_id(catalog_id),))
+        return [group for (group,) in rows]
+
+    def get(self, catalog_id):
+        """Return the TLERecord for a catalog number, or None if it is not in the catalog."""
+        row = self.connection.execute("SELECT * FROM tle WHERE norad_id = ?", (norad_id(catalog_id),)).fetchone()
+        return TLERecord(*row) if row else None
+
+    def lines(self, catalog_id):
+        """Return [name, line1, line2] for a catalog number, in the layout of a .tle file, or None."""
+        record = self.get(catalog_id)
+        return [record.name, record.line1, record.line2] if record else None
+
+    def range(self, first, last):
+        """Return the TLERecords with catalog numbers first..last (inclusive), in catalog order."""
+        rows = self.connection.execute(
+            "SELECT * FROM tle WHERE norad_id BETWEEN ? AND ? ORDER BY norad_id", (norad_id(first), norad_id(last))
+        )
+        return [TLERecord(*row) for row in rows]
+
+    def records(self, catalog_ids=None):
+        """Return the TLERecords of the given catalog numbers, or of the whole catalog, in catalog order."""
+        if catalog_ids is None:
+            rows = self.connection.execute("SELECT * FROM tle ORDER BY norad_id")
+            return [TLERecord(*row) for row in rows]
+        keys = sorted({norad_id(catalog_id) for catalog_id in catalog_ids})
+        records = []
+        for first in range(0, len(keys), 500): # stay below SQLite's limit on bound parameters
+            chunk = keys[first:first + 500]
+            rows = self.connection.execute(
+                f"SELECT * FROM tle WHERE norad_id IN ({','.join('?' * len(chunk))}) ORDER BY norad_id", chunk
+            )
+            records.extend(TLERecord(*row) for row in rows)
+        return records
+
+    def names(self):
+        """Return a dictionary of satellite names to zero padded catalog numbers, e.g. {'ISS (ZARYA)': '25544'}."""
+        rows = self.connection.execute("SELECT name, norad_id FROM tle ORDER BY norad_id")
+        return {name: f"{key:05d}" for name, key in rows}
+
+    def validators(self, url: str):
+        """Return the (ETag, Last-Modified) of the last download of a URL, for conditional requests, or (None, None)."""
+        row = self.connection.execute("SELECT etag, last_modified FROM http_cache WHERE url = ?", (url,)).fetchone()
+        return row if row else (None, None)
+
+    def set_validators(self, url: str, etag: str, last_modified: str):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO http_cache VALUES (?, ?, ?)", (url, etag, last_modified))
+
+    def remove(self, catalog_id):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM tle WHERE norad_id = ?", (norad_id(catalog_id),))
+            self.connection.execute("DELETE FROM membership WHERE norad_id = ?", (norad_id(catalog_id),))
+
+    def import_directory(self, tle_dir: str, since: float = None):
+        """Import every .tle file of a legacy per-object directory in one transaction.
+
+        Files that hold the same object under different names (e.g. 0544.tle and 00544.tle) collapse into one record with
+        the latest epoch. Files without any element set, such as saved 'No GP data found' responses, are skipped.
+
+        Args:
+            tle_dir (str): The directory of .tle files.
+            since (float, optional): Only import files modified after this Unix time. Defaults to None, every file.
+
+        Returns:
+            int: The number of element sets read.
+        """
+        rows = []
+        for entry in sorted(os.scandir(tle_dir), key=lambda entry: entry.name):
+            if not entry.name.endswith(".tle"):
+                continue
+            fetched = entry.stat().st_mtime
+            if since is not None and fetched <= since:
+                continue
+            with open(entry.path, 'r') as file:
+                text = file.read()
+            rows.extend(record_row(name, line1, line2, "file:" + entry.name, fetched) for name, line1, line2 in parse_tle_text(text))
+        if not rows:
+            return 0
+        return self.write(rows)
+
+    def change_seq(self):
+        """Return the sequence number of the latest change to the tle table, 0 if nothing changed yet."""
+        return self.connection.execute("SELECT IFNULL(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def changes(self, since: int):
+        """Return (catalog number, sequence number, name, epoch) for every object changed after a sequence number.
+
+        Every object is listed once, with its latest change. The name and epoch are None for removed objects.
+        """
+        return self.connection.execute(
+            "SELECT changes.norad_id, seq, name, epoch FROM changes LEFT JOIN tle USING (norad_id) WHERE seq > ? ORDER BY seq",
+            (since,),
+        ).fetchall()
+
+    def version(self):
+        """Return a value that changes whenever this or any other connection has written to the catalog."""
+        return self.connection.total_changes, self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+
+class CatalogIndex:
+    """Resident name <-> catalog number and epoch index of a TLECatalog, for the satellite selection UI.
+
+    The index is built once, then updated in place from the catalog's change log: a refresh reads only the objects
+    changed since the previous one, so a one-row update costs one row. Files of the legacy TLE directory modified since
+    the last scan are imported first. Each refresh returns the difference to the previous state so views only touch the
+    rows that changed.
+    """
+    def __init__(self, catalog: TLECatalog, tle_dir: str = None):
+        self.catalog = catalog
+        self.tle_dir = tle_dir
+        self.names = {} # catalog number -> name
+        self.ids = {} # name -> catalog number, for selection by name, the highest catalog number of a shared name
+        self.keys = {} # name -> catalog numbers with that name
+        self.epochs = {} # catalog number -> UTC Julian date
+        self.catalog_version = None
+        self.seq = 0 # the last change of the catalog's change log applied to the index
+        latest = catalog.connection.execute("SELECT MAX(fetched) FROM tle WHERE source LIKE 'file:%'").fetchone()[0]
+        self.scanned = latest or 0.0 # files modified up to this Unix time are already in the catalog
+        self.load()
+        self.refresh()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, catalog_id):
+        return norad_id(catalog_id) in self.names
+
+    def id_of(self, name: str):
+        """Return the catalog number of a satellite name, or None."""
+        return self.ids.get(name)
+
+    def name_of(self, catalog_id):
+        """Return the name of a catalog number, or None."""
+        return self.names.get(norad_id(catalog_id))
+
+    def name_dict(self):
+        """Return {name: zero padded catalog number}, the layout of TLEManager.tle_name_dict()."""
+        return {name: f"{key:05d}" for name, key in self.ids.items()}
+
+    def members(self, catalog_ids):
+        """Return [(catalog number, name)] for the catalog numbers of a category that are in the catalog, in the given order."""
+        keys = (norad_id(catalog_id) for catalog_id in catalog_ids)
+        return [(key, self.names[key]) for key in keys if key in self.names]
+
+    def scan_directory(self):
+        """Import the .tle files modified since the last scan.
+
+        Every file's own modification time is checked, not the directory's, which does not move when a file is
+        overwritten in place.
+        """
+        if self.tle_dir is None or not os.path.exists(self.tle_dir):
+            return 0
+        started = time.time()
+        count = self.catalog.import_directory(self.tle_dir, since=self.scanned)
+        self.scanned = started
+        return count
+
+    def load(self):
+        """Read the whole catalog once, the starting point of the change log."""
+        self.seq = self.catalog.change_seq() # read first, a change made while loading is applied again by refresh()
+        for key, name, epoch in self.catalog.connection.execute("SELECT norad_id, name, epoch FROM tle ORDER BY norad_id"):
+            self.set(key, name, epoch)
+
+    def set(self, key: int, name: str, epoch: float):
+        self.discard(key)
+        self.names[key] = name
+        self.epochs[key] = epoch
+        self.keys.setdefault(name, set()).add(key)
+        self.ids[name] = max(self.keys[name])
+
+    def discard(self, key: int):
+        name = self.names.pop(key, None)
+        self.epochs.pop(key, None)
+        if name is None:
+            return
+        keys = self.keys[name]
+        keys.discard(key)
+        if keys:
+            self.ids[name] = max(keys)
+        else:
+            del self.keys[name], self.ids[name]
+
+    def refresh(self):
+        """Bring the index up to date.
+
+        Returns:
+            tuple: (added, removed, renamed) where added maps new catalog numbers to names, removed maps dropped catalog
+            numbers to their old names and renamed maps catalog numbers to (old name, new name). All three are empty
+            when nothing changed.
+        """
+        self.scan_directory()
+        version = self.catalog.version()
+        if version == self.catalog_version:
+            return {}, {}, {}
+        self.catalog_version = version
+
+        added, removed, renamed = {}, {}, {}
+        for key, seq, name, epoch in self.catalog.changes(self.seq):
+            self.seq = max(self.seq, seq)
+            old = self.names.get(key)
+            if name is None:
+                if old is not None:
+                    removed[key] = old
+                    self.discard(key)
+                continue
+            if old is None:
+                added[key] = name
+            elif old != name:
+                renamed[key] = (old, name)
+            self.set(key, name, epoch)
+        return added, removed, renamed
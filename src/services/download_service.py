@@ -0,0 +1,173 @@
+'''
+The download service fetches the element sets of many catalog numbers from Celestrak concurrently, over one persistent
+HTTP session, and streams each finished download into the TLE catalog as it arrives.
+
+    * The session keeps its connections alive in a pool sized to the number of requests allowed in flight, so N downloads
+      cost about N / max_in_flight round trips and no TLS handshakes after the first ones.
+    * Every request is conditional. The ETag and Last-Modified validators of each URL are kept in the catalog, and a
+      304 Not Modified answer costs no parsing and no writing.
+    * Rate limiting (429) and overload (503) answers pause every worker, for the server's Retry-After or an exponential
+      backoff with jitter, and the request is retried.
+    * Timeouts are per request, nothing touches the process-wide socket timeout.
+'''
+
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .catalog_service import TLECatalog, norad_id, parse_tle_text, record_row
+from .ingest_service import GP_URL
+
+# outcomes of a download
+UPDATED, NOT_MODIFIED, MISSING, FAILED = "updated", "not modified", "missing", "failed"
+
+DownloadResult = namedtuple("DownloadResult", ["catalog_id", "status", "count", "error"])
+
+RETRY_STATUS = (429, 503)
+
+
+def retry_after(value):
+    """Return the seconds to wait from a Retry-After header, given either as seconds or as an HTTP date, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TLEDownloader:
+    """Concurrent, conditional downloads of single catalog numbers into a TLECatalog.
+
+    Args:
+        catalog (TLECatalog): The catalog the results are written to, it also keeps the HTTP validators.
+        base_url (str, optional): The GP endpoint. Defaults to Celestrak.
+        max_in_flight (int, optional): Requests allowed at the same time, also the size of the connection pool. Defaults to 8.
+        timeout (tuple, optional): (connect, read) timeout of each request in seconds. Defaults to (5, 20).
+        max_retries (int, optional): Retries of a rate limited or failed request. Defaults to 4.
+        backoff (float, optional): First backoff in seconds, doubled on every retry. Defaults to 1.
+    """
+    def __init__(self, catalog: TLECatalog, base_url: str = GP_URL, max_in_flight: int = 8, timeout=(5, 20),
+                 max_retries: int = 4, backoff: float = 1.0):
+        self.catalog = catalog
+        self.base_url = base_url
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = "space-map"
+
+        self.executor = ThreadPoolExecutor(max_in_flight, thread_name_prefix="tle-download")
+        self.lock = threading.Lock()
+        self.paused_until = 0.0 # shared by every worker, the server limits the client and not a single request
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def url(self, catalog_id):
+        return self.base_url + "?" + urlencode({"CATNR": norad_id(catalog_id), "FORMAT": "TLE"})
+
+    def pause(self, seconds: float):
+        """Hold back every worker for `seconds`."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def wait(self):
+        while True:
+            with self.lock:
+                delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def get(self, url: str, conditional: bool = True):
+        """GET a URL with the stored validators, backing off and retrying on rate limits and connection errors.
+
+        Returns:
+            requests.Response: The final response, 200 or 304 on success.
+        """
+        headers = {}
+        if conditional:
+            etag, last_modified = self.catalog.validators(url)
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        for attempt in range(self.max_retries + 1):
+            self.wait()
+            delay = self.backoff * 2 ** attempt * (1 + random.random()) # jitter keeps the workers from retrying in lockstep
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(delay)
+                continue
+            if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+                waited = retry_after(response.headers.get("Retry-After"))
+                self.pause(delay if waited is None else waited)
+                continue
+            return response
+        return response
+
+    def fetch(self, catalog_id):
+        """Download one catalog number.
+
+        Returns:
+            tuple: (DownloadResult, rows) where rows are the record_row() rows to store, empty unless it was UPDATED.
+        """
+        url = self.url(catalog_id)
+        try:
+            response = self.get(url, conditional=catalog_id in self.catalog)
+        except requests.RequestException as e:
+            return DownloadResult(catalog_id, FAILED, 0, str(e)), []
+        if response.status_code == 304:
+            return DownloadResult(catalog_id, NOT_MODIFIED, 0, None), []
+        if response.status_code != 200:
+            return DownloadResult(catalog_id, FAILED, 0, f"HTTP {response.status_code}"), []
+
+        fetched = time.time()
+        rows = [record_row(name, line1, line2, url, fetched) for name, line1, line2 in parse_tle_text(response.text)]
+        if not rows: # Celestrak answers 'No GP data found' with a 200
+            return DownloadResult(catalog_id, MISSING, 0, None), []
+        self.catalog.set_validators(url, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return DownloadResult(catalog_id, UPDATED, len(rows), None), rows
+
+    def download(self, catalog_ids):
+        """Download many catalog numbers concurrently, writing each one into the catalog as soon as it completes.
+
+        Args:
+            catalog_ids (iterable): The catalog numbers, duplicates are fetched once.
+
+        Yields:
+            DownloadResult: One result per catalog number, in completion order.
+        """
+        keys = list(dict.fromkeys(f"{norad_id(catalog_id):05d}" for catalog_id in catalog_ids))
+        futures = [self.executor.submit(self.fetch, key) for key in keys]
+        for future in as_completed(futures):
+            result, rows = future.result()
+            if rows:
+                self.catalog.write(rows) # the consumer is the only writer, the workers only download
+            yield result
+
+    def download_all(self, catalog_ids):
+        """Download many catalog numbers and return {catalog_id: DownloadResult} once all of them are done."""
+        return {result.catalog_id: result for result in self.download(catalog_ids)}
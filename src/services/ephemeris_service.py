@@ -0,0 +1,225 @@
+'''
+The ephemeris service streams long ephemerides in fixed-size chunks and keeps a coarse, sliding table of SGP4 states for every tracked satellite so that per-frame positions can be
+interpolated instead of propagated.
+
+Each satellite is propagated once per grid step (60 s by default) with the batch propagator, and positions in between are
+recovered with cubic Hermite interpolation from the tabulated positions and velocities. For a circular orbit the interpolation
+error is bounded by r * (n * h)^4 / 384, which at a 60 s step is well under a metre for LEO and negligible for higher orbits.
+'''
+
+from collections import namedtuple
+from math import ceil, sqrt
+
+import numpy as np
+from skyfield.api import Time, wgs84
+from skyfield.constants import DAY_S
+
+from .propagation_service import propagate, to_geocentric
+
+GM_EARTH = 398600.4418 # km^3/s^2
+
+# one fixed-size block of a streamed ephemeris: tt (N,) Julian dates, xyz (N,3) GCRS km, lat/lon (N,) degrees, alt (N,) km
+EphemerisChunk = namedtuple("EphemerisChunk", ["tt", "xyz", "lat", "lon", "alt"])
+
+
+def hermite(positions, velocities, i, s, h):
+    """Cubic Hermite interpolation between rows i and i + 1 of a tabulated (N,3) ephemeris.
+
+    Args:
+        positions (np.ndarray): The (N,3) tabulated positions.
+        velocities (np.ndarray): The (N,3) tabulated velocities, per second.
+        i (np.ndarray): Index of the row before each requested time.
+        s (np.ndarray): Position of each requested time inside its step, 0..1, shaped (K,1).
+        h (float): The table step in seconds.
+
+    Returns:
+        tuple: The (K,3) interpolated positions and velocities.
+    """
+    p0, p1 = positions[i], positions[i + 1]
+    m0, m1 = velocities[i] * h, velocities[i + 1] * h
+
+    # cubic Hermite basis functions and their derivatives
+    s2, s3 = s * s, s * s * s
+    interpolated = (2*s3 - 3*s2 + 1) * p0 + (s3 - 2*s2 + s) * m0 + (-2*s3 + 3*s2) * p1 + (s3 - s2) * m1
+    rates = ((6*s2 - 6*s) * p0 + (3*s2 - 4*s + 1) * m0 + (-6*s2 + 6*s) * p1 + (3*s2 - 2*s) * m1) / h
+    return interpolated, rates
+
+
+class EphemerisCache:
+    """Sliding ephemeris table per tracked satellite, shared by the view, the overlay and the controller.
+
+    Grid nodes lie on a global Terrestrial Time grid of `step` seconds, so every satellite is sampled at the same instants.
+    The table covers `behind` seconds before and `ahead` seconds after the latest requested time and slides forward by
+    propagating only the newly exposed nodes.
+    """
+    def __init__(self, timescale, step: float = 60, behind: float = 10 * 60, ahead: float = 30 * 60):
+        self.ts = timescale
+        self.step = step # grid step in seconds
+        self.step_days = step / DAY_S
+        self.nodes_behind = max(1, ceil(behind / step))
+        self.nodes_ahead = max(2, ceil(ahead / step))
+        self.tables = {} # satnum -> table dict
+
+    def key(self, satellite):
+        return satellite.model.satnum
+
+    def track(self, satellite, time: Time = None):
+        """Start caching a satellite, propagating its table around `time` (defaults to now)."""
+        table = self.tables.get(self.key(satellite))
+        if table is None or table["satellite"] is not satellite: # a new TLE invalidates the old table
+            table = self.prepare(satellite, time)
+            self.tables[self.key(satellite)] = table
+            return table
+        self.cover(table, time if time is not None else self.ts.now())
+        return table
+
+    def prepare(self, satellite, time: Time = None):
+        """Propagate a satellite's table around `time` (defaults to now) without tracking it, so it can be built off the GUI thread.
+
+        The table starts being used once it is handed to adopt().
+        """
+        table = {"satellite": satellite, "first_node": 0, "positions": np.empty((0, 3)), "velocities": np.empty((0, 3))}
+        self.cover(table, time if time is not None else self.ts.now())
+        return table
+
+    def adopt(self, table):
+        """Track a table built by prepare(), replacing the table of any satellite with the same number."""
+        self.tables[self.key(table["satellite"])] = table
+
+    def untrack(self, satellite):
+        """Stop caching a satellite and free its table."""
+        self.tables.pop(self.key(satellite), None)
+
+    def clear(self):
+        self.tables.clear()
+
+    def cover(self, table, time: Time):
+        """Slide a table so that every grid step touched by a scalar or array `time` is cached."""
+        tt = np.atleast_1d(time.tt)
+        self.slide(table, int(np.floor(tt.min() / self.step_days)), int(np.floor(tt.max() / self.step_days)))
+
+    def slide(self, table, node: int, last_node: int = None):
+        """Move a table's window so it covers grid nodes node..last_node, propagating only nodes that are not already cached."""
+        last_node = node if last_node is None else last_node
+        first = table["first_node"]
+        count = len(table["positions"])
+        # keep the window until less than half of the look-ahead is left
+        if count and first <= node and last_node + self.nodes_ahead // 2 <= first + count - 1:
+            return
+        new_first = node - self.nodes_behind
+        new_last = last_node + self.nodes_ahead # inclusive
+
+        overlap_first = max(first, new_first)
+        overlap_last = min(first + count - 1, new_last)
+        if not count or overlap_first > overlap_last: # no overlap, propagate the whole window
+            positions, velocities = self.propagate_nodes(table["satellite"], new_first, new_last)
+        else:
+            kept = slice(overlap_first - first, overlap_last - first + 1)
+            parts_p, parts_v = [], []
+            if new_first < overlap_first:
+                p, v = self.propagate_nodes(table["satellite"], new_first, overlap_first - 1)
+                parts_p.append(p)
+                parts_v.append(v)
+            parts_p.append(table["positions"][kept])
+            parts_v.append(table["velocities"][kept])
+            if overlap_last < new_last:
+                p, v = self.propagate_nodes(table["satellite"], overlap_last + 1, new_last)
+                parts_p.append(p)
+                parts_v.append(v)
+            positions, velocities = np.concatenate(parts_p), np.concatenate(parts_v)
+
+        table["first_node"] = new_first
+        table["positions"] = positions
+        table["velocities"] = velocities
+
+    def propagate_nodes(self, satellite, first: int, last: int):
+        """Propagate a satellite at grid nodes first..last (inclusive) with one batch SGP4 call."""
+        nodes = np.arange(first, last + 1, dtype=np.float64)
+        times = self.ts.tt_jd(nodes * self.step_days)
+        positions, velocities, errors = propagate(satellite, times)
+        return positions, velocities
+
+    def interpolate(self, satellite, time: Time):
+        """Cubic Hermite interpolation of position and velocity at a scalar or array `time`.
+
+        Returns:
+            tuple: (positions, velocities) in GCRS km and km/s, shaped (3,) for a scalar time or (N,3) for a Time array.
+        """
+        table = self.tables.get(self.key(satellite))
+        if table is None or table["satellite"] is not satellite:
+            table = self.track(satellite, time)
+        self.cover(table, time)
+
+        grid = np.atleast_1d(time.tt) / self.step_days
+        node = np.floor(grid).astype(np.int64)
+        s = (grid - node)[:, None] # position inside the step, 0..1
+        i = node - table["first_node"]
+
+        positions, velocities = hermite(table["positions"], table["velocities"], i, s, self.step)
+
+        if not time.shape:
+            return positions[0], velocities[0]
+        return positions, velocities
+
+    def position(self, satellite, time: Time):
+        """Return the interpolated GCRS position in km of a satellite at `time`."""
+        return self.interpolate(satellite, time)[0]
+
+    def geocentric(self, satellite, time: Time):
+        """Return the interpolated position as a Skyfield Geocentric, usable with latlon_of(), height_of() and friends."""
+        positions, velocities = self.interpolate(satellite, time)
+        return to_geocentric(np.atleast_2d(positions), np.atleast_2d(velocities), time)
+
+    def positions(self, time: Time):
+        """Return the interpolated positions of every tracked satellite at a scalar `time`.
+
+        Returns:
+            dict: satnum -> (3,) GCRS position in km.
+        """
+        return {key: self.position(table["satellite"], time) for key, table in list(self.tables.items())}
+
+    def error_bound(self, satellite):
+        """Estimate the interpolation error bound in km for a satellite at this cache's grid step.
+
+        Uses the cubic Hermite remainder r * (w * h)^4 / 384 with the Keplerian angular rate w and radius r at perigee,
+        where the orbit curves fastest, doubled to leave room for the J2 and drag terms SGP4 adds on top of the ellipse.
+        It holds for near-circular orbits. For eccentric ones the SGP4 velocities are not the exact derivative of the
+        positions, and the error can be several times larger, a few metres at e = 0.15.
+        """
+        model = satellite.model
+        n = model.no_kozai / 60 # mean motion in rad/s
+        e = model.ecco
+        a = (GM_EARTH / n**2) ** (1 / 3)
+        perigee = a * (1 - e)
+        rate = n * sqrt(1 + e) / (1 - e) ** 1.5 # angular rate at perigee
+        return 2 * perigee * (rate * self.step) ** 4 / 384
+
+
+def iter_ephemeris(satellite, start: Time, duration: float, step: float = 60, chunk_size: int = 1440):
+    """Stream a satellite's ephemeris over an arbitrary window as fixed-size NumPy chunks.
+
+    Only one chunk is alive at a time, so peak memory depends on chunk_size and not on the length of the window:
+    an hour at 1 s and a month at 10 s both hold at most chunk_size samples.
+
+    Args:
+        satellite (EarthSatellite): The satellite to propagate.
+        start (Time): The first sample time.
+        duration (float): Length of the window in seconds.
+        step (float, optional): Seconds between samples. Defaults to 60.
+        chunk_size (int, optional): Samples per chunk. Defaults to 1440.
+
+    Yields:
+        EphemerisChunk: tt, xyz, lat, lon and alt arrays for up to chunk_size consecutive samples.
+    """
+    ts = start.ts
+    count = int(duration // step) + 1
+    step_days = step / DAY_S
+    for first in range(0, count, chunk_size):
+        # offsets are built from integer sample indices so long windows do not accumulate rounding drift
+        offsets = np.arange(first, min(first + chunk_size, count), dtype=np.float64) * step_days
+        times = ts.tt_jd(start.whole, start.tt_fraction + offsets)
+        positions, velocities, errors = propagate(satellite, times)
+        geocentric = to_geocentric(positions, velocities, times)
+        lat, lon = wgs84.latlon_of(geocentric)
+        alt = wgs84.height_of(geocentric)
+        yield EphemerisChunk(times.tt, positions, lat.degrees, lon.degrees, alt.km)
@@ -0,0 +1,168 @@
+'''
+The frame service converts between the inertial (ECI, GCRS) and Earth-fixed (ECEF, ITRS) frames for whole Time arrays at once.
+
+For N times it builds an (N,3,3) stack of rotation matrices and applies it to (N,3) or (M,N,3) vectors with a single einsum,
+instead of building a 3x3 matrix per point. Two models are available:
+
+    * GMST: a rotation about the z-axis by the Greenwich Mean Sidereal Time angle, cheap and what the 3D view uses to spin
+      the globe. It ignores precession, nutation and polar motion, so it drifts from ITRS by about 0.014 degrees per year
+      away from J2000.
+    * ITRS: Skyfield's full GCRS to ITRS rotation, matching latlon_of() and itrs_xyz exactly.
+
+Stacks are cached per time grid, so grids that are converted repeatedly (the memoized grids of the time service) pay for the
+sidereal time and the precession-nutation matrices only once. Single times and grids that are never repeated, e.g. the
+per-frame now() or grids anchored on it, are converted without the cache so they do not evict the reusable stacks.
+
+Earth-fixed vectors are converted to and from geodetic latitude, longitude and height over whole arrays with Bowring's
+method, for WGS84 or any scaled ellipsoid with the same flattening.
+'''
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from skyfield.api import Time
+from skyfield.framelib import itrs
+
+GMST, ITRS = "gmst", "itrs"
+
+WGS84_RADIUS = 6378.137 # km
+WGS84_INVERSE_FLATTENING = 298.257223563
+
+
+def gmst_angle(time: Time):
+    """Return the Greenwich Mean Sidereal Time of a Time or Time array in radians."""
+    return np.asarray(time.gmst) * (2 * np.pi / 24) # GMST is in hours
+
+
+def gmst_matrices(time: Time):
+    """Return the ECI to ECEF rotations about the z-axis by GMST, shaped (3,3) for a scalar time or (N,3,3) for a Time array."""
+    angle = gmst_angle(time)
+    c, s = np.cos(angle), np.sin(angle)
+    zero, one = np.zeros_like(angle), np.ones_like(angle)
+    return np.stack([
+        np.stack([c, s, zero], axis=-1),
+        np.stack([-s, c, zero], axis=-1),
+        np.stack([zero, zero, one], axis=-1),
+    ], axis=-2)
+
+
+def itrs_matrices(time: Time):
+    """Return the full GCRS to ITRS rotations, shaped (3,3) for a scalar time or (N,3,3) for a Time array."""
+    rotation = itrs.rotation_at(time) # (3,3) or (3,3,N)
+    if rotation.ndim == 3:
+        rotation = np.moveaxis(rotation, -1, 0)
+    return rotation
+
+
+def rotate(matrices, vectors, transpose: bool = False):
+    """Apply a stack of rotations to vectors with one einsum.
+
+    Args:
+        matrices (np.ndarray): A (3,3) rotation or an (N,3,3) stack, one per time.
+        vectors (np.ndarray): A (3,) vector, (N,3) vectors matching the stack, or an (M,N,3) batch of M satellites.
+        transpose (bool, optional): Apply the inverse rotations instead. Defaults to False.
+
+    Returns:
+        np.ndarray: The rotated vectors, shaped like `vectors`.
+    """
+    vectors = np.asarray(vectors, dtype=np.float64)
+    if matrices.ndim == 2:
+        return np.einsum('ji,...j->...i' if transpose else 'ij,...j->...i', matrices, vectors)
+    return np.einsum('nji,...nj->...ni' if transpose else 'nij,...nj->...ni', matrices, vectors)
+
+
+def ecef_to_geodetic(positions, radius: float = WGS84_RADIUS, inverse_flattening: float = WGS84_INVERSE_FLATTENING):
+    """Convert Earth-fixed vectors to geodetic coordinates with Bowring's method.
+
+    Two Bowring iterations reach well below a millimetre for anything from the surface out to geostationary orbit.
+
+    Args:
+        positions (np.ndarray): ECEF vectors shaped (..., 3), in the same unit as radius.
+        radius (float, optional): Equatorial radius of the ellipsoid. Defaults to the WGS84 radius in km.
+        inverse_flattening (float, optional): Inverse flattening of the ellipsoid. Defaults to WGS84.
+
+    Returns:
+        tuple: (latitude, longitude, height), latitude and longitude in radians and height in the unit of radius,
+        each shaped like positions.shape[:-1].
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    x, y, z = positions[..., 0], positions[..., 1], positions[..., 2]
+    f = 1 / inverse_flattening
+    e2 = f * (2 - f) # first eccentricity squared
+    polar_radius = radius * (1 - f)
+    ep2 = e2 / (1 - e2) # second eccentricity squared
+
+    p = np.hypot(x, y)
+    longitude = np.arctan2(y, x)
+    beta = np.arctan2(z * radius, p * polar_radius) # reduced latitude of the starting guess
+    for _ in range(2):
+        latitude = np.arctan2(z + ep2 * polar_radius * np.sin(beta)**3, p - e2 * radius * np.cos(beta)**3)
+        beta = np.arctan2((1 - f) * np.sin(latitude), np.cos(latitude))
+
+    sin_lat = np.sin(latitude)
+    height = p * np.cos(latitude) + z * sin_lat - radius * np.sqrt(1 - e2 * sin_lat**2) # valid at the poles too
+    return latitude, longitude, height
+
+
+def geodetic_to_ecef(latitude, longitude, height, radius: float = WGS84_RADIUS, inverse_flattening: float = WGS84_INVERSE_FLATTENING):
+    """Convert geodetic latitude and longitude in radians and height in the unit of radius to (..., 3) Earth-fixed vectors."""
+    latitude, longitude, height = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (latitude, longitude, height)))
+    f = 1 / inverse_flattening
+    e2 = f * (2 - f)
+    sin_lat, cos_lat = np.sin(latitude), np.cos(latitude)
+    normal = radius / np.sqrt(1 - e2 * sin_lat**2) # prime vertical radius of curvature
+    return np.stack([
+        (normal + height) * cos_lat * np.cos(longitude),
+        (normal + height) * cos_lat * np.sin(longitude),
+        (normal * (1 - e2) + height) * sin_lat,
+    ], axis=-1)
+
+
+class FrameTransformer:
+    """Converts vectors between ECI and ECEF with rotation stacks cached per time grid."""
+    def __init__(self, max_grids: int = 32):
+        self.max_grids = max_grids
+        self.stacks = OrderedDict() # key -> rotation stack, least recently used first
+        self.lock = threading.Lock() # the GUI thread and the thread pool share the cache
+
+    def key(self, time: Time, model: str):
+        """Key a time grid on its exact two-part Terrestrial Time, the bytes themselves rather than a hash of them."""
+        whole, fraction = np.asarray(time.whole, dtype=np.float64), np.asarray(time.tt_fraction, dtype=np.float64)
+        return (model, whole.shape, whole.tobytes(), fraction.tobytes())
+
+    def rotations(self, time: Time, model: str = GMST, memoize: bool = True):
+        """Return the cached ECI to ECEF rotation stack for a Time or Time array under the GMST or ITRS model.
+
+        Args:
+            time (Time): A Time or Time array.
+            model (str, optional): GMST or ITRS. Defaults to GMST.
+            memoize (bool, optional): Cache the stack. Pass False for times that are never repeated, e.g. grids anchored
+                on now(). A single time is never cached. Defaults to True.
+        """
+        if not memoize or np.size(time.tt) <= 1:
+            return gmst_matrices(time) if model == GMST else itrs_matrices(time)
+        key = self.key(time, model)
+        with self.lock:
+            matrices = self.stacks.get(key)
+            if matrices is not None:
+                self.stacks.move_to_end(key)
+                return matrices
+        matrices = gmst_matrices(time) if model == GMST else itrs_matrices(time) # outside the lock, like TimeService.memoize()
+        with self.lock:
+            self.stacks[key] = matrices
+            self.stacks.move_to_end(key)
+            while len(self.stacks) > self.max_grids:
+                self.stacks.popitem(last=False)
+        return matrices
+
+    def eci_to_ecef(self, positions, time: Time, model: str = GMST, memoize: bool = True):
+        """Rotate ECI vectors shaped (3,), (N,3) or (M,N,3) into the Earth-fixed frame at the matching times."""
+        return rotate(self.rotations(time, model, memoize), positions)
+
+    def ecef_to_eci(self, positions, time: Time, model: str = GMST, memoize: bool = True):
+        """Rotate ECEF vectors shaped (3,), (N,3) or (M,N,3) into the inertial frame at the matching times."""
+        return rotate(self.rotations(time, model, memoize), positions, transpose=True)
+
+    def clear(self):
+        self.stacks.clear()
@@ -0,0 +1,244 @@
+'''
+The freshness service keeps the element sets of the catalog inside the validity margin of Satellite.epoch_valid_at() in
+the background, so a selection in the interface never has to wait for a download.
+
+Every pass reads the epochs of the whole catalog into one array and computes, in a single vectorized step, how many days
+each element set has left before it leaves the margin. The ones that expire within the lead time are refreshed most
+urgent first, at most `budget` downloads per pass, through the concurrent downloader. When most members of a group are
+due, e.g. a whole Celestrak group ingested together, the group is refreshed with one GroupIngestor request instead of one
+request per catalog number. Catalog numbers can also be requested explicitly (a stale selection, a newly tracked
+satellite); they go first on the next pass, which is started right away.
+
+Subscribers get a RefreshEvent after every pass that updated something. They are called on the scheduler thread, so GUI
+code should forward the event through a queued signal.
+'''
+
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from .catalog_service import TLECatalog, norad_id
+from .download_service import FAILED, NOT_MODIFIED, UPDATED, DownloadResult, TLEDownloader
+
+RefreshEvent = namedtuple("RefreshEvent", ["updated", "results", "time"]) # updated: set of catalog numbers (int)
+
+
+def unix_to_jd(seconds):
+    """Convert Unix time to a UTC Julian date."""
+    return seconds / 86400.0 + 2440587.5
+
+
+def days_left(epochs, now_jd: float, margin: float = 14):
+    """Return the days each element set has left before `now_jd` leaves its epoch_valid_at() margin, negative once stale.
+
+    Args:
+        epochs (np.ndarray): UTC Julian dates of the element sets.
+        now_jd (float): UTC Julian date of now.
+        margin (float, optional): The validity margin in days. Defaults to 14, like Satellite.epoch_valid_at().
+    """
+    return np.asarray(epochs, dtype=np.float64) + margin - now_jd
+
+
+class FreshnessScheduler:
+    """Background refresh of the element sets that are about to leave their validity margin.
+
+    Args:
+        catalog (TLECatalog): The catalog to keep fresh.
+        downloader (TLEDownloader): Fetches the element sets.
+        margin (float, optional): Validity margin in days, see Satellite.epoch_valid_at(). Defaults to 14.
+        lead (float, optional): Refresh element sets this many days before they leave the margin. Defaults to 2.
+        budget (int, optional): Most downloads per pass, a group download counts as one. Defaults to 30.
+        interval (float, optional): Seconds between passes. Defaults to 60.
+        retry_after (float, optional): Seconds before a catalog number whose download brought nothing newer is tried
+            again, e.g. a decayed object Celestrak no longer updates. Defaults to one day.
+        failure_backoff (float, optional): Seconds before a catalog number whose download failed is tried again, doubled
+            on every further failure up to `retry_after`, so an offline client does not retry every pass. Defaults to 5
+            minutes.
+        ingestor (GroupIngestor, optional): Refreshes whole groups. Defaults to None, every catalog number on its own.
+        group_share (float, optional): Share of a group's members that must be due to refresh the whole group with one
+            request. Defaults to 0.5.
+    """
+    def __init__(self, catalog: TLECatalog, downloader: TLEDownloader, margin: float = 14, lead: float = 2,
+                 budget: int = 30, interval: float = 60, retry_after: float = 86400, failure_backoff: float = 300,
+                 ingestor=None, group_share: float = 0.5):
+        self.catalog = catalog
+        self.downloader = downloader
+        self.margin = margin
+        self.lead = lead
+        self.budget = budget
+        self.interval = interval
+        self.retry_after = retry_after
+        self.failure_backoff = failure_backoff
+        self.ingestor = ingestor
+        self.group_share = group_share
+
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.requested = {} # catalog number -> None, explicit requests in arrival order
+        self.attempted = {} # catalog number -> Unix time of the last download that did not bring a newer epoch
+        self.failed = {} # catalog number -> (Unix time of the last failed download, consecutive failures)
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def subscribe(self, callback):
+        """Call `callback(RefreshEvent)` after every pass that updated at least one element set."""
+        self.subscribers.append(callback)
+
+    def request(self, catalog_ids):
+        """Refresh these catalog numbers first on the next pass, and start that pass now."""
+        with self.lock:
+            for catalog_id in catalog_ids:
+                self.requested[norad_id(catalog_id)] = None
+        self.wake.set()
+
+    def ranking(self, now: float = None):
+        """Rank the whole catalog by how soon each element set leaves the margin.
+
+        Returns:
+            tuple: (catalog numbers, days left) as arrays, most urgent first.
+        """
+        rows = self.catalog.connection.execute("SELECT norad_id, epoch FROM tle").fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        ids, epochs = np.array(rows, dtype=np.float64).T
+        left = days_left(epochs, unix_to_jd(time.time() if now is None else now), self.margin)
+        order = np.argsort(left, kind="stable")
+        return ids[order].astype(np.int64), left[order]
+
+    def due(self, now: float = None):
+        """Return the catalog numbers to refresh on the next pass, those of the due groups included, see plan()."""
+        groups, keys = self.plan(now)
+        return keys + [key for members in groups.values() for key in members if key not in keys]
+
+    def plan(self, now: float = None):
+        """Plan the next pass: explicit requests, then the most urgent, within budget.
+
+        Returns:
+            tuple: (groups, catalog numbers), the groups to refresh with one request each as {group: members}, and the
+            catalog numbers to download on their own.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            requested = list(self.requested)
+            self.requested.clear()
+            recent = [key for key, attempted in self.attempted.items() if now - attempted < self.retry_after]
+            recent += [key for key, (failed, count) in self.failed.items() if now - failed < self.backoff(count)]
+
+        ids, left = self.ranking(now)
+        expiring = ids[(left < self.lead) & ~np.isin(ids, recent)].tolist()
+        groups = self.due_groups(requested + expiring, self.budget)
+        covered = {key for members in groups.values() for key in members}
+
+        picked = dict.fromkeys(key for key in requested if key not in covered) # explicit requests are not limited by the budget
+        for key in expiring:
+            if len(picked) + len(groups) >= self.budget:
+                break
+            if key not in covered:
+                picked[key] = None
+        return groups, list(picked)
+
+    def due_groups(self, keys, limit: int):
+        """Return up to `limit` groups at least `group_share` of whose members are among `keys`, largest first."""
+        if self.ingestor is None or not keys or limit <= 0:
+            return {}
+        members = {}
+        for group, key in self.catalog.connection.execute("SELECT group_name, norad_id FROM membership"):
+            members.setdefault(group, []).append(key)
+        due = set(keys)
+        groups = {}
+        for group, group_members in sorted(members.items(), key=lambda item: -len(item[1])):
+            if len(groups) == limit:
+                break
+            if sum(key in due for key in group_members) >= self.group_share * len(group_members):
+                groups[group] = group_members
+                due.difference_update(group_members) # an object in two groups is refreshed once
+        return groups
+
+    def ingest_group(self, group: str, members):
+        """Refresh a group with one request and return a DownloadResult per member, like the downloader's."""
+        try:
+            count = self.ingestor.ingest_group(group)
+        except OSError as e:
+            return {f"{key:05d}": DownloadResult(f"{key:05d}", FAILED, 0, str(e)) for key in members}
+        status = UPDATED if count else NOT_MODIFIED
+        return {f"{key:05d}": DownloadResult(f"{key:05d}", status, 1 if count else 0, None) for key in members}
+
+    def backoff(self, failures: int):
+        """Return the seconds to wait after `failures` consecutive failed downloads of a catalog number."""
+        return min(self.failure_backoff * 2 ** (failures - 1), self.retry_after)
+
+    def prune(self, now: float):
+        """Forget attempts and failures older than `retry_after`, they no longer hold anything back."""
+        with self.lock:
+            for key in [key for key, attempted in self.attempted.items() if now - attempted >= self.retry_after]:
+                del self.attempted[key]
+            for key in [key for key, (failed, count) in self.failed.items() if now - failed >= self.retry_after]:
+                del self.failed[key]
+
+    def run_once(self, now: float = None):
+        """Run one pass: download what is due and publish a RefreshEvent if anything was updated.
+
+        Returns:
+            RefreshEvent: The event of the pass, or None if nothing was due.
+        """
+        attempted = time.time() if now is None else now
+        self.prune(attempted)
+        groups, due = self.plan(attempted)
+        if not groups and not due:
+            return None
+        keys = due + [key for members in groups.values() for key in members]
+        before = {record.norad_id: record.epoch for record in self.catalog.records(keys)}
+
+        results = self.downloader.download_all(due) if due else {}
+        for group, members in groups.items():
+            results.update(self.ingest_group(group, members))
+        updated = set()
+        for catalog_id, result in results.items():
+            key = norad_id(catalog_id)
+            record = self.catalog.get(key) if result.status == UPDATED else None
+            with self.lock:
+                if result.status == FAILED: # back off, longer after every further failure
+                    self.failed[key] = (attempted, self.failed.get(key, (None, 0))[1] + 1)
+                    continue
+                self.failed.pop(key, None)
+                if record is not None and record.epoch != before.get(key):
+                    updated.add(key)
+                    self.attempted.pop(key, None)
+                else: # nothing newer on the server, do not ask again right away
+                    self.attempted[key] = attempted
+
+        event = RefreshEvent(updated, results, attempted)
+        if updated:
+            for callback in list(self.subscribers):
+                try:
+                    callback(event)
+                except Exception as e:
+                    print("Error occurred in a TLE refresh subscriber:", str(e))
+        return event
+
+    def start(self):
+        """Start passes on a daemon thread, every `interval` seconds or as soon as something is requested."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="tle-freshness", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.wake.clear() # before the pass, so a request made during it starts the next one
+            try:
+                self.run_once()
+            except Exception as e: # keep the scheduler alive through network or database hiccups
+                print("Error occurred while refreshing TLE data:", str(e))
+            self.wake.wait(self.interval)
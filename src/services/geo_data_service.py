@@ -5,19 +5,14 @@ from argparse import ArgumentParser
 from pathlib import Path
 from urllib.parse import quote
 
-import geopandas
-import matplotlib.pyplot as plt
-from geodatasets import get_path, get_url
-from shapely.geometry import Point
+import numpy as np
 from skyfield.api import load, wgs84
 
+from .geo_lookup import LAND, OCEAN, GeoLookup, RegionIndex, region_timeline
+from .geodata_registry import GEO_CACHE_DIR, GeoLayerRegistry
 from .geocodeAPI import fromLatLon
 from .mapComponents import MapComponents
 
-ne_10m_admin_0_countries = geopandas.read_file('src/assets/geodata/Natural_Earth_quick_start/10m_cultural/ne_10m_admin_0_countries.shp')
-ne_10m_geography_marine_polys = geopandas.read_file('src/assets/geodata/ne_10m_geography_marine_polys/ne_10m_geography_marine_polys.shp')
-ne_50m_admin_0_countries = geopandas.read_file('src/assets/geodata/ne_50m_admin_0_countries/ne_50m_admin_0_countries.shp')
-
 """ # 10m_cultural Shapefiles
 ne_10m_admin_0_countries = geopandas.read_file('src/assets/geodata/Natural_Earth_quick_start/10m_cultural/ne_10m_admin_0_countries.shp')
 ne_10m_admin_0_boundary_lines_land = geopandas.read_file('src/assets/geodata/Natural_Earth_quick_start/10m_cultural/ne_10m_admin_0_boundary_lines_land.shp')
@@ -88,16 +83,14 @@ Physical Datasets
 ne_10m_physical_building_blocks_all:
 
 """
-ne_50m_physical_land = geopandas.read_file('src/assets/geodata/ne_50m_physical/ne_50m_land.shp')
-ne_50m_physical_ocean = geopandas.read_file('src/assets/geodata/ne_50m_physical/ne_50m_ocean.shp')
-
-ne_50m_geography_marine_polys = geopandas.read_file('src/assets/geodata/Natural_Earth_quick_start/50m_physical/ne_50m_geography_marine_polys.shp')
-ne_50m_admin_0_boundary_lines_maritime_indicator = geopandas.read_file('src/assets/geodata/Natural_Earth_quick_start/50m_cultural/ne_50m_admin_0_boundary_lines_maritime_indicator.shp')
-ne_10m_admin_0_label_points = geopandas.read_file('src/assets/geodata/ne_10m_cultural_building_blocks_all/ne_10m_admin_0_label_points.shp')
 script_dir = Path(__file__).resolve().parent.parent.parent
 #earth_texture_path = script_dir / "assets" / "images" / "land_ocean_ice_2048.jpg"
 earth_texture_path = script_dir / "assets" / "images" / "solarsystemscope.com" / "2k_earth_daymap.jpg"
 
+REGION_LAYERS = ("ne_10m_admin_0_countries", "ne_10m_geography_marine_polys", "ne_50m_physical_land")
+
+geodata = GeoLayerRegistry() # every layer is read on first use, see geodata_registry.LAYERS
+
 
 class GeoDataService:
     def __init__(self):
@@ -106,7 +99,31 @@ class GeoDataService:
         self.parser.add_argument("--coords", type=float, help="Enters coordinates in Lon,Lat format.", nargs=2)
         # add a new argument to the parser to display the map
         self.parser.add_argument("--map", action="store_true", help="Display the map of countries and oceans.")
-
+        self.parser.add_argument("--grid", type=float, metavar="DEGREES", help="Answer lookups from a rasterized grid with this cell size.")
+        self._lookup = None
+
+    @property
+    def lookup(self):
+        """The spatial index of the country and marine layers, built on first use."""
+        if self._lookup is None:
+            self._lookup = GeoLookup(
+                RegionIndex.from_layer(geodata[REGION_LAYERS[0]], 'ADMIN'),
+                RegionIndex.from_layer(geodata[REGION_LAYERS[1]], 'name'),
+                RegionIndex.from_layer(geodata[REGION_LAYERS[2]], 'featurecla'),
+            )
+        return self._lookup
+
+    def use_grid(self, resolution: float = 0.25):
+        """Answer every lookup from a rasterized uint16 grid of the country, marine and land layers.
+
+        The grid is memory-mapped from the geodata cache, and rasterized there once if it does not exist yet. Points near a
+        boundary are still tested against the polygons, so the answers do not change, only their cost.
+
+        Args:
+            resolution (float, optional): Cell size in degrees. Defaults to 0.25, about 6 MB for the three layers.
+        """
+        key = geodata.signature(REGION_LAYERS) # a new shapefile gets a new grid
+        return self.lookup.use_grid(resolution, os.path.join(GEO_CACHE_DIR, f"region_grid_{resolution:g}_{key}.npy"))
 
     def locate_Coordinates(self, lon, lat):
         if not self.validate_coordinates(lat, lon):
@@ -114,20 +131,48 @@ class GeoDataService:
             return
         return self.check_location_land_or_sea(lon, lat)
 
+    def locate_Track(self, lons, lats):
+        """Locate a whole ground track, or any batch of points, in one spatial index query per layer.
+
+        Args:
+            lons (np.ndarray): Longitudes in degrees.
+            lats (np.ndarray): Latitudes in degrees, the same shape as lons.
+
+        Returns:
+            Location: Object arrays of the surface ('Land', 'Ocean' or 'Not Land nor Ocean'), the country and the marine
+                region names (None where there is none).
+        """
+        return self.lookup.lookup(np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+
+    def region_Timeline(self, times, lons, lats, positions=None, iterations=12):
+        """Find which countries and sea regions propagated ground tracks overfly, and when.
+
+        Every sample of every track is located in one batch, and each change of region is refined by bisection between its
+        two samples, see geo_lookup.region_timeline().
+
+        Args:
+            times (np.ndarray): Sample times shared by the tracks, shape (N,), e.g. Terrestrial Time Julian dates.
+            lons (np.ndarray): Longitudes in degrees, shape (N,) for one satellite or (S,N) for S satellites.
+            lats (np.ndarray): Latitudes in degrees, the shape of lons.
+            positions (callable, optional): positions(tracks, times) -> (lons, lats), to place the bisection points on the
+                propagated orbit. Defaults to great circle interpolation between the samples.
+            iterations (int, optional): Bisection steps per transition. Defaults to 12, the step / 4096.
+
+        Returns:
+            list: The (region, t_enter, t_exit) Intervals of the track, or one list of them per satellite.
+        """
+        return region_timeline(self.lookup, times, lons, lats, positions, iterations)
+
     def check_Country(self, lon, lat):
-        point = Point(lon, lat)
-        for country in ne_50m_admin_0_countries:
-            if country.contains(point):
-                return country['ADMIN']
+        return self.lookup.countries.names_at(lon, lat).item()
 
     def check_location_land_or_sea(self, lon, lat):
-        point = Point(lon, lat)
+        location = self.lookup.lookup(lon, lat)
 
-        if ne_10m_geography_marine_polys.contains(point).any():
+        if location.surface == OCEAN:
             return 'Ocean'
-        elif ne_10m_admin_0_countries.contains(point).any():
-            address = self.check_Country(lat, lon)
-            return 'Land', address
+        elif location.surface == LAND:
+            return 'Land', location.country
         else:
             return 'Not Land nor Ocean'
 
@@ -166,10 +211,11 @@ class GeoDataService:
         return f"{lat_result} {lon_result}"
 
     def initMap(self):
+        import matplotlib.pyplot as plt
         fig, ax = plt.subplots(figsize=(10, 10))
 
         ax.imshow(plt.imread(earth_texture_path), extent=[-180, 180, -90, 90])
-        ne_50m_admin_0_countries.boundary.plot(ax=ax, color='black', linewidth=0.25)
+        geodata.frame("ne_50m_admin_0_countries").boundary.plot(ax=ax, color='black', linewidth=0.25)
         #ne_50m_geography_marine_polys.boundary.plot(ax=ax, color='black', linestyle='--', linewidth=0.25)
 
         map = MapComponents(fig, ax, None)
@@ -178,33 +224,64 @@ class GeoDataService:
     def display_map(self, map, labels=False):
 
         if labels:
+            ne_50m_admin_0_countries = geodata.frame("ne_50m_admin_0_countries")
             for x, y, label in zip(ne_50m_admin_0_countries.geometry.centroid.x, ne_50m_admin_0_countries.geometry.centroid.y, ne_50m_admin_0_countries['ADMIN']):
                 map.ax.text(x, y, label, fontsize=6, ha='center', va='center')
         return map
 
-    def handle_dateline(self, longitudes, latitudes):
-        """
-        Insert None values into longitude and latitude arrays where the trajectory crosses the dateline.
+    def handle_dateline(self, longitudes, latitudes, polar_jump=150, polar_latitude=60):
         """
-        new_lons = []
-        new_lats = []
-
-        # Assume the first point doesn't cross the dateline
-        new_lons.append(longitudes[0])
-        new_lats.append(latitudes[0])
+        Split ground tracks at antimeridian crossings with NaN breaks, for matplotlib or GL line buffers.
 
-        for i in range(1, len(longitudes)):
-            # Check if we've crossed the dateline
-            if longitudes[i-1] is not None and longitudes[i] is not None:
-                if abs(longitudes[i] - longitudes[i-1]) > 180:
-                    # Insert None to "break" the line plot
-                    new_lons.append(None)
-                    new_lats.append(None)
+        At a crossing the track is extended to the map edge on both sides, at the latitude where the straight segment
+        between the two samples meets longitude +-180. A step that flips by at least `polar_jump` degrees in longitude
+        between two samples beyond `polar_latitude` in the same hemisphere passes over a pole, so the track is extended to
+        the pole at both longitudes instead. Any other step, e.g. a fast but short swing near the top of an orbit, is drawn
+        as it is. None values (old list tracks) are read as NaN breaks.
 
-            new_lons.append(longitudes[i])
-            new_lats.append(latitudes[i])
+        Parameters:
+        longitudes (np.ndarray): Longitudes in degrees in [-180, 180], shape (N,) or (S,N) for S tracks.
+        latitudes (np.ndarray): Latitudes in degrees, the shape of longitudes.
+        polar_jump (float): Smallest longitude step, in degrees, that is read as a polar pass.
+        polar_latitude (float): Smallest absolute latitude, in degrees, of both samples of a polar pass.
 
-        return new_lons, new_lats
+        Returns:
+        tuple: (longitudes, latitudes) as 1-D float arrays. Batches are joined into one array, separated by NaN.
+        """
+        lons = np.atleast_2d(np.asarray(longitudes, dtype=np.float64))
+        lats = np.atleast_2d(np.asarray(latitudes, dtype=np.float64))
+        tracks, n = lons.shape
+        if not n:
+            return np.empty(0), np.empty(0)
+
+        lon0, lon1 = lons[:, :-1], lons[:, 1:]
+        lat0, lat1 = lats[:, :-1], lats[:, 1:]
+        step = lon1 - lon0
+        wrapped = (step + 180) % 360 - 180 # the shortest way round
+        high = (np.minimum(np.abs(lat0), np.abs(lat1)) >= polar_latitude) & (np.sign(lat0) == np.sign(lat1))
+        polar = (np.abs(wrapped) >= polar_jump) & high
+        crossing = (np.abs(step) > 180) & ~polar
+        track, j = np.nonzero(crossing | polar)
+        lon0, lon1, lat0, lat1 = lon0[track, j], lon1[track, j], lat0[track, j], lat1[track, j]
+        is_polar = polar[track, j]
+
+        # the points that close the line before the break and open it after
+        edge = np.where(lon0 > 0, 180.0, -180.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lat_edge = lat0 + (lat1 - lat0) * (edge - lon0) / wrapped[track, j]
+        pole = np.where(lat0 + lat1 >= 0, 90.0, -90.0)
+        before_lon = np.where(is_polar, lon0, edge)
+        after_lon = np.where(is_polar, lon1, -edge)
+        before_lat = after_lat = np.where(is_polar, pole, lat_edge)
+
+        # one NaN column between tracks, then everything as one flat buffer with the breaks inserted
+        flat_lons = np.concatenate([lons, np.full((tracks, 1), np.nan)], axis=1).ravel()[:-1]
+        flat_lats = np.concatenate([lats, np.full((tracks, 1), np.nan)], axis=1).ravel()[:-1]
+        at = np.repeat(track * (n + 1) + j + 1, 3)
+        nan = np.full(len(track), np.nan)
+        flat_lons = np.insert(flat_lons, at, np.column_stack([before_lon, nan, after_lon]).ravel())
+        flat_lats = np.insert(flat_lats, at, np.column_stack([before_lat, nan, after_lat]).ravel())
+        return flat_lons, flat_lats
 
 
 
@@ -212,6 +289,8 @@ if __name__ == "__main__":
     service = GeoDataService()
     args = service.parser.parse_args()
 
+    if args.grid:
+        service.use_grid(args.grid)
     if args.locate:
         if args.coords:
             lon, lat = args.coords
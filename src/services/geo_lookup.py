@@ -0,0 +1,343 @@
+'''
+The geo lookup answers "what is under this point" (country, marine region, land or ocean) for single points or whole
+ground tracks at once.
+
+Each polygon layer is held in a Shapely STRtree over prepared geometries. A batch of points is first matched against the
+bounding boxes of the tree in one call, and only the few candidate polygons of each point are tested exactly, with one
+vectorized contains_xy() call over every (point, polygon) pair. Nothing loops over the polygons of a layer in Python, so
+a query costs about the same with a hundred polygons or with the full 10m layers.
+
+region_timeline() turns whole ground tracks, of one or many satellites, into runs of (region, t_enter, t_exit). Every
+sample is located in one batch, and the time of each change of region is refined by bisection, all transitions of all
+tracks together, one batched lookup per step.
+
+For the real-time overlay and for batches of millions of points, RegionGrid rasterizes the layers once into a uint16 grid
+of polygon IDs, stored as a memory-mapped .npy file. A lookup is then one array index per point. Cells crossed by a
+polygon boundary are flagged in the grid, and only the points that fall in them are tested exactly against the polygons.
+'''
+
+import os
+from collections import namedtuple
+
+import numpy as np
+import shapely
+from shapely import STRtree
+
+LAND, OCEAN, UNKNOWN = "Land", "Ocean", "Not Land nor Ocean"
+
+BOUNDARY = 0x8000 # set in the grid cells that a polygon boundary crosses
+MAX_POLYGONS = BOUNDARY - 2 # grid values keep 0 for 'no polygon' and the high bit for BOUNDARY
+
+# region codes of points outside every named region, see GeoLookup.codes()
+OCEAN_CODE, LAND_CODE, UNKNOWN_CODE = -1, -2, -3
+
+# surface is LAND, OCEAN or UNKNOWN, country and marine are region names or None
+Location = namedtuple("Location", ["surface", "country", "marine"])
+
+# one run of a ground track over the same region, region is a country, a marine region, LAND or OCEAN
+Interval = namedtuple("Interval", ["region", "t_enter", "t_exit"])
+
+
+def names_of(layer, found):
+    """Return the names of the polygon positions `found` of a RegionIndex, None where a position is -1."""
+    names = np.empty(np.shape(found), dtype=object)
+    names[found >= 0] = layer.names[found[found >= 0]]
+    return names
+
+
+class RegionIndex:
+    """Point-in-polygon index over the polygons of one layer.
+
+    Args:
+        geometries (array-like): The (multi)polygons, e.g. the geometry column of a GeoDataFrame.
+        names (array-like): The name of every polygon, e.g. its ADMIN column.
+    """
+    def __init__(self, geometries, names):
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        shapely.prepare(self.geometries) # in place, contains_xy() then tests against the prepared form
+        self.tree = STRtree(self.geometries)
+
+    def __len__(self):
+        return len(self.geometries)
+
+    @classmethod
+    def from_frame(cls, frame, column: str):
+        """Build the index of a GeoDataFrame, naming each polygon by one of its columns."""
+        return cls(frame.geometry.values, frame[column].values)
+
+    @classmethod
+    def from_layer(cls, layer, column: str):
+        """Build the index of a GeoLayer of the geodata registry, naming each polygon by one of its columns."""
+        return cls(layer.geometries, layer.column(column))
+
+    def locate(self, lons, lats):
+        """Return the position of the polygon containing each point, -1 where none does.
+
+        Args:
+            lons (float | np.ndarray): Longitudes in degrees.
+            lats (float | np.ndarray): Latitudes in degrees, the same shape as lons.
+
+        Returns:
+            np.ndarray: Polygon positions, the shape of lons. Where polygons overlap, the first one in the layer wins.
+        """
+        lons, lats = np.broadcast_arrays(np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+        shape = lons.shape
+        lons, lats = lons.ravel(), lats.ravel()
+        found = np.full(len(lons), -1, dtype=np.int64)
+        if not len(lons):
+            return found.reshape(shape)
+
+        # candidates by bounding box, then the exact test on the prepared polygons only
+        point_idx, geometry_idx = self.tree.query(shapely.points(lons, lats))
+        inside = shapely.contains_xy(self.geometries[geometry_idx], lons[point_idx], lats[point_idx])
+        point_idx, geometry_idx = point_idx[inside], geometry_idx[inside]
+
+        order = np.lexsort((geometry_idx, point_idx))
+        points, first = np.unique(point_idx[order], return_index=True)
+        found[points] = geometry_idx[order][first]
+        return found.reshape(shape)
+
+    def names_at(self, lons, lats):
+        """Return the name of the polygon containing each point, None where none does."""
+        return names_of(self, self.locate(lons, lats))
+
+    def contains(self, lons, lats):
+        """Return True for every point inside any polygon of the layer."""
+        return self.locate(lons, lats) >= 0
+
+
+def grid_cells(resolution: float, lons, lats):
+    """Return the (row, column) grid cells of finite points, row 0 at latitude +90 and column 0 at longitude -180."""
+    rows = int(round(180 / resolution))
+    cols = int(round(360 / resolution))
+    row = np.clip(((90 - np.asarray(lats, dtype=np.float64)) / resolution).astype(np.int64), 0, rows - 1)
+    col = np.clip(((np.asarray(lons, dtype=np.float64) + 180) / resolution).astype(np.int64), 0, cols - 1)
+    return row, col
+
+
+class RegionGrid:
+    """Rasterized polygon IDs of one or more RegionIndex layers, with exact polygon tests near boundaries.
+
+    Each layer is one band of a (layers, rows, columns) uint16 array. A cell holds the position of the polygon at its
+    center plus one, 0 where there is none, with the BOUNDARY bit set if any polygon boundary of the layer crosses the
+    cell. Away from boundaries the whole cell is inside the same polygon, so the grid answer is exact.
+
+    Args:
+        layers (list): The RegionIndex of every band, in band order.
+        grid (np.ndarray): The (layers, rows, columns) uint16 grid, usually memory-mapped.
+        resolution (float): Cell size in degrees.
+    """
+    def __init__(self, layers, grid, resolution: float):
+        self.layers = list(layers)
+        self.grid = grid
+        self.resolution = resolution
+
+    @staticmethod
+    def rasterize(layer: RegionIndex, resolution: float, out, chunk_rows: int = 64):
+        """Fill one (rows, columns) band with the polygon IDs and boundary flags of a layer, a block of rows at a time."""
+        if len(layer) > MAX_POLYGONS:
+            raise ValueError(f"A grid band holds at most {MAX_POLYGONS} polygons, the layer has {len(layer)}")
+        rows, cols = out.shape
+        boundaries = shapely.boundary(layer.geometries)
+        shapely.prepare(boundaries)
+        tree = STRtree(boundaries)
+        west = -180 + np.arange(cols) * resolution
+        for first in range(0, rows, chunk_rows):
+            north = 90 - np.arange(first, min(first + chunk_rows, rows)) * resolution
+            lons, lats = np.meshgrid(west, north)
+            found = layer.locate(lons + resolution / 2, lats - resolution / 2) # cell centers
+            cells = shapely.box(lons.ravel(), (lats - resolution).ravel(), (lons + resolution).ravel(), lats.ravel())
+            cell_idx, boundary_idx = tree.query(cells) # by bounding box, then exactly against the prepared boundaries
+            cell_idx = cell_idx[shapely.intersects(boundaries[boundary_idx], cells[cell_idx])]
+            crossed = np.zeros(cells.size, dtype=bool)
+            crossed[cell_idx] = True
+            values = (found + 1).astype(np.uint16)
+            values[crossed.reshape(found.shape)] |= BOUNDARY
+            out[first:first + len(north)] = values
+
+    @classmethod
+    def build(cls, layers, resolution: float, path: str):
+        """Rasterize the layers into a new grid file and return the memory-mapped grid."""
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        shape = (len(layers), int(round(180 / resolution)), int(round(360 / resolution)))
+        temporary = path + ".tmp"
+        grid = np.lib.format.open_memmap(temporary, mode="w+", dtype=np.uint16, shape=shape)
+        for band, layer in zip(grid, layers):
+            cls.rasterize(layer, resolution, band)
+        grid.flush()
+        del grid
+        os.replace(temporary, path) # a build that was interrupted never leaves a partial grid behind
+        return cls(layers, np.load(path, mmap_mode="r"), resolution)
+
+    @classmethod
+    def load(cls, layers, resolution: float, path: str):
+        """Memory-map the grid file of the layers, building it first if it is missing or was built for other layers."""
+        shape = (len(layers), int(round(180 / resolution)), int(round(360 / resolution)))
+        if os.path.exists(path):
+            grid = np.load(path, mmap_mode="r")
+            if grid.shape == shape and grid.dtype == np.uint16:
+                return cls(layers, grid, resolution)
+            del grid
+        return cls.build(layers, resolution, path)
+
+    def locate(self, lons, lats):
+        """Return the polygon position of each point in every layer, -1 where none, like RegionIndex.locate().
+
+        Returns:
+            list: One array of the shape of lons per layer.
+        """
+        lons, lats = np.broadcast_arrays(np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+        finite = np.isfinite(lons) & np.isfinite(lats) # NaN would be cast to cell (0, 0)
+        row, col = grid_cells(self.resolution, np.where(finite, lons, 0), np.where(finite, lats, 0))
+        located = []
+        for band, layer in zip(self.grid, self.layers):
+            values = band[row, col]
+            found = np.where(finite, (values & ~np.uint16(BOUNDARY)).astype(np.int64) - 1, -1)
+            near = ((values & BOUNDARY) != 0) & finite
+            if near.any(): # only the points near a boundary are tested against the polygons
+                found[near] = layer.locate(lons[near], lats[near])
+            located.append(found)
+        return located
+
+
+class GeoLookup:
+    """Country, marine region and land/ocean lookup over a country layer and a marine layer.
+
+    A point inside a marine region is OCEAN, otherwise a point inside a country is LAND, the same precedence as
+    GeoDataService.check_location_land_or_sea(). Any other point is LAND or OCEAN by the land layer if there is one, and
+    UNKNOWN if there is not.
+
+    Args:
+        countries (RegionIndex): The country polygons, named by country.
+        marine (RegionIndex): The marine polygons, named by sea or ocean.
+        land (RegionIndex, optional): The land polygons. Defaults to None.
+    """
+    def __init__(self, countries: RegionIndex, marine: RegionIndex, land: RegionIndex = None):
+        self.countries = countries
+        self.marine = marine
+        self.land = land
+        self.grid = None
+        # code -> region name, the negative codes index the last three entries
+        self.names = np.concatenate([countries.names, marine.names, np.array([UNKNOWN, LAND, OCEAN], dtype=object)])
+
+    @property
+    def layers(self):
+        return [layer for layer in (self.countries, self.marine, self.land) if layer is not None]
+
+    def use_grid(self, resolution: float, path: str):
+        """Answer lookups from a rasterized grid of the layers, loaded from `path` or built there on first use."""
+        self.grid = RegionGrid.load(self.layers, resolution, path)
+        return self.grid
+
+    def locate(self, lons, lats):
+        """Return the polygon positions of the points in every layer, through the grid if there is one."""
+        if self.grid is not None:
+            return self.grid.locate(lons, lats)
+        return [layer.locate(lons, lats) for layer in self.layers]
+
+    def lookup(self, lons, lats):
+        """Locate single points or batches of points.
+
+        Args:
+            lons (float | np.ndarray): Longitudes in degrees.
+            lats (float | np.ndarray): Latitudes in degrees, the same shape as lons.
+
+        Returns:
+            Location: For a single point, the surface string and the names (or None). For arrays, object arrays of the
+                shape of lons.
+        """
+        located = self.locate(lons, lats)
+        country, marine = (names_of(layer, found) for layer, found in zip((self.countries, self.marine), located))
+        other = UNKNOWN if self.land is None else np.where(located[2] >= 0, LAND, OCEAN)
+        surface = np.where(marine != None, OCEAN, np.where(country != None, LAND, other)).astype(object)
+        if np.ndim(lons) == 0 and np.ndim(lats) == 0:
+            return Location(surface.item(), country.item(), marine.item())
+        return Location(surface, country, marine)
+
+    def codes(self, lons, lats):
+        """Return one integer region code per point, with the precedence of lookup().
+
+        A country is its position in the country layer, a marine region its position in the marine layer plus the number
+        of countries, anything else OCEAN_CODE, LAND_CODE or UNKNOWN_CODE.
+        """
+        located = self.locate(lons, lats)
+        country, marine = located[0], located[1]
+        if self.land is None:
+            other = UNKNOWN_CODE
+        else:
+            other = np.where(located[2] >= 0, LAND_CODE, OCEAN_CODE)
+        return np.where(marine >= 0, marine + len(self.countries), np.where(country >= 0, country, other))
+
+    def region_names(self, codes):
+        """Return the region name of every code of codes()."""
+        codes = np.asarray(codes)
+        return self.names[np.where(codes >= 0, codes, len(self.names) + codes)]
+
+
+def interpolate_track(lons0, lats0, lons1, lats1, fraction):
+    """Interpolate between two ground track points along the great circle through them, in degrees."""
+    lon0, lat0, lon1, lat1 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lons0, lats0, lons1, lats1))
+    a = np.stack([np.cos(lat0) * np.cos(lon0), np.cos(lat0) * np.sin(lon0), np.sin(lat0)])
+    b = np.stack([np.cos(lat1) * np.cos(lon1), np.cos(lat1) * np.sin(lon1), np.sin(lat1)])
+    v = (1 - fraction) * a + fraction * b # the chord, its direction is on the great circle
+    return np.degrees(np.arctan2(v[1], v[0])), np.degrees(np.arctan2(v[2], np.hypot(v[0], v[1])))
+
+
+def region_timeline(lookup: GeoLookup, times, lons, lats, positions=None, iterations: int = 12):
+    """Turn ground tracks into runs of regions with refined entry and exit times.
+
+    Args:
+        lookup (GeoLookup): The region lookup, with or without a grid.
+        times (np.ndarray): Sample times shared by every track, shape (N,), in any unit, e.g. Julian dates.
+        lons (np.ndarray): Longitudes in degrees, shape (N,) for one track or (S,N) for S tracks.
+        lats (np.ndarray): Latitudes in degrees, the shape of lons.
+        positions (callable, optional): positions(tracks, times) -> (lons, lats) for 1-D arrays of track indices and times,
+            e.g. from SGP4, used to place the bisection points. Defaults to interpolating between the samples.
+        iterations (int, optional): Bisection steps per transition, the time error is the sample step / 2**iterations.
+            Defaults to 12.
+
+    Returns:
+        list: For one track, its Intervals in time order. For (S,N) tracks, one such list per track.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    lons, lats = np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64)
+    single = lons.ndim == 1
+    lons, lats = np.atleast_2d(lons), np.atleast_2d(lats)
+    if not len(times):
+        return [] if single else [[] for _ in range(len(lons))]
+    codes = lookup.codes(lons, lats)
+
+    # every change of region between two samples, over all tracks at once
+    track, step = np.nonzero(codes[:, 1:] != codes[:, :-1])
+    low, high = times[step], times[step + 1]
+    before = codes[track, step]
+    f_low, f_high = np.zeros(len(step)), np.ones(len(step))
+    for _ in range(iterations if len(step) else 0):
+        f_mid = (f_low + f_high) / 2
+        if positions is None:
+            mid_lons, mid_lats = interpolate_track(lons[track, step], lats[track, step], lons[track, step + 1], lats[track, step + 1], f_mid)
+        else:
+            mid_lons, mid_lats = positions(track, low + f_mid * (high - low))
+        same = lookup.codes(mid_lons, mid_lats) == before
+        f_low = np.where(same, f_mid, f_low)
+        f_high = np.where(same, f_high, f_mid)
+    crossing = low + (f_low + f_high) / 2 * (high - low)
+
+    # run-length encode every track, the runs end at the refined crossings. The transitions are in track order, so each
+    # track owns one contiguous slice of them.
+    firsts = lookup.region_names(codes[:, 0]).tolist()
+    regions = lookup.region_names(codes[track, step + 1]).tolist()
+    bounds = np.searchsorted(track, np.arange(len(codes) + 1)).tolist()
+    crossing = crossing.tolist()
+    start, end = times[0].item(), times[-1].item()
+    timelines = []
+    for row in range(len(codes)):
+        first, last = bounds[row], bounds[row + 1]
+        enters = [start] + crossing[first:last]
+        exits = crossing[first:last] + [end]
+        names = [firsts[row]] + regions[first:last]
+        timelines.append([Interval(*run) for run in zip(names, enters, exits)])
+    return timelines[0] if single else timelines
@@ -0,0 +1,196 @@
+'''
+The geodata registry loads the Natural Earth layers on first use instead of at import time, and keeps a binary copy of
+every layer it has read so later runs skip the shapefile parser.
+
+The copy is one .npz file per layer in the geodata cache: the geometries as concatenated WKB with their offsets, the
+bounds of every geometry, the attribute columns as plain arrays and the CRS. It is keyed by the modification time and
+size of the source .shp and .dbf files, so replacing a shapefile rebuilds its copy on the next load. Reading a copy is
+one file read and one vectorized shapely.from_wkb() call. geopandas is only imported to parse a shapefile, or when a
+GeoDataFrame is asked for, e.g. for plotting.
+'''
+
+import hashlib
+import os
+import threading
+import zipfile
+
+import numpy as np
+import shapely
+
+GEODATA_DIR = "src/assets/geodata"
+GEO_CACHE_DIR = "src/data/geo_cache"
+
+# layer name -> shapefile, relative to the geodata directory
+LAYERS = {
+    "ne_10m_admin_0_countries": "Natural_Earth_quick_start/10m_cultural/ne_10m_admin_0_countries.shp",
+    "ne_10m_geography_marine_polys": "ne_10m_geography_marine_polys/ne_10m_geography_marine_polys.shp",
+    "ne_50m_admin_0_countries": "ne_50m_admin_0_countries/ne_50m_admin_0_countries.shp",
+    "ne_50m_physical_land": "ne_50m_physical/ne_50m_land.shp",
+    "ne_50m_physical_ocean": "ne_50m_physical/ne_50m_ocean.shp",
+    "ne_50m_geography_marine_polys": "Natural_Earth_quick_start/50m_physical/ne_50m_geography_marine_polys.shp",
+    "ne_50m_admin_0_boundary_lines_maritime_indicator": "Natural_Earth_quick_start/50m_cultural/ne_50m_admin_0_boundary_lines_maritime_indicator.shp",
+    "ne_10m_admin_0_label_points": "ne_10m_cultural_building_blocks_all/ne_10m_admin_0_label_points.shp",
+}
+
+
+class GeoLayer:
+    """The geometries, bounds and attribute columns of one layer, without geopandas.
+
+    Args:
+        name (str): The layer name, see LAYERS.
+        geometries (np.ndarray): Shapely geometries, shape (N,).
+        bounds (np.ndarray): (minx, miny, maxx, maxy) of every geometry, shape (N,4).
+        columns (dict): Attribute column name -> array of N values.
+        crs (str): The coordinate reference system, e.g. 'EPSG:4326', or None.
+    """
+    def __init__(self, name: str, geometries, bounds, columns: dict, crs: str = None):
+        self.name = name
+        self.geometries = geometries
+        self.bounds = bounds
+        self.columns = columns
+        self.crs = crs
+        self._frame = None
+
+    def __len__(self):
+        return len(self.geometries)
+
+    @property
+    def total_bounds(self):
+        """(minx, miny, maxx, maxy) of the whole layer."""
+        return np.concatenate([self.bounds[:, :2].min(axis=0), self.bounds[:, 2:].max(axis=0)])
+
+    def column(self, name: str):
+        return self.columns[name]
+
+    def frame(self):
+        """Return the layer as a GeoDataFrame, built on first use."""
+        if self._frame is None:
+            import geopandas
+            self._frame = geopandas.GeoDataFrame(self.columns, geometry=self.geometries, crs=self.crs)
+        return self._frame
+
+    @classmethod
+    def from_frame(cls, name: str, frame):
+        """Build a layer from a GeoDataFrame, with text columns as str arrays."""
+        columns = {}
+        for column in frame.columns:
+            if column == frame.geometry.name:
+                continue
+            values = frame[column]
+            columns[column] = values.fillna("").astype(str).to_numpy() if values.dtype == object else values.to_numpy()
+        geometries = np.asarray(frame.geometry.values, dtype=object)
+        crs = frame.crs.to_string() if frame.crs is not None else None
+        return cls(name, geometries, shapely.bounds(geometries), columns, crs)
+
+
+def source_signature(path: str):
+    """Return (modification time in ns, size) of a shapefile and its .dbf, the key of its cached copy."""
+    signature = []
+    for source in (path, os.path.splitext(path)[0] + ".dbf"):
+        if os.path.exists(source):
+            stat = os.stat(source)
+            signature.extend((stat.st_mtime_ns, stat.st_size))
+    return np.array(signature, dtype=np.int64)
+
+
+class GeoLayerRegistry:
+    """Lazily loaded, binary cached geodata layers.
+
+    Args:
+        asset_dir (str, optional): The directory of the shapefiles. Defaults to src/assets/geodata.
+        cache_dir (str, optional): The directory of the binary copies. Defaults to src/data/geo_cache.
+        layers (dict, optional): Layer name -> shapefile relative to asset_dir. Defaults to LAYERS.
+    """
+    def __init__(self, asset_dir: str = GEODATA_DIR, cache_dir: str = GEO_CACHE_DIR, layers: dict = None):
+        self.asset_dir = asset_dir
+        self.cache_dir = cache_dir
+        self.sources = dict(LAYERS if layers is None else layers)
+        self.layers = {} # layer name -> loaded GeoLayer
+        self.lock = threading.Lock()
+
+    def __contains__(self, name: str):
+        return name in self.sources
+
+    def __getitem__(self, name: str):
+        """Return a layer, loading it on first use."""
+        layer = self.layers.get(name)
+        if layer is None:
+            with self.lock:
+                layer = self.layers.get(name)
+                if layer is None:
+                    layer = self.load(name)
+                    self.layers[name] = layer
+        return layer
+
+    def register(self, name: str, path: str):
+        """Add a layer, its shapefile relative to the asset directory."""
+        self.sources[name] = path
+        self.layers.pop(name, None)
+
+    def frame(self, name: str):
+        """Return a layer as a GeoDataFrame."""
+        return self[name].frame()
+
+    def source_path(self, name: str):
+        return os.path.join(self.asset_dir, self.sources[name])
+
+    def cache_path(self, name: str):
+        return os.path.join(self.cache_dir, name + ".npz")
+
+    def signature(self, names):
+        """Return a key that changes whenever the shapefile of any of the layers changes, e.g. for derived caches."""
+        signature = np.concatenate([source_signature(self.source_path(name)) for name in names])
+        return hashlib.sha1(signature.tobytes()).hexdigest()[:8]
+
+    def load(self, name: str):
+        """Read a layer from its cached copy, or from the shapefile, refreshing the copy."""
+        path = self.source_path(name)
+        signature = source_signature(path)
+        layer = self.read_cache(name, signature)
+        if layer is None:
+            layer = self.read_source(name, path)
+            try:
+                self.write_cache(layer, signature)
+            except OSError as e: # the copy only saves time, the layer is still usable
+                print(f"Error occurred while caching geodata layer {name}:", str(e))
+        return layer
+
+    def read_source(self, name: str, path: str):
+        """Parse the shapefile of a layer."""
+        import geopandas
+        return GeoLayer.from_frame(name, geopandas.read_file(path))
+
+    def read_cache(self, name: str, signature):
+        """Return the cached copy of a layer, or None if there is none, it is stale, or it cannot be read."""
+        path = self.cache_path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if not np.array_equal(data["signature"], signature):
+                    return None
+                wkb, offsets = data["wkb"].tobytes(), data["offsets"]
+                geometries = shapely.from_wkb([wkb[start:end] for start, end in zip(offsets[:-1], offsets[1:])])
+                columns = {str(column): data[f"column_{i}"] for i, column in enumerate(data["columns"])}
+                crs = str(data["crs"]) or None
+                return GeoLayer(name, geometries, data["bounds"], columns, crs)
+        except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile, shapely.errors.GEOSException) as e:
+            # a truncated copy or one written by an older layout, the shapefile is read again and the copy rewritten
+            print(f"Error occurred while reading the cached geodata layer {name}, rebuilding it:", str(e))
+            return None
+
+    def write_cache(self, layer: GeoLayer, signature):
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        wkb = shapely.to_wkb(layer.geometries)
+        offsets = np.concatenate([[0], np.cumsum([len(blob) for blob in wkb])]).astype(np.int64)
+        columns = {f"column_{i}": values for i, values in enumerate(layer.columns.values())}
+        path = self.cache_path(layer.name)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            np.savez(
+                file, signature=signature, wkb=np.frombuffer(b"".join(wkb), dtype=np.uint8), offsets=offsets,
+                bounds=layer.bounds, columns=np.array(list(layer.columns), dtype=str), crs=np.array(layer.crs or ""),
+                **columns,
+            )
+        os.replace(temporary, path)
@@ -0,0 +1,211 @@
+'''
+The ingest service downloads whole Celestrak groups (GROUP=stations, GROUP=starlink, ...) in a single request and streams
+them straight into the TLE catalog.
+
+The response is parsed while it is read, whatever its format: TLE (2 or 3 line), CSV or OMM JSON. OMM records are turned
+into TLE lines through sgp4, so the catalog keeps one layout. All element sets of a group go into the catalog in one
+transaction, and the group becomes the set of objects in the latest download, so the catalog also knows which groups
+each object belongs to. Nothing is written per object to disk. Group downloads are conditional on the ETag and
+Last-Modified validators of the previous one, so an unchanged group costs a 304 and no writes.
+'''
+
+import csv
+import io
+import itertools
+import json
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+from sgp4 import omm
+from sgp4.api import Satrec
+from sgp4.exporter import export_tle
+
+from .catalog_service import TLECatalog, parse_tle_lines, record_row
+
+GP_URL = "https://celestrak.org/NORAD/elements/gp.php"
+
+TLE, CSV, JSON = "TLE", "CSV", "JSON"
+
+
+def sniff_format(stream):
+    """Tell TLE, CSV and JSON apart from the first bytes of a buffered binary stream, without consuming them."""
+    head = stream.peek(64)[:64].lstrip(b"\xef\xbb\xbf \t\r\n")
+    if head.startswith(b"["):
+        return JSON
+    if head.startswith(b"OBJECT_NAME") or head.startswith(b'"OBJECT_NAME'):
+        return CSV
+    return TLE
+
+
+def omm_lines(fields):
+    """Convert one OMM record, a dict of CSV strings or JSON values, into (name, line1, line2), or None if it has no TLE form."""
+    satrec = Satrec()
+    try:
+        omm.initialize(satrec, {key: str(value) for key, value in fields.items()})
+        line1, line2 = export_tle(satrec)
+    except (KeyError, ValueError, TypeError) as e:
+        print(f"Skipping OMM record {fields.get('NORAD_CAT_ID')}: {e}")
+        return None
+    return str(fields.get("OBJECT_NAME") or fields["NORAD_CAT_ID"]).strip(), line1, line2
+
+
+def iter_json_array(text, chunk_size: int = 1 << 16):
+    """Yield the items of a top-level JSON array from a text stream, decoding one item at a time as the chunks arrive."""
+    decoder = json.JSONDecoder()
+    buffer, position = "", 0
+    started = False
+    while True:
+        # skip whitespace and separators, reading more when the buffer runs out
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position == len(buffer):
+            chunk = text.read(chunk_size)
+            if not chunk:
+                return
+            buffer, position = chunk, 0
+            continue
+        if not started:
+            if buffer[position] != "[":
+                raise ValueError("Expected a JSON array")
+            started = True
+            position += 1
+            continue
+        if buffer[position] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = text.read(chunk_size)
+            if not chunk:
+                raise
+            buffer, position = buffer[position:] + chunk, 0 # the item continues in the next chunk
+            continue
+        yield item
+        position = end
+        if position > chunk_size: # drop what has been decoded
+            buffer, position = buffer[position:], 0
+
+
+def element_sets(stream):
+    """Yield (name, line1, line2) for every element set of a TLE, CSV or OMM JSON binary stream, as it is read.
+
+    Args:
+        stream (io.BufferedReader): The response or file, opened in binary mode.
+    """
+    stream = stream if hasattr(stream, "peek") else io.BufferedReader(stream)
+    kind = sniff_format(stream)
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline="")
+    if kind == TLE:
+        yield from parse_tle_lines(text) # also skips plain text answers such as 'No GP data found'
+        return
+    records = csv.DictReader(text) if kind == CSV else iter_json_array(text)
+    for fields in records:
+        lines = omm_lines(fields)
+        if lines is not None:
+            yield lines
+
+
+class GroupIngestor:
+    """Downloads Celestrak GP queries and streams them into a TLECatalog.
+
+    Args:
+        catalog (TLECatalog): The catalog to write to.
+        base_url (str, optional): The GP endpoint, e.g. a local server in tests. Defaults to Celestrak.
+        timeout (float, optional): Socket timeout of each request in seconds. Defaults to 30.
+        fmt (str, optional): The FORMAT requested by default, TLE, CSV or JSON. Defaults to TLE, the smallest.
+    """
+    def __init__(self, catalog: TLECatalog, base_url: str = GP_URL, timeout: float = 30, fmt: str = TLE):
+        self.catalog = catalog
+        self.base_url = base_url
+        self.timeout = timeout
+        self.fmt = fmt
+
+    def url(self, fmt: str = None, **query):
+        """Build a GP query URL, e.g. url(GROUP='stations') or url('JSON', NAME='ISS')."""
+        return self.base_url + "?" + urlencode({**query, "FORMAT": fmt or self.fmt})
+
+    def open(self, url: str, conditional: bool = False):
+        """Open a URL, with the validators stored for it when conditional. A 304 raises urllib.error.HTTPError."""
+        headers = {"User-Agent": "space-map"}
+        if conditional:
+            etag, last_modified = self.catalog.validators(url)
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        request = urllib.request.Request(url, headers=headers)
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def fetch(self, fmt: str = None, **query):
+        """Download a GP query and return its (name, line1, line2) element sets, without writing them."""
+        with self.open(self.url(fmt, **query)) as response:
+            return list(element_sets(response))
+
+    def ingest_group(self, group: str, fmt: str = None):
+        """Download a whole group in one request and stream it into the catalog in one transaction.
+
+        Args:
+            group (str): The Celestrak group, e.g. 'stations' or 'starlink', see satellite_families.json.
+            fmt (str, optional): TLE, CSV or JSON. Defaults to the ingestor's format.
+
+        Returns:
+            int: The number of element sets written, 0 if the group was not modified since the last download, or if the
+                download holds no element set, e.g. 'No GP data found'. Either way the members are kept.
+        """
+        group = group.lower()
+        fetched = time.time()
+        source = "celestrak:GROUP=" + group
+        url = self.url(fmt, GROUP=group)
+        try:
+            response = self.open(url, conditional=True)
+        except urllib.error.HTTPError as e:
+            if e.code == 304: # the stored members and element sets are still current
+                return 0
+            raise
+        with response:
+            rows = (record_row(name, line1, line2, source, fetched) for name, line1, line2 in element_sets(response))
+            count = self.write_group(group, rows, fetched)
+        if not count: # an empty answer is not the group's new state, nor something to revalidate against
+            print(f"No element sets in the download of group {group}, keeping its members.")
+            return 0
+        self.catalog.set_validators(url, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return count
+
+    def write_group(self, group: str, rows, fetched: float):
+        """Write a group's rows like TLECatalog.write_group(), unless there are none, which leaves the group untouched."""
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return 0
+        return self.catalog.write_group(group, itertools.chain([first], rows), fetched)
+
+    def ingest_file(self, path: str, group: str = None):
+        """Stream a local TLE, CSV or OMM JSON file into the catalog, optionally as the members of a group.
+
+        The rows are tagged 'ingest:<path>', not 'file:', which marks the files of the legacy directory that
+        CatalogIndex scans.
+        """
+        fetched = time.time()
+        with open(path, "rb") as file:
+            rows = (record_row(name, line1, line2, "ingest:" + path, fetched) for name, line1, line2 in element_sets(file))
+            if group is None:
+                return self.catalog.write(list(rows))
+            return self.write_group(group.lower(), rows, fetched)
+
+    def ingest_families(self, families, fmt: str = None):
+        """Ingest every group of a satellite_families.json list, one request each.
+
+        Returns:
+            dict: group -> number of element sets written, or None if the download failed.
+        """
+        counts = {}
+        for family in families:
+            group = family["query"].lower()
+            try:
+                counts[group] = self.ingest_group(group, fmt)
+            except OSError as e:
+                print(f"Error occurred while ingesting group {group}:", str(e))
+                counts[group] = None
+        return counts
@@ -0,0 +1,363 @@
+'''
+The propagation service runs SGP4 over whole arrays of times in a single call instead of calling satellite.at() once per timestamp.
+
+sgp4's Satrec.sgp4_array() propagates a Julian date array in compiled code, which removes the per-sample Python and Skyfield overhead.
+The raw output is in the TEME frame used by SGP4, so positions are rotated into GCRS with a stack of TEME rotation matrices to
+match what EarthSatellite.at() returns.
+'''
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from sgp4.api import SGP4_ERRORS, Satrec, SatrecArray
+from sgp4.exporter import export_tle
+from skyfield.api import Time
+from skyfield.constants import AU_KM, DAY_S
+from skyfield.positionlib import Geocentric
+from skyfield.sgp4lib import TEME
+
+from .tle_parser import parse_tle, satrecs_from_elements
+
+
+def propagate_TEME(satrec, jd, fr=None):
+    """Propagate a single sgp4 Satrec over an array of UTC Julian dates.
+
+    Args:
+        satrec (Satrec): The sgp4 satellite record, e.g. satellite.model.
+        jd (np.ndarray): Whole part of the UTC Julian dates, shape (N,).
+        fr (np.ndarray, optional): Fractional part of the UTC Julian dates, shape (N,). Defaults to zeros.
+
+    Returns:
+        tuple: (positions (N,3) km, velocities (N,3) km/s, error codes (N,) uint8) in the TEME frame.
+    """
+    jd = np.ascontiguousarray(np.atleast_1d(jd), dtype=np.float64)
+    if fr is None:
+        fr = np.zeros_like(jd)
+    else:
+        fr = np.ascontiguousarray(np.broadcast_to(fr, jd.shape), dtype=np.float64)
+
+    errors, positions, velocities = satrec.sgp4_array(jd, fr)
+    return positions, velocities, errors
+
+
+def to_time(times, ts):
+    """Return a Skyfield Time for either a Time or an array of Terrestrial Time Julian dates."""
+    if isinstance(times, Time):
+        return times
+    return ts.tt_jd(np.asarray(times, dtype=np.float64))
+
+
+def TEME_to_GCRS(positions, velocities, time: Time):
+    """Rotate (N,3) TEME vectors into GCRS using one rotation matrix per time."""
+    R = TEME.rotation_at(time) # GCRS -> TEME, (3,3) or (3,3,N)
+    if R.ndim == 2:
+        return positions @ R, velocities @ R # row vectors times R is R.T applied to each vector
+    positions = np.einsum('jin,nj->ni', R, positions)
+    velocities = np.einsum('jin,nj->ni', R, velocities)
+    return positions, velocities
+
+
+def propagate(satellite, times):
+    """Propagate a satellite over a whole time span with one SGP4 call.
+
+    Args:
+        satellite (EarthSatellite): The satellite to propagate.
+        times (Time | np.ndarray): A Skyfield Time (scalar or array), or an array of Terrestrial Time Julian dates.
+
+    Returns:
+        tuple: (positions (N,3) km, velocities (N,3) km/s, error codes (N,)) in the GCRS frame, the same frame as satellite.at().
+    """
+    time = to_time(times, satellite.epoch.ts)
+
+    # sgp4 expects UTC Julian dates, split into whole and fraction to keep precision
+    jd = np.atleast_1d(time.whole)
+    fr = np.atleast_1d(time.tai_fraction - time._leap_seconds() / DAY_S)
+    positions, velocities, errors = propagate_TEME(satellite.model, jd, fr)
+    positions, velocities = TEME_to_GCRS(positions, velocities, time)
+    return positions, velocities, errors
+
+
+def error_messages(errors):
+    """Translate sgp4 error codes into messages, None wherever propagation succeeded."""
+    return [SGP4_ERRORS[error] if error else None for error in errors]
+
+
+def rotate_stack(R, positions, velocities):
+    """Apply the transpose of a (3,3) or (3,3,N) rotation to (M,N,3) position and velocity stacks."""
+    if R.ndim == 2:
+        return positions @ R, velocities @ R
+    positions = np.einsum('jin,mnj->mni', R, positions)
+    velocities = np.einsum('jin,mnj->mni', R, velocities)
+    return positions, velocities
+
+
+def rotate_positions(R, positions):
+    """Apply the transpose of a (3,3) or (3,3,N) rotation to an (M,N,3) position stack, leaving velocities out."""
+    if R.ndim == 2:
+        return positions @ R
+    return np.einsum('jin,mnj->mni', R, positions)
+
+
+def to_geocentric(positions, velocities, time: Time):
+    """Wrap (N,3) GCRS km and km/s arrays in a single vectorized Skyfield Geocentric position."""
+    if not time.shape: # a scalar time carries a single (3,) vector
+        positions, velocities = positions[0], velocities[0]
+    return Geocentric(positions.T / AU_KM, velocities.T / AU_KM * DAY_S, time, center=399)
+
+
+class ConstellationPropagator:
+    """Propagates many satellites over many times at once by packing their sgp4 records into a single SatrecArray.
+
+    Positions come back as contiguous (M,N,3) arrays, M satellites by N times, so a whole catalog snapshot is one
+    vectorized SGP4 call plus one rotation into GCRS instead of M calls to satellite.at().
+    """
+    def __init__(self, satrecs, names=None, dtype=np.float64, lines=None):
+        self.satrecs = list(satrecs)
+        self.names = list(names) if names is not None else [None] * len(self.satrecs)
+        self.lines = list(lines) if lines is not None else None # (line1, line2) pairs, kept to ship satellites to worker processes
+        self.catalog_ids = [str(satrec.satnum).zfill(5) for satrec in self.satrecs]
+        self.dtype = np.dtype(dtype) # float32 halves the memory of GL vertex buffers
+        self.array = SatrecArray(self.satrecs)
+
+    def __len__(self):
+        return len(self.satrecs)
+
+    @classmethod
+    def from_satellites(cls, satellites, dtype=np.float64):
+        """Build a propagator from a list of Satellite / EarthSatellite objects."""
+        return cls([sat.model for sat in satellites], [sat.name for sat in satellites], dtype)
+
+    @classmethod
+    def from_elements(cls, elements, dtype=np.float64):
+        """Build a propagator from a structured array of parsed element sets, see tle_parser.parse_tle()."""
+        lines = [(line1.decode(), line2.decode()) for line1, line2 in zip(elements["line1"].tolist(), elements["line2"].tolist())]
+        return cls(satrecs_from_elements(elements), elements["name"].tolist(), dtype, lines)
+
+    @classmethod
+    def from_tle_lines(cls, lines, dtype=np.float64):
+        """Build a propagator straight from TLE or 3LE text, skipping Satellite objects entirely.
+
+        Args:
+            lines (list): The lines of one or more name/line1/line2 element sets.
+            dtype (np.dtype, optional): Output dtype, float64 or float32. Defaults to float64.
+
+        Returns:
+            ConstellationPropagator: The propagator for every element set that parsed.
+        """
+        return cls.from_elements(parse_tle("\n".join(line.rstrip() for line in lines)), dtype)
+
+    def tle_lines(self):
+        """Return the (line1, line2) pair of every satellite, exporting them from the sgp4 records if they were not kept."""
+        if self.lines is None:
+            self.lines = [export_tle(satrec) for satrec in self.satrecs]
+        return self.lines
+
+    def propagate_TEME(self, jd, fr=None):
+        """Propagate every satellite over the same array of UTC Julian dates.
+
+        Args:
+            jd (np.ndarray): Whole part of the UTC Julian dates, shape (N,).
+            fr (np.ndarray, optional): Fractional part of the UTC Julian dates, shape (N,). Defaults to zeros.
+
+        Returns:
+            tuple: (positions (M,N,3) km, velocities (M,N,3) km/s, error codes (M,N) uint8) in the TEME frame.
+        """
+        jd = np.ascontiguousarray(np.atleast_1d(jd), dtype=np.float64)
+        if fr is None:
+            fr = np.zeros_like(jd)
+        else:
+            fr = np.ascontiguousarray(np.broadcast_to(fr, jd.shape), dtype=np.float64)
+
+        errors, positions, velocities = self.array.sgp4(jd, fr)
+        return positions, velocities, errors
+
+    def propagate(self, times, ts=None):
+        """Propagate every satellite over a Time array in the GCRS frame, the same frame as satellite.at().
+
+        Args:
+            times (Time | np.ndarray): A Skyfield Time (scalar or array), or an array of Terrestrial Time Julian dates.
+            ts (Timescale, optional): Needed only when Julian dates are passed instead of a Time.
+
+        Returns:
+            tuple: (positions (M,N,3) km, velocities (M,N,3) km/s, error codes (M,N) uint8) as contiguous arrays of self.dtype.
+        """
+        time = to_time(times, ts)
+        jd = np.atleast_1d(time.whole)
+        fr = np.atleast_1d(time.tai_fraction - time._leap_seconds() / DAY_S)
+        positions, velocities, errors = self.propagate_TEME(jd, fr)
+
+        R = TEME.rotation_at(time) # one GCRS -> TEME rotation per time, shared by every satellite
+        positions, velocities = rotate_stack(R, positions, velocities)
+
+        positions = np.ascontiguousarray(positions, dtype=self.dtype)
+        velocities = np.ascontiguousarray(velocities, dtype=self.dtype)
+        return positions, velocities, errors
+
+    def propagate_positions(self, times, ts=None):
+        """Propagate every satellite like propagate(), but only rotate and convert the positions.
+
+        Returns:
+            tuple: (positions (M,N,3) km, error codes (M,N) uint8), positions as a contiguous array of self.dtype.
+        """
+        time = to_time(times, ts)
+        jd = np.atleast_1d(time.whole)
+        fr = np.atleast_1d(time.tai_fraction - time._leap_seconds() / DAY_S)
+        positions, _, errors = self.propagate_TEME(jd, fr)
+        positions = rotate_positions(TEME.rotation_at(time), positions)
+        return np.ascontiguousarray(positions, dtype=self.dtype), errors
+
+    def snapshot(self, time: Time):
+        """Return every satellite's position at a single time, e.g. once per frame.
+
+        Returns:
+            tuple: (positions (M,3) km, error codes (M,) uint8). Failed satellites have NaN positions.
+        """
+        positions, errors = self.propagate_positions(time)
+        return positions[:, 0], errors[:, 0]
+
+    @staticmethod
+    def satellite_errors(errors):
+        """Collapse (M,N) error codes into one code per satellite, the first non-zero code along its time span."""
+        errors = np.asarray(errors)
+        first = np.argmax(errors != 0, axis=1)
+        return errors[np.arange(errors.shape[0]), first]
+
+
+# the element sets of the worker's pool and their parsed shards, set up once per worker by _init_worker
+_worker_lines = None
+_worker_shards = {} # (start, stop) -> SatrecArray
+
+
+def _init_worker(lines):
+    """Worker initializer: keep the (line1, line2) pairs of the constellation, shards are parsed on first use."""
+    global _worker_lines
+    _worker_lines = lines
+    _worker_shards.clear()
+
+
+def _shard_satrecs(start, stop):
+    satrecs = _worker_shards.get((start, stop))
+    if satrecs is None:
+        satrecs = SatrecArray([Satrec.twoline2rv(line1, line2) for line1, line2 in _worker_lines[start:stop]])
+        _worker_shards[(start, stop)] = satrecs
+    return satrecs
+
+
+def _propagate_shard(start, stop, jd, fr, R, buffers, shape, dtype):
+    """Worker entry point: propagate one contiguous shard of satellites over one time chunk into the shared buffers."""
+    errors, positions, velocities = _shard_satrecs(start, stop).sgp4(jd, fr)
+    positions, velocities = rotate_stack(R, positions, velocities)
+
+    blocks = [SharedMemory(name=name) for name in buffers]
+    try:
+        np.ndarray(shape + (3,), dtype, blocks[0].buf)[start:stop] = positions
+        np.ndarray(shape + (3,), dtype, blocks[1].buf)[start:stop] = velocities
+        np.ndarray(shape, np.uint8, blocks[2].buf)[start:stop] = errors
+    finally:
+        for block in blocks:
+            block.close()
+    return start, stop
+
+
+class PropagationPool:
+    """Opt-in process pool that shards a constellation across CPU cores.
+
+    Each worker propagates a contiguous block of satellites and writes straight into shared memory, so results are
+    never pickled back to the parent and always come out in the constellation's satellite order. Long time spans are
+    propagated in chunks of at most `chunk_bytes` of results, which chunks() hands out one at a time, so a caller that
+    streams them somewhere, e.g. to disk, never holds the whole span.
+
+    The workers receive the element sets of a constellation once, when they start, and parse each shard once. The pool
+    restarts its workers when it is given another constellation. They are started with the spawn method, forking a
+    process that runs Qt and other threads is not safe.
+    """
+    def __init__(self, max_workers: int = None, shards_per_worker: int = 4, chunk_bytes: int = 64 * 1024 * 1024):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.shards_per_worker = shards_per_worker # more shards than workers keeps every core busy until the end
+        self.chunk_bytes = chunk_bytes # bound of the results of one time chunk
+        self.executor = None
+        self.lines = None # the element sets the workers were started with
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def start(self, lines):
+        if self.executor is not None and self.lines != lines:
+            self.shutdown()
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=_init_worker, initargs=(lines,))
+            self.lines = lines
+        return self.executor
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+            self.lines = None
+
+    def chunks(self, constellation: ConstellationPropagator, times: Time):
+        """Propagate every satellite of a constellation over a Time array across the worker processes, chunk by chunk.
+
+        Args:
+            constellation (ConstellationPropagator): The satellites to propagate.
+            times (Time): A Skyfield Time, scalar or array.
+
+        Yields:
+            tuple: (first, last, positions (M,T,3) km, velocities (M,T,3) km/s, error codes (M,T) uint8) in GCRS for the
+            times first:last, T = last - first. Together the chunks equal constellation.propagate(times).
+        """
+        lines = constellation.tle_lines()
+        executor = self.start(lines)
+        jd = np.atleast_1d(times.whole).astype(np.float64)
+        fr = np.atleast_1d(times.tai_fraction - times._leap_seconds() / DAY_S).astype(np.float64)
+        R = TEME.rotation_at(times)
+        dtype = constellation.dtype
+        count = len(jd)
+
+        # the number of times whose results fit into chunk_bytes, at least one
+        step = max(1, min(count, self.chunk_bytes // max(1, len(lines) * (6 * dtype.itemsize + 1))))
+        sizes = [len(lines) * step * 3 * dtype.itemsize] * 2 + [len(lines) * step]
+        blocks = [SharedMemory(create=True, size=max(size, 1)) for size in sizes]
+        try:
+            shard = max(1, -(-len(lines) // (self.max_workers * self.shards_per_worker)))
+            for first in range(0, count, step):
+                last = min(first + step, count)
+                shape = (len(lines), last - first)
+                R_chunk = R if R.ndim == 2 else np.ascontiguousarray(R[:, :, first:last])
+                futures = [
+                    executor.submit(_propagate_shard, start, min(start + shard, len(lines)), jd[first:last], fr[first:last],
+                                    R_chunk, [block.name for block in blocks], shape, dtype)
+                    for start in range(0, len(lines), shard)
+                ]
+                for future in futures:
+                    future.result() # re-raise any worker error
+
+                # copied out, the blocks are reused by the next chunk
+                yield (first, last, np.ndarray(shape + (3,), dtype, blocks[0].buf).copy(),
+                       np.ndarray(shape + (3,), dtype, blocks[1].buf).copy(), np.ndarray(shape, np.uint8, blocks[2].buf).copy())
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    def propagate(self, constellation: ConstellationPropagator, times: Time):
+        """Propagate like chunks(), but gather the chunks into whole arrays, for spans that fit in memory.
+
+        Returns:
+            tuple: (positions (M,N,3) km, velocities (M,N,3) km/s, error codes (M,N) uint8) in GCRS, identical to
+            constellation.propagate(times).
+        """
+        count = len(np.atleast_1d(times.whole))
+        positions = np.empty((len(constellation), count, 3), constellation.dtype)
+        velocities = np.empty((len(constellation), count, 3), constellation.dtype)
+        errors = np.empty((len(constellation), count), np.uint8)
+        for first, last, chunk_positions, chunk_velocities, chunk_errors in self.chunks(constellation, times):
+            positions[:, first:last], velocities[:, first:last], errors[:, first:last] = chunk_positions, chunk_velocities, chunk_errors
+        return positions, velocities, errors
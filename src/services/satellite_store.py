@@ -0,0 +1,207 @@
+'''
+The satellite store keeps many satellites as rows of one compact structured array of orbital elements.
+
+A Skyfield EarthSatellite carries an sgp4 Satrec of about a kilobyte, an epoch Time and an instance dictionary, and all of
+it is built at load time. A store row holds only the elements of a satellite (120 bytes) and its name as packed UTF-8
+bytes, about 150 bytes in all, and a SatelliteRecord is a two slot view (store, row) created on demand. Everything catalog-wide (epoch checks, SGP4 propagation
+of the whole set) works straight on the store's columns, and the Skyfield object of a satellite is only built the first
+time a Skyfield-specific API such as at() or find_events() is used on it.
+'''
+
+import numpy as np
+from numpy.lib import recfunctions
+from sgp4.exporter import export_tle
+from skyfield.api import EarthSatellite, Time
+from skyfield.constants import DAY_S
+
+from .propagation_service import ConstellationPropagator
+from .time_service import get_timescale
+from .tle_parser import ELEMENTS_DTYPE, parse_tle, read_tle_file, satrecs_from_elements
+
+# the element columns kept per satellite, the text lines are not kept and can be exported again from the elements, and the
+# epoch is the sum of its two parts
+STORE_FIELDS = [field for field in ELEMENTS_DTYPE.names if field not in ("name", "epoch", "checksum_ok", "line1", "line2")]
+# the text columns as ASCII bytes instead of 4 byte unicode characters
+STORE_DTYPE = np.dtype([(field, {"classification": "S1", "intldesg": "S8"}.get(field, ELEMENTS_DTYPE[field])) for field in STORE_FIELDS])
+
+
+def utc_jd(time):
+    """Return the Julian date of a datetime (naive means local time) or of a Time, which is read as UT1, within a second of UTC."""
+    if isinstance(time, Time):
+        return time.ut1
+    return time.timestamp() / DAY_S + 2440587.5 # Unix epoch
+
+
+class SatelliteRecord:
+    """Lightweight view of one satellite in a SatelliteStore.
+
+    Attributes that are not defined here are forwarded to the Skyfield satellite, which is materialized on first access, so
+    a record can be passed wherever an EarthSatellite is expected.
+    """
+    __slots__ = ("store", "row")
+
+    def __init__(self, store, row: int):
+        self.store = store
+        self.row = row # index of the satellite in store.elements
+
+    def __getattr__(self, name):
+        if name in SatelliteRecord.__slots__: # not set yet, avoid recursing
+            raise AttributeError(name)
+        return getattr(self.satellite, name)
+
+    def __eq__(self, other):
+        return isinstance(other, SatelliteRecord) and other.store is self.store and other.row == self.row
+
+    def __hash__(self):
+        return hash((id(self.store), self.row))
+
+    def __repr__(self):
+        return f"SatelliteRecord({self.catalog_id}, {self.name!r})"
+
+    @property
+    def norad_id(self):
+        return int(self.store.elements["norad_id"][self.row])
+
+    @property
+    def catalog_id(self):
+        """The zero padded catalog number, e.g. '25544'."""
+        return f"{self.norad_id:05d}"
+
+    @property
+    def name(self):
+        return self.store.name_of(self.row)
+
+    @property
+    def elements(self):
+        """The element set of this satellite, one row of the store."""
+        return self.store.elements[self.row]
+
+    @property
+    def satellite(self):
+        """The Skyfield satellite of this record, built on first use and kept by the store until released."""
+        return self.store.materialize(self.row)
+
+    def is_materialized(self):
+        return self.row in self.store.satellites
+
+    def release(self):
+        """Drop the materialized Skyfield satellite, e.g. once a view stops tracking it."""
+        self.store.satellites.pop(self.row, None)
+
+    def satrec(self):
+        """Initialize a fresh sgp4 Satrec from the elements, without building the Skyfield satellite."""
+        return self.store.satrecs([self.row])[0]
+
+    def lines(self):
+        """Return (line1, line2) of the element set, exported from the elements."""
+        return export_tle(self.satrec())
+
+    def epoch_valid_at(self, time, margin: int = 14):
+        """Check if the epoch is within `margin` days of a datetime or Time, without materializing the satellite."""
+        return bool(self.store.epoch_valid_at(time, margin, rows=[self.row])[0])
+
+
+class SatelliteStore:
+    """Compact array of orbital elements shared by the SatelliteRecords of a catalog, a category or a search result.
+
+    Args:
+        elements (np.ndarray): Parsed element sets, see tle_parser.parse_tle(). Only the STORE_FIELDS columns are kept, packed
+            into STORE_DTYPE.
+        names (list, optional): Full satellite names, when they can be longer than the 24 characters of the TLE format.
+            Defaults to the names in the elements.
+        factory (callable, optional): Builds the Skyfield satellite of a SatelliteRecord. Defaults to a plain EarthSatellite.
+        timescale (Timescale, optional): Timescale of the materialized satellites. Defaults to the shared one.
+    """
+    def __init__(self, elements, names=None, factory=None, timescale=None):
+        self.elements = recfunctions.repack_fields(elements[STORE_FIELDS]).astype(STORE_DTYPE)
+        names = elements["name"].tolist() if names is None else names
+        self.names = np.array([name.encode() for name in names], dtype=bytes) # fixed width UTF-8, not one str object per name
+        self.ts = timescale if timescale is not None else get_timescale()
+        self.factory = factory
+        self.order = np.argsort(self.elements["norad_id"], kind="stable").astype(np.int32) # rows sorted by catalog number, for lookups
+        self.satellites = {} # row -> materialized Skyfield satellite
+
+    def __len__(self):
+        return len(self.elements)
+
+    def __iter__(self):
+        return (SatelliteRecord(self, row) for row in range(len(self.elements)))
+
+    def __contains__(self, catalog_id):
+        return self.row_of(catalog_id) is not None
+
+    def __getitem__(self, catalog_id):
+        """Return the SatelliteRecord of a catalog number."""
+        record = self.get(catalog_id)
+        if record is None:
+            raise KeyError(catalog_id)
+        return record
+
+    def get(self, catalog_id):
+        """Return the SatelliteRecord of a catalog number, or None."""
+        row = self.row_of(catalog_id)
+        return None if row is None else SatelliteRecord(self, row)
+
+    def row_of(self, catalog_id):
+        """Return the row of a catalog number with a binary search, or None."""
+        key = int(catalog_id)
+        ids = self.elements["norad_id"]
+        i = np.searchsorted(ids, key, sorter=self.order)
+        if i < len(ids) and ids[self.order[i]] == key:
+            return int(self.order[i])
+        return None
+
+    @classmethod
+    def from_tle(cls, data, factory=None, timescale=None):
+        """Build a store from TLE or 3LE text or bytes."""
+        return cls(parse_tle(data), factory=factory, timescale=timescale)
+
+    @classmethod
+    def from_file(cls, path: str, factory=None, timescale=None):
+        """Build a store from a TLE or 3LE file."""
+        return cls(read_tle_file(path), factory=factory, timescale=timescale)
+
+    @classmethod
+    def from_catalog_records(cls, records, factory=None, timescale=None):
+        """Build a store from TLECatalog records, keeping their full names."""
+        elements = parse_tle("\n".join(f"{record.line1}\n{record.line2}" for record in records))
+        names = [record.name for record in records] if len(elements) == len(records) else None # a set failed to parse
+        return cls(elements, names, factory, timescale)
+
+    def name_of(self, row: int):
+        return self.names[row].decode()
+
+    def materialize(self, row: int):
+        """Return the Skyfield satellite of a row, building it with the store's factory on first use."""
+        satellite = self.satellites.get(row)
+        if satellite is None:
+            record = SatelliteRecord(self, row)
+            if self.factory is not None:
+                satellite = self.factory(record)
+            else:
+                satellite = EarthSatellite.from_satrec(record.satrec(), self.ts)
+                satellite.name = record.name
+            self.satellites[row] = satellite
+        return satellite
+
+    def satrecs(self, rows=None):
+        """Initialize sgp4 records for some or all rows, without materializing Skyfield satellites."""
+        return satrecs_from_elements(self.elements if rows is None else self.elements[rows])
+
+    def constellation(self, rows=None, dtype=np.float64):
+        """Return a ConstellationPropagator over some or all rows, for batch SGP4 propagation."""
+        names = self.names if rows is None else self.names[rows]
+        return ConstellationPropagator(self.satrecs(rows), np.char.decode(names).tolist(), dtype)
+
+    def epochs(self, rows=None):
+        """Return the epochs of some or all rows as UTC Julian dates."""
+        elements = self.elements if rows is None else self.elements[rows]
+        return elements["jdsatepoch"] + elements["jdsatepochF"]
+
+    def epoch_ages(self, time, rows=None):
+        """Return the age in days of the element sets at a datetime or Time, negative for epochs in the future."""
+        return utc_jd(time) - self.epochs(rows)
+
+    def epoch_valid_at(self, time, margin: float = 14, rows=None):
+        """Check for every row (or the given rows) whether its epoch is within `margin` days of a datetime or Time."""
+        return np.abs(self.epoch_ages(time, rows)) <= margin
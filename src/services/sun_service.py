@@ -0,0 +1,190 @@
+'''
+The sun service loads the DE421 planetary ephemeris once and serves the geocentric Sun vector from a coarse interpolated
+table, so shadow tests for many satellites and times never go back to Skyfield point by point.
+
+Eclipses use the conical shadow model. Seen from the satellite, the Sun and the Earth are discs of apparent radii
+asin(R_sun / |sun - r|) and asin(R_earth / |r|), separated by the angle between the two directions. The satellite is in the
+umbra when the Earth disc covers the whole solar disc, in the penumbra when it covers part of it, and sunlit otherwise.
+'''
+
+from math import ceil, log2
+
+import numpy as np
+from skyfield.api import Time, load
+from skyfield.constants import DAY_S, ERAD
+
+from .ephemeris_service import hermite
+from .propagation_service import propagate
+
+SUN_RADIUS = 696000.0 # km
+EARTH_RADIUS = ERAD / 1000 # km, equatorial
+
+# shadow states returned by SunService.shadow()
+UMBRA, PENUMBRA, SUNLIT = 0, 1, 2
+
+# event codes returned by SunService.find_eclipses(), numbered in the order they occur during one eclipse
+PENUMBRA_ENTRY, UMBRA_ENTRY, UMBRA_EXIT, PENUMBRA_EXIT = 0, 1, 2, 3
+EVENT_NAMES = ("penumbra entry", "umbra entry", "umbra exit", "penumbra exit")
+
+_ephemeris = None
+
+
+def get_ephemeris():
+    """Return the process-wide DE421 ephemeris, loading it on first use."""
+    global _ephemeris
+    if _ephemeris is None:
+        _ephemeris = load('de421.bsp')
+    return _ephemeris
+
+
+class SunService:
+    """Interpolated geocentric Sun positions and vectorized Earth shadow tests.
+
+    The Sun is tabulated on a global Terrestrial Time grid of `step` seconds and interpolated with cubic Hermite polynomials.
+    The geocentric Sun moves about a degree per day, so an hourly table is accurate to well under a kilometre, which is
+    far below anything the shadow geometry can resolve. The table is rebuilt around the requested times, `behind` seconds
+    before and `ahead` seconds after, whenever a request falls outside it.
+    """
+    def __init__(self, timescale, ephemeris=None, step: float = 3600, behind: float = 86400, ahead: float = 2 * 86400):
+        self.ts = timescale
+        self.ephemeris = ephemeris if ephemeris is not None else get_ephemeris()
+        self.sun = self.ephemeris['sun'] - self.ephemeris['earth'] # geometric geocentric Sun, like Skyfield's is_sunlit()
+        self.step = step # grid step in seconds
+        self.step_days = step / DAY_S
+        self.nodes_behind = max(1, ceil(behind / step))
+        self.nodes_ahead = max(2, ceil(ahead / step))
+        self.first_node = 0
+        self.positions = np.empty((0, 3))
+        self.velocities = np.empty((0, 3))
+
+    def cover(self, tt):
+        """Rebuild the table if any of the Terrestrial Time Julian dates `tt` falls outside it."""
+        first = int(np.floor(np.min(tt) / self.step_days))
+        last = int(np.floor(np.max(tt) / self.step_days))
+        count = len(self.positions)
+        if count and self.first_node <= first and last + 1 <= self.first_node + count - 1:
+            return
+        new_first = first - self.nodes_behind
+        new_last = last + self.nodes_ahead # inclusive
+        times = self.ts.tt_jd(np.arange(new_first, new_last + 1, dtype=np.float64) * self.step_days)
+        sun = self.sun.at(times)
+        self.positions = sun.position.km.T
+        self.velocities = sun.velocity.km_per_s.T
+        self.first_node = new_first
+
+    def position(self, tt):
+        """Return the geocentric GCRS Sun vector in km at Terrestrial Time Julian dates `tt`, shaped like tt plus a trailing 3."""
+        tt = np.asarray(tt, dtype=np.float64)
+        flat = tt.ravel()
+        self.cover(flat)
+
+        grid = flat / self.step_days
+        node = np.floor(grid).astype(np.int64)
+        s = (grid - node)[:, None] # position inside the step, 0..1
+        positions, velocities = hermite(self.positions, self.velocities, node - self.first_node, s, self.step)
+        return positions.reshape(tt.shape + (3,))
+
+    def cone(self, positions, tt):
+        """Return the shadow cone angles seen from each satellite position.
+
+        Args:
+            positions (np.ndarray): GCRS satellite positions in km, shaped (..., 3), e.g. (3,), (N,3) or (M,N,3).
+            tt (float | np.ndarray): Terrestrial Time Julian dates broadcastable against positions.shape[:-1].
+
+        Returns:
+            tuple: (a, b, c) in radians, the apparent Sun radius, the apparent Earth radius and the angle between the
+            centres of the two discs, each shaped like positions.shape[:-1].
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        to_sun = self.position(tt) - positions
+        sun_distance = np.linalg.norm(to_sun, axis=-1)
+        earth_distance = np.linalg.norm(positions, axis=-1)
+
+        a = np.arcsin(np.minimum(SUN_RADIUS / sun_distance, 1.0))
+        b = np.arcsin(np.minimum(EARTH_RADIUS / earth_distance, 1.0))
+        cos_c = np.sum(-positions * to_sun, axis=-1) / (earth_distance * sun_distance)
+        c = np.arccos(np.clip(cos_c, -1.0, 1.0))
+        return a, b, c
+
+    def illumination(self, positions, tt):
+        """Return the fraction of the solar disc visible from each satellite position, 0 in the umbra and 1 in full sunlight.
+
+        The partially covered case uses the overlap area of two circular discs (Montenbruck & Gill, Satellite Orbits, 3.4.2).
+        """
+        a, b, c = self.cone(positions, tt)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x = (c * c + a * a - b * b) / (2 * c)
+            y = np.sqrt(np.maximum(a * a - x * x, 0.0))
+            overlap = a * a * np.arccos(np.clip(x / a, -1.0, 1.0)) + b * b * np.arccos(np.clip((c - x) / b, -1.0, 1.0)) - c * y
+            fraction = 1 - overlap / (np.pi * a * a)
+
+        fraction = np.where(c <= a - b, 1 - (b * b) / (a * a), fraction) # Earth disc entirely inside the solar disc
+        fraction = np.where(c <= b - a, 0.0, fraction) # umbra
+        fraction = np.where(c >= a + b, 1.0, fraction) # discs do not overlap
+        return fraction
+
+    def shadow(self, positions, tt):
+        """Return UMBRA, PENUMBRA or SUNLIT for each satellite position as an int8 array."""
+        a, b, c = self.cone(positions, tt)
+        return np.where(c >= a + b, SUNLIT, np.where(c <= b - a, UMBRA, PENUMBRA)).astype(np.int8)
+
+    def is_sunlit(self, positions, tt):
+        """Return whether any part of the Sun is visible from each satellite position."""
+        a, b, c = self.cone(positions, tt)
+        return c > b - a
+
+    def find_eclipses(self, satellite, start: Time, end: Time, step: float = 30, tolerance: float = 0.01):
+        """Find the times a satellite enters and leaves the penumbra and the umbra between start and end.
+
+        The orbit is sampled every `step` seconds with one batch SGP4 call, and every boundary crossing found between two
+        samples is refined by bisection down to `tolerance` seconds. All crossings are bisected together, so each
+        refinement round is again a single batch call. Passages shorter than `step` can be missed.
+
+        Args:
+            satellite (EarthSatellite): The satellite to search.
+            start (Time): Start of the search window.
+            end (Time): End of the search window.
+            step (float, optional): Sampling step in seconds. Defaults to 30.
+            tolerance (float, optional): Accuracy of the returned times in seconds. Defaults to 0.01.
+
+        Returns:
+            tuple: (times, events) like EarthSatellite.find_events(), a Time array and an array of event codes
+            (PENUMBRA_ENTRY, UMBRA_ENTRY, UMBRA_EXIT or PENUMBRA_EXIT) in chronological order.
+        """
+        ts = start.ts
+        duration = (end.tt - start.tt) * DAY_S
+        seconds = np.append(np.arange(0, duration, step), duration)
+
+        def margins(seconds):
+            """Signed distance in radians from the penumbra and the umbra boundaries, positive outside each cone."""
+            times = ts.tt_jd(start.whole, start.tt_fraction + seconds / DAY_S)
+            positions, velocities, errors = propagate(satellite, times)
+            a, b, c = self.cone(positions, times.tt)
+            return c - (a + b), c - (b - a)
+
+        penumbra, umbra = margins(seconds)
+        lows, highs, outside, boundary = [], [], [], []
+        for kind, margin in enumerate((penumbra, umbra)):
+            above = margin > 0
+            crossings = np.flatnonzero(above[:-1] != above[1:])
+            lows.append(seconds[crossings])
+            highs.append(seconds[crossings + 1])
+            outside.append(above[crossings]) # outside the cone before the crossing means the crossing is an entry
+            boundary.append(np.full(len(crossings), kind))
+        low, high = np.concatenate(lows), np.concatenate(highs)
+        entry, boundary = np.concatenate(outside), np.concatenate(boundary)
+
+        if len(low):
+            for _ in range(max(1, ceil(log2(step / tolerance)))):
+                middle = (low + high) / 2
+                penumbra, umbra = margins(middle)
+                above = np.where(boundary == 0, penumbra, umbra) > 0
+                moved = above == entry # still on the same side as the low end
+                low = np.where(moved, middle, low)
+                high = np.where(moved, high, middle)
+
+        seconds = (low + high) / 2
+        events = np.where(boundary == 0, np.where(entry, PENUMBRA_ENTRY, PENUMBRA_EXIT), np.where(entry, UMBRA_ENTRY, UMBRA_EXIT))
+        order = np.lexsort((events, seconds))
+        times = ts.tt_jd(start.whole, start.tt_fraction + seconds[order] / DAY_S)
+        return times, events[order].astype(np.int8)
@@ -0,0 +1,100 @@
+'''
+The time service owns the application's single Skyfield timescale and builds vectorized Time arrays.
+
+Loading a timescale parses the leap second and Delta T tables, so it is done once per process and shared. Time grids are
+built with a single tt_jd() call from (start, step, count) instead of one Time object per sample, and the grids that are
+requested over and over (orbit vertices from a TLE epoch, ground path nodes on the global grid) are memoized so that
+Skyfield's lazily computed attributes (UT1, GMST, the precession-nutation matrices) are also reused between calls.
+'''
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from skyfield.api import Time, load
+from skyfield.constants import DAY_S
+
+_timescale = None
+
+
+def get_timescale():
+    """Return the process-wide timescale, loading it on first use."""
+    global _timescale
+    if _timescale is None:
+        _timescale = load.timescale()
+    return _timescale
+
+
+class TimeService:
+    """Shared timescale plus a memoizing factory for Time arrays.
+
+    Every attribute of the wrapped Skyfield Timescale (now(), utc(), tt_jd(), ...) is available directly on the service,
+    so it can be used anywhere a Timescale is expected.
+    """
+    def __init__(self, timescale=None, max_grids: int = 32):
+        self.ts = timescale if timescale is not None else get_timescale()
+        self.max_grids = max_grids
+        self.grids = OrderedDict() # key -> Time, least recently used first
+        self.lock = threading.Lock() # the GUI thread and the thread pool share the cache
+
+    def __getattr__(self, name):
+        if name == "ts": # not set yet, avoid recursing
+            raise AttributeError(name)
+        return getattr(self.ts, name)
+
+    def memoize(self, key, build):
+        """Return the cached Time for key, building and caching it with build() if it is missing."""
+        with self.lock:
+            times = self.grids.get(key)
+            if times is not None:
+                self.grids.move_to_end(key)
+                return times
+        times = build() # outside the lock, two threads may build the same grid but never block each other
+        with self.lock:
+            self.grids[key] = times
+            self.grids.move_to_end(key)
+            while len(self.grids) > self.max_grids:
+                self.grids.popitem(last=False)
+        return times
+
+    def grid(self, start: Time, step: float, count: int, first: int = 0, memoize: bool = True):
+        """Build `count` times spaced `step` seconds apart, starting `first` steps after `start`.
+
+        Args:
+            start (Time): The reference time.
+            step (float): Seconds between samples.
+            count (int): Number of samples.
+            first (int, optional): Index of the first sample relative to start, negative to start in the past. Defaults to 0.
+            memoize (bool, optional): Cache the grid. Pass False for a start that is never repeated, e.g. now(), so it
+                does not evict the grids that are reused. Defaults to True.
+
+        Returns:
+            Time: A Time array of shape (count,).
+        """
+        def build():
+            # offsets are built from integer sample indices so long grids do not accumulate rounding drift
+            offsets = np.arange(first, first + count, dtype=np.float64) * (step / DAY_S)
+            return self.ts.tt_jd(start.whole, start.tt_fraction + offsets)
+
+        if not memoize:
+            return build()
+        key = ("grid", start.whole, start.tt_fraction, step, count, first)
+        return self.memoize(key, build)
+
+    def span(self, start: Time, duration: float, count: int):
+        """Build `count` evenly spaced times covering `duration` seconds from `start`, both ends included."""
+        step = duration / (count - 1) if count > 1 else 0.0
+        return self.grid(start, step, count)
+
+    def nodes(self, first: int, last: int, step: float):
+        """Build the times of nodes first..last (inclusive) on the global Terrestrial Time grid of `step` seconds."""
+        key = ("nodes", first, last, step)
+        return self.memoize(key, lambda: self.ts.tt_jd(np.arange(first, last + 1, dtype=np.float64) * (step / DAY_S)))
+
+    def offsets(self, start: Time, seconds):
+        """Build a Time array at arbitrary offsets in seconds from `start`, without memoizing."""
+        seconds = np.asarray(seconds, dtype=np.float64)
+        return self.ts.tt_jd(start.whole, start.tt_fraction + seconds / DAY_S)
+
+    def clear(self):
+        self.grids.clear()
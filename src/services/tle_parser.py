@@ -0,0 +1,238 @@
+'''
+The TLE parser reads a whole multi-object TLE or 3LE file into a NumPy structured array in one pass.
+
+Every line is padded to the 69 columns of the format and the file becomes one (N,69) character matrix, so each field is
+read for all objects at once by slicing its fixed columns, including the implied-decimal fields (eccentricity, B*, the
+second derivative of the mean motion), the Alpha-5 catalog numbers and the checksums. Nothing is built per object until
+sgp4 records are requested, and those are initialized straight from the parsed elements with Satrec.sgp4init().
+
+Element units follow the TLE format: angles in degrees, mean motion in revolutions per day, its first and second
+derivatives in revolutions per day squared and cubed, and B* in inverse Earth radii.
+'''
+
+import numpy as np
+from sgp4.api import WGS72, Satrec
+
+TLE_WIDTH = 69
+
+ELEMENTS_DTYPE = np.dtype([
+    ("norad_id", "i4"),
+    ("name", "U24"),
+    ("classification", "U1"),
+    ("intldesg", "U8"),
+    ("epoch", "f8"), # UTC Julian date
+    ("jdsatepoch", "f8"), # whole and fractional part of the epoch, exactly as sgp4 keeps them
+    ("jdsatepochF", "f8"),
+    ("epochyr", "i2"),
+    ("epochdays", "f8"),
+    ("ndot", "f8"),
+    ("nddot", "f8"),
+    ("bstar", "f8"),
+    ("ephtype", "i1"),
+    ("elnum", "i4"),
+    ("inclo", "f8"),
+    ("nodeo", "f8"),
+    ("ecco", "f8"),
+    ("argpo", "f8"),
+    ("mo", "f8"),
+    ("no_kozai", "f8"),
+    ("revnum", "i4"),
+    ("checksum_ok", "?"), # both lines pass the modulo 10 checksum
+    ("line1", "S69"),
+    ("line2", "S69"),
+])
+
+# Alpha-5 catalog numbers replace the leading digit with a letter worth 10..33, skipping I and O
+ALPHA5 = np.zeros(256, dtype=np.int32)
+ALPHA5[ord("0"):ord("9") + 1] = np.arange(10)
+ALPHA5[[ord(letter) for letter in "ABCDEFGHJKLMNPQRSTUVWXYZ"]] = np.arange(10, 34)
+
+XPDOTP = 1440.0 / (2.0 * np.pi) # revolutions per day to radians per minute
+DEG2RAD = np.pi / 180.0
+
+POWERS_OF_TEN = np.array([10.0 ** exponent for exponent in range(-9, 10)]) # exact, unlike np.power on negative exponents
+
+
+def columns(chars, first: int, last: int):
+    """Return columns first..last-1 of an (N,69) character matrix as an (N,) array of byte strings."""
+    return np.ascontiguousarray(chars[:, first:last]).view(f"S{last - first}").ravel()
+
+
+def fixed_number(chars, first: int, last: int, point: int = None):
+    """Read a fixed-width decimal field of every row, e.g. ' 51.6367', '-.00001234' or ' 12345', as float64.
+
+    Like sgp4, fields are read from the columns of the TLE specification, so the decimal point sits in the same column
+    of every row. Its digits are weighted into one integer mantissa with a single matrix product and divided once by the
+    power of ten of the decimals, which rounds exactly like float() on the same text. Blanks read as zeros.
+
+    Args:
+        chars (np.ndarray): The (N,69) character matrix of the lines.
+        first (int): First column of the field.
+        last (int): Column after the field.
+        point (int, optional): Column of the decimal point. Defaults to None, an integer field.
+    """
+    block = chars[:, first:last].astype(np.int64) - ord("0")
+    digits = np.where((block >= 0) & (block <= 9), block, 0)
+    is_digit_column = np.ones(last - first, dtype=bool)
+    if point is not None:
+        is_digit_column[point - first] = False
+    weights = 10 ** (np.cumsum(is_digit_column[::-1])[::-1] - is_digit_column).astype(np.int64) * is_digit_column
+    mantissa = digits @ weights
+    decimals = 0 if point is None else last - point - 1
+    sign = np.where((block == ord("-") - ord("0")).any(axis=1), -1.0, 1.0)
+    return sign * mantissa / 10.0 ** decimals
+
+
+def implied_decimal(chars, first: int):
+    """Read an 8 column ' 12345-3' field, a sign, a five digit mantissa with an implied leading decimal point and an exponent."""
+    sign = np.where(chars[:, first] == ord("-"), -1.0, 1.0)
+    mantissa = fixed_number(chars, first + 1, first + 6)
+    exponent = fixed_number(chars, first + 6, first + 8)
+    return sign * (mantissa / 1e5) * POWERS_OF_TEN[exponent.astype(np.int64) + 9] # the same rounding steps as sgp4's own parser
+
+
+def checksum_ok(chars):
+    """Verify the modulo 10 checksum in column 69 of every line, digits count at face value and minus signs count as 1."""
+    digits = chars.astype(np.int16) - ord("0")
+    is_digit = (digits >= 0) & (digits <= 9)
+    total = np.where(is_digit[:, :68], digits[:, :68], 0).sum(axis=1) + (chars[:, :68] == ord("-")).sum(axis=1)
+    return is_digit[:, 68] & (total % 10 == digits[:, 68])
+
+
+def split_lines(data: bytes):
+    """Return the start offsets and lengths of the non-blank lines of a text buffer, without a Python loop."""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(buffer == ord("\n"))
+    if buffer[-1] != ord("\n"):
+        ends = np.append(ends, len(buffer))
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    lengths = ends - starts
+    lengths -= (lengths > 0) & (buffer[np.maximum(ends - 1, 0)] == ord("\r")) # Windows line endings
+    keep = lengths > 0
+    return starts[keep], lengths[keep]
+
+
+def character_matrix(buffer, starts, lengths):
+    """Gather lines into an (N,69) uint8 matrix, padding short lines with blanks and cutting long ones at column 69."""
+    offsets = np.arange(TLE_WIDTH)
+    chars = buffer[starts[:, None] + offsets]
+    short = lengths < TLE_WIDTH
+    if short.any():
+        chars[short] = np.where(offsets < lengths[short, None], chars[short], ord(" "))
+    return chars
+
+
+def parse_tle(data):
+    """Parse every element set of a TLE or 3LE text into a structured array.
+
+    Args:
+        data (bytes | str): The contents of a file with any mix of 2 line and 3 line (named) element sets.
+
+    Returns:
+        np.ndarray: One ELEMENTS_DTYPE record per element set, in file order.
+    """
+    if isinstance(data, str):
+        data = data.encode("ascii", "replace")
+    if not data.strip():
+        return np.empty(0, dtype=ELEMENTS_DTYPE)
+    starts, lengths = split_lines(data)
+    buffer = np.frombuffer(data + b" " * TLE_WIDTH, dtype=np.uint8) # room to gather 69 columns past the last line
+
+    # classify every line from its first two characters, then gather only the element lines
+    head, second = buffer[starts], buffer[starts + 1]
+    is_line1 = (head == ord("1")) & (second == ord(" "))
+    is_line2 = (head == ord("2")) & (second == ord(" "))
+    first = np.flatnonzero(is_line1[:-1] & is_line2[1:])
+    line1 = character_matrix(buffer, starts[first], lengths[first])
+    line2 = character_matrix(buffer, starts[first + 1], lengths[first + 1])
+
+    elements = np.zeros(len(first), dtype=ELEMENTS_DTYPE)
+    elements["line1"] = columns(line1, 0, TLE_WIDTH)
+    elements["line2"] = columns(line2, 0, TLE_WIDTH)
+
+    # the name is the line before line 1 unless that is itself part of an element set, 3LE names start with '0 '
+    previous = np.maximum(first - 1, 0)
+    named = (first > 0) & ~is_line1[previous] & ~is_line2[previous]
+    names = []
+    for is_named, start, length, line in zip(named.tolist(), starts[previous].tolist(), lengths[previous].tolist(), elements["line1"].tolist()):
+        name = data[start:start + length].decode("ascii", "replace").strip() if is_named else line[2:7].decode().strip()
+        names.append(name[2:] if name.startswith("0 ") else name)
+    elements["name"] = names
+
+    elements["norad_id"] = ALPHA5[line1[:, 2]] * 10000 + fixed_number(line1, 3, 7).astype(np.int32)
+    elements["classification"] = columns(line1, 7, 8).astype("U1")
+    elements["intldesg"] = [designator.decode().strip() for designator in columns(line1, 9, 17).tolist()]
+
+    year = fixed_number(line1, 18, 20).astype(np.int32)
+    year = np.where(year < 57, year + 2000, year + 1900)
+    epochdays = fixed_number(line1, 20, 32, point=23)
+    fraction = fixed_number(line1, 23, 32, point=23) # the 8 digits after the decimal point
+    # Julian date of January 1 at 0h, the closed form of sgp4.functions.jday() for the first month
+    january = 367.0 * year - np.floor(7 * year * 0.25) + 30 + 1 + 1721013.5
+    elements["epochyr"] = year % 100
+    elements["epochdays"] = epochdays
+    elements["jdsatepoch"] = january + np.floor(epochdays) - 1
+    elements["jdsatepochF"] = fraction
+    elements["epoch"] = elements["jdsatepoch"] + fraction
+
+    elements["ndot"] = fixed_number(line1, 33, 43, point=34)
+    elements["nddot"] = implied_decimal(line1, 44)
+    elements["bstar"] = implied_decimal(line1, 53)
+    elements["ephtype"] = fixed_number(line1, 62, 63)
+    elements["elnum"] = fixed_number(line1, 64, 68)
+
+    elements["inclo"] = fixed_number(line2, 8, 16, point=11)
+    elements["nodeo"] = fixed_number(line2, 17, 25, point=20)
+    elements["ecco"] = fixed_number(line2, 26, 33) / 1e7 # implied leading decimal point
+    elements["argpo"] = fixed_number(line2, 34, 42, point=37)
+    elements["mo"] = fixed_number(line2, 43, 51, point=46)
+    elements["no_kozai"] = fixed_number(line2, 52, 63, point=54)
+    elements["revnum"] = fixed_number(line2, 63, 68)
+
+    elements["checksum_ok"] = checksum_ok(line1) & checksum_ok(line2)
+    return elements
+
+
+def read_tle_file(path: str):
+    """Parse a TLE or 3LE file into a structured array, see parse_tle()."""
+    with open(path, "rb") as file:
+        return parse_tle(file.read())
+
+
+def satrecs_from_elements(elements):
+    """Initialize one sgp4 Satrec per parsed element set, without going back to the text lines.
+
+    Returns:
+        list: The Satrec objects, in the order of the elements.
+    """
+    # convert to the units sgp4init() expects: radians, radians per minute and their derivatives
+    epoch = elements["jdsatepoch"] + elements["jdsatepochF"] - 2433281.5 # days since 1949 December 31 00:00 UT
+    ndot = elements["ndot"] / (XPDOTP * 1440.0)
+    nddot = elements["nddot"] / (XPDOTP * 1440.0 * 1440.0)
+    no_kozai = elements["no_kozai"] / XPDOTP
+    inclo, nodeo, argpo, mo = (elements[field] * DEG2RAD for field in ("inclo", "nodeo", "argpo", "mo"))
+
+    satrecs = []
+    rows = zip(
+        elements["norad_id"].tolist(), epoch.tolist(), elements["bstar"].tolist(), ndot.tolist(), nddot.tolist(),
+        elements["ecco"].tolist(), argpo.tolist(), inclo.tolist(), mo.tolist(), no_kozai.tolist(), nodeo.tolist(),
+        elements["jdsatepoch"].tolist(), elements["jdsatepochF"].tolist(), elements["epochyr"].tolist(), elements["epochdays"].tolist(),
+        elements["classification"].astype("U1").tolist(), elements["intldesg"].astype("U8").tolist(), # also packed ASCII columns
+        elements["elnum"].tolist(), elements["revnum"].tolist(),
+    )
+    for (satnum, epoch, bstar, ndot, nddot, ecco, argpo, inclo, mo, no_kozai, nodeo, whole, fraction, epochyr, epochdays,
+         classification, intldesg, elnum, revnum) in rows:
+        satrec = Satrec()
+        satrec.sgp4init(WGS72, 'i', satnum, epoch, bstar, ndot, nddot, ecco, argpo, inclo, mo, no_kozai, nodeo)
+        # keep the exact two part epoch of the TLE, so propagation matches Satrec.twoline2rv() on the same lines
+        satrec.jdsatepoch = whole
+        satrec.jdsatepochF = fraction
+        satrec.epochyr = epochyr
+        satrec.epochdays = epochdays
+        # and the bookkeeping fields sgp4init() leaves blank, so sgp4.exporter.export_tle() writes the same lines back
+        satrec.classification = classification
+        satrec.intldesg = intldesg
+        satrec.elnum = elnum
+        satrec.revnum = revnum
+        satrecs.append(satrec)
+    return satrecs
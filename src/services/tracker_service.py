@@ -14,13 +14,36 @@ from numpy import add
 from pandas import cut
 from skyfield.api import EarthSatellite, load, wgs84
 
+from .archive_service import TLEArchive
+from .catalog_service import TLECatalog, parse_tle_lines
+from .ephemeris_service import iter_ephemeris
+from .frame_service import ITRS, FrameTransformer, ecef_to_geodetic
+from .ingest_service import GroupIngestor
+from .propagation_service import ConstellationPropagator, PropagationPool, propagate, to_geocentric
+from .time_service import TimeService
+from .tle_parser import read_tle_file, satrecs_from_elements
+
+
+TLE_CACHE_DIR = "src/data/tle_cache"
+
 
 class TrackerService:
-    def __init__(self):
+    """Command line tracker: queries, ground tracks on a map and ephemerides.
+
+    Args:
+        catalog (TLECatalog, optional): The application's TLE catalog, e.g. TLEManager.catalog. Defaults to a catalog on
+            the default paths, with the default archive.
+    """
+    def __init__(self, catalog: TLECatalog = None):
         self.parser = ArgumentParser(description="Service Satellite Tracker")
         self.parser.add_argument("--query", metavar="SATELLITE", type=str)
         self.parser.add_argument("--locate", metavar="SATELLITE", type=str)
         self.parser.add_argument("--scan", metavar="ADDRESS", type=str)
+        self.parser.add_argument("--ephemeris", metavar="SATELLITE", type=str, help="Propagate a satellite or family into an ephemeris directory of .npy files.")
+        self.parser.add_argument("--hours", type=float, default=24, help="Length of the ephemeris window in hours.")
+        self.parser.add_argument("--step", type=float, default=1, help="Ephemeris step in minutes.")
+        self.parser.add_argument("--workers", type=int, default=None, help="Worker processes for the ephemeris, defaults to one per core.")
+        self.parser.add_argument("--output", type=str, default="ephemeris", help="Output directory for the ephemeris.")
 
         current_dir = os.path.dirname(os.path.abspath(__file__))
         project_root = os.path.dirname(os.path.dirname(current_dir))
@@ -30,6 +53,10 @@ class TrackerService:
         )
 
         self.simtime = 0
+        self.Timescale = TimeService() # loaded once and shared, instead of reparsing the leap second tables on every call
+        self.Frames = FrameTransformer()
+        self.catalog = catalog if catalog is not None else TLECatalog(archive=TLEArchive()) # families are ingested into it and its history
+        self.Ingest = GroupIngestor(self.catalog)
 
         with open(json_file_path, "r") as f:
             families = json.load(f)
@@ -39,35 +66,45 @@ class TrackerService:
             print(f"Loaded {len(self.families)} satellite families.")
 
     def fetch_satellite_by_name(self, sat_name):
+        """Return the EarthSatellites of a family (a whole Celestrak group) or of a name search, from a fresh cache file or Celestrak.
+
+        Families are ingested into the TLE catalog with one request, name searches are stored in the catalog too. Either way
+        the result is cached as a single file in TLE_CACHE_DIR.
+        """
         lines = self.load_tle_data_if_fresh(sat_name)
         if lines:
             #print("Using cached TLE data.")
-            return [wgs84.satellite(lines[1], lines[2], lines[0], load.timescale())]
+            return self.earth_satellites(parse_tle_lines(lines))
 
         print("Fetching new TLE data.")
-        if any(sat_name.lower() == family["query"].lower() for family in self.families):
+        family = next((family for family in self.families if sat_name.lower() == family["query"].lower()), None)
+        if family:
             print(f"'{sat_name}' is a family")
-            # get the query from the name
-            url = "https://celestrak.org/NORAD/elements/gp.php?GROUP=" + quote(sat_name)
+            group = family["query"].lower()
+            self.Ingest.ingest_group(group)
+            element_sets = [(record.name, record.line1, record.line2) for record in self.catalog.records(self.catalog.group_members(group))]
         else:
             print(f"Satellite {sat_name} is not a family")
-            url = "https://celestrak.org/NORAD/elements/gp.php?NAME=" + quote(sat_name)
+            element_sets = self.Ingest.fetch(NAME=sat_name)
+            self.catalog.put_many(element_sets, source="celestrak:NAME=" + sat_name)
+
+        if element_sets:
+            self.save_tle_data(sat_name, element_sets)
+        return self.earth_satellites(element_sets)
+
+    def fetch_satellites_by_family(self, query):
+        return self.fetch_satellite_by_name(query)
 
-        response = load.tle_file(url, reload=True, filename=os.path.join("src/core/services/tle_cache", sat_name + ".tle"))
-        if response:
-            for sat in response:
-                sat_file_path = os.path.join("src/core/services/tle_cache", f"{sat.name}.tle")
-                self.save_tle_data(sat.name, [sat.name, sat.model.line1, sat.model.line2])
-                print(f"Saved TLE data to {sat_file_path}")
-        return response
+    def earth_satellites(self, element_sets):
+        """Build EarthSatellites from (name, line1, line2) element sets."""
+        return [EarthSatellite(line1, line2, name, self.Timescale.ts) for name, line1, line2 in element_sets]
 
     def locate_Satellite(self, satellite_name):
         satellite = self.fetch_or_use_local_tle(satellite_name)
         if not satellite:
             return
 
-        ts = load.timescale()
-        t = ts.now()
+        t = self.Timescale.now()
 
         # Limit the number of satellites to process with min() to avoid IndexError
         icrf = satellite.at(t)
@@ -91,27 +128,26 @@ class TrackerService:
         self.plot_trajectory_on_map(satellite, satellite_name, 1, 3, 2, map)
 
     def plot_trajectory_on_map(self, satellite, satellite_name, past_hours=1, future_hours=1, mins_per_step=1, map=None):
-        # Load timescale
-        ts = load.timescale()
+        ts = self.Timescale
         map = self.GeoDataService.display_map(map)
 
-        # Generate the trajectory points once
-        current_time = ts.now()
-        # Generate a range of times around the current time for plotting the trajectory
-        minutes_range = np.arange(-past_hours * 60, future_hours * 60, mins_per_step)
-        # Convert minutes to days for arithmetic with Time objects
-        days_range = minutes_range / 1440  # There are 1440 minutes in a day
-        times = [current_time + delta for delta in days_range]
-        geocentric_positions = [satellite.at(time) for time in times]
-        subpoints = [wgs84.subpoint(pos) for pos in geocentric_positions]
-        lons = [subpoint.longitude.degrees for subpoint in subpoints]
-        lats = [subpoint.latitude.degrees for subpoint in subpoints]
-
-        # Handle dateline
-        lons, lats = self.GeoDataService.handle_dateline(lons, lats)
-
-        # Plot static trajectory
-        map.ax.plot(lons, lats, '-', markersize=2, color='grey', label=f'Trajectory of {satellite_name}')
+        # Generate the trajectory points once, streamed in chunks without building a Time object per sample. Each chunk
+        # is drawn as it arrives, joined to the last sample of the previous one. Only its times, longitudes and latitudes
+        # are kept, for the animated segment, the positions and altitudes go with the chunk.
+        start_time = ts.offsets(ts.now(), -past_hours * 3600)
+        duration = (past_hours + future_hours) * 3600 - mins_per_step * 60
+        count = int(duration // (mins_per_step * 60)) + 1
+        times, lons, lats = np.empty(count), np.empty(count), np.empty(count)
+        filled = 0
+        for chunk in iter_ephemeris(satellite, start_time, duration, mins_per_step * 60):
+            last = filled + len(chunk.tt)
+            times[filled:last], lons[filled:last], lats[filled:last] = chunk.tt, chunk.lon, chunk.lat
+            joined = max(filled - 1, 0)
+            # Handle dateline, the raw track is kept for the segments, which are cut by sample index
+            track_lons, track_lats = self.GeoDataService.handle_dateline(lons[joined:last], lats[joined:last])
+            # Plot static trajectory
+            map.ax.plot(track_lons, track_lats, '-', markersize=2, color='grey', label=None if filled else f'Trajectory of {satellite_name}')
+            filled = last
 
         # Initialize current position marker
         current_pos_marker, = map.ax.plot([], [], 'ro', label=f'Current Position of {satellite_name}')
@@ -129,8 +165,7 @@ class TrackerService:
             idx1, idx2 = find_segment_indices(times, current_time)
             segment_lons = lons[idx1:idx2]
             segment_lats = lats[idx1:idx2]
-            segment_lons, segment_lats = self.GeoDataService.handle_dateline(segment_lons, segment_lats)
-            if segment_lons and segment_lats:
+            if len(segment_lons):
                 segment_lons, segment_lats = self.GeoDataService.handle_dateline(segment_lons, segment_lats)
 
                 current_line.set_data(segment_lons, segment_lats)
@@ -145,11 +180,11 @@ class TrackerService:
             return current_pos_marker,
 
         def find_segment_indices(times, current_time):
-            # Assuming times is a list of Skyfield Time objects
+            # times is an array of Terrestrial Time Julian dates
             current_time_tt = current_time.tt
 
             # Find closest index to the current time
-            closest_idx = min(range(len(times)), key=lambda i: abs(times[i].tt - current_time_tt))
+            closest_idx = int(np.argmin(np.abs(times - current_time_tt)))
 
             # Define a wider range around the closest index
             # This example adds and subtracts a fixed number of indices to widen the segment
@@ -171,6 +206,15 @@ class TrackerService:
 
         plt.show()
 
+    def export_ephemeris(self, satellite, file_path, hours=24, seconds_per_step=60):
+        """Write a satellite's ephemeris to a CSV file chunk by chunk, so long windows never sit in memory at once."""
+        with open(file_path, "w") as file:
+            file.write("tt,x_km,y_km,z_km,lat_deg,lon_deg,alt_km\n")
+            for chunk in iter_ephemeris(satellite, self.Timescale.now(), hours * 3600, seconds_per_step):
+                rows = np.column_stack([chunk.tt, chunk.xyz, chunk.lat, chunk.lon, chunk.alt])
+                np.savetxt(file, rows, delimiter=",", fmt="%.9f")
+        print(f"Saved ephemeris to {file_path}")
+
     # use the geo data service display map to display the location of the satellite
     def show_on_map(self, lat, lon):
         map = self.GeoDataService.initMap()
@@ -182,18 +226,22 @@ class TrackerService:
         map.ax.set_axis_off()
         plt.show()
 
-    def save_tle_data(self, satellite_name, tle_lines):
-        """Save TLE data to a file."""
-        file_path = os.path.join("tle_cache", f"{satellite_name}.tle")
+    def tle_cache_path(self, satellite_name):
+        """Return the cache file of a satellite name or family, the one place fetched TLE data is cached."""
+        return os.path.join(TLE_CACHE_DIR, f"{quote(satellite_name, safe='')}.tle")
+
+    def save_tle_data(self, satellite_name, element_sets):
+        """Save (name, line1, line2) element sets to the cache file of a satellite name or family."""
+        file_path = self.tle_cache_path(satellite_name)
         print(f"Saving TLE data to {file_path}")
+        os.makedirs(TLE_CACHE_DIR, exist_ok=True)
         with open(file_path, "w") as file:
-            file.write(satellite_name + "\n")
-            for line in tle_lines[1:]:  # Assuming tle_lines[0] is the satellite name
-                file.write(line + "\n")
+            for name, line1, line2 in element_sets:
+                file.write(f"{name}\n{line1}\n{line2}\n")
 
     def fetch_or_use_local_tle(self, satellite_name, max_age_days=2):
         """Fetch new TLE data if the local file is older than max_age_days, otherwise use the local file."""
-        file_path = os.path.join('src/data/tle_cache', f"{satellite_name}.tle")
+        file_path = self.tle_cache_path(satellite_name)
 
         def is_tle_fresh(file_path):
 
@@ -209,38 +257,20 @@ class TrackerService:
             return (datetime.now(timezone.utc) - tle_datetime) <= timedelta(days=max_age_days)
 
         if os.path.exists(file_path) and is_tle_fresh(file_path):
-            with open(file_path, "r") as file:
-                lines = file.readlines()
             print(f"Using fresh local TLE data for {satellite_name}")
-
-            '''will this work if the tle file looks like this ?
-
-            STARLINK-1007
-            1 44713U 19074A   24103.28263811  .00001393  00000+0  11234-3 0  9990
-            2 44713  53.0547  72.9074 0001439  97.5939 262.5213 15.06412623243788
-            STARLINK-1008
-            1 44714U 19074B   24103.32780202  .00001055  00000+0  89684-4 0  9994
-            2 44714  53.0546  72.7044 0001422  92.2969 267.8183 15.06404768243796
-
-            will this work if the tle file looks like that?'''
-
-
+            # the file may hold any number of 2 or 3 line element sets, they are all parsed in one pass
+            elements = read_tle_file(file_path)[:20]
             earth_satellites = []
-            for i in range(0, min(20*3, len(lines)), 3):
-                sat_name = lines[i].strip()
-                tle_line1 = lines[i+1].strip()
-                tle_line2 = lines[i+2].strip()
-                earth_satellite = EarthSatellite(tle_line1, tle_line2, sat_name, load.timescale())
+            for satrec, sat_name, tle_line1 in zip(satrecs_from_elements(elements), elements["name"].tolist(), elements["line1"].tolist()):
+                earth_satellite = EarthSatellite.from_satrec(satrec, self.Timescale.ts)
+                earth_satellite.name = sat_name
                 earth_satellites.append(earth_satellite)
-                print(f"Loaded TLE data for {sat_name}: {tle_line1}")
+                print(f"Loaded TLE data for {sat_name}: {tle_line1.decode()}")
             return earth_satellites
         else:
             try:
                 print(f"Fetching TLE data for {satellite_name}")
-                earth_satellite = self.fetch_satellite_by_name(satellite_name)
-                if earth_satellite:
-                    self.save_tle_data(satellite_name, [sat.name for sat in earth_satellite] + [sat.model.line1 for sat in earth_satellite] + [sat.model.line2 for sat in earth_satellite])
-                return earth_satellite
+                return self.fetch_satellite_by_name(satellite_name) # caches the element sets itself
             except Exception as e:
                 print(f"Error fetching or using local TLE for {satellite_name}: {e}, path = {file_path}")
                 return None
@@ -269,7 +299,7 @@ class TrackerService:
 
     def load_tle_data_if_fresh(self, satellite_name, max_age_hours=2):
         """Load TLE data from a file if it's fresh enough."""
-        file_path = os.path.join("tle_cache", f"{quote(satellite_name)}.tle")
+        file_path = self.tle_cache_path(satellite_name)
         if os.path.exists(file_path):
             file_age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(file_path))
             if file_age < timedelta(hours=max_age_hours):
@@ -289,16 +319,14 @@ class TrackerService:
 
     # get the current position of the satellite
     def get_current_position(self, satellite):
-        ts = load.timescale()
-        t = ts.now()
-        return satellite.at(t)
+        return satellite.at(self.Timescale.now())
 
     # get the subpoint of the satellite
     def get_subpoint(self, position):
         return wgs84.subpoint(position)
 
     def getTime(self):
-        ts = load.timescale()
+        ts = self.Timescale
         if self.simtime == 0:
             self.simtime = ts.now()
             self.initial_time = self.simtime
@@ -306,56 +334,73 @@ class TrackerService:
             self.simtime += timedelta(minutes=1)
         return ts.now() # self.simtime
 
+    def geodetic_of(self, positions, times):
+        """Convert GCRS positions in km from propagation into latitude and longitude in degrees and altitude in km, as arrays."""
+        # every grid of the tracker is anchored on now(), none is converted twice
+        lats, lons, alts = ecef_to_geodetic(self.Frames.eci_to_ecef(positions, times, ITRS, memoize=False))
+        return np.degrees(lats), np.degrees(lons), alts
+
     def calculate_satellite_position_at_time(self, satellite, time):
-        # if satellite is a list
-        if isinstance(satellite, list):
-            points = []
-            for sat in satellite:
-               icrf = sat.at(time)
-               subpoint = wgs84.subpoint(icrf)
-               lat = subpoint.latitude.degrees
-               lon = subpoint.longitude.degrees
-               alt = subpoint.elevation.km
-               point = self.convert_lat_lon_alt_to_3D(lat, lon, alt)
-               points.append(point)
-            return points
-        else:
-            icrf = satellite.at(time)
-            subpoint = wgs84.subpoint(icrf)
-            lat = subpoint.latitude.degrees
-            lon = subpoint.longitude.degrees
-            alt = subpoint.elevation.km
-            point = self.convert_lat_lon_alt_to_3D(lat, lon, alt)
-            return [point]
+        """Return the (lats, lons, alts) arrays of one satellite or a list of satellites at a single time."""
+        satellites = satellite if isinstance(satellite, list) else [satellite]
+        # every satellite is propagated in one vectorized call
+        positions, errors = ConstellationPropagator.from_satellites(satellites).snapshot(time)
+        return self.geodetic_of(positions, time)
 
     def calculate_orbit_points_around_globe(self, satellite):
-        ts = load.timescale()
-        t = ts.now()
-
-        icrf = satellite.at(t)
-        subpoint = wgs84.subpoint(icrf)
-        lat = subpoint.latitude.degrees
-        lon = subpoint.longitude.degrees
-        alt = subpoint.elevation.km
-
-        current_time = ts.now()
+        """Return the (lats, lons, alts) arrays of a satellite's track from 13 hours before to 13 hours after now."""
         minutes_per_step = 1 # minutes
         start_time = -13 # hours
         end_time = 13 # hours
-        minutes_range = np.arange(start_time * 60, end_time * 60, minutes_per_step)
-        days_range = minutes_range / 1440
-
-        times = [current_time + delta for delta in days_range]
-        geocentric_positions = [satellite.at(time) for time in times]
-        subpoints = [wgs84.subpoint(pos) for pos in geocentric_positions]
-        lons = [subpoint.longitude.degrees for subpoint in subpoints]
-        lats = [subpoint.latitude.degrees for subpoint in subpoints]
-        alts = [subpoint.elevation.km for subpoint in subpoints]
 
-        # turn the lons and lats and alts into 3D points
-        points = [self.convert_lat_lon_alt_to_3D(lat, lon, alt) for lat, lon, alt in zip(lats, lons, alts)]
-        return points
+        # propagate the whole 26 hour span in a single call
+        times = self.Timescale.grid(self.Timescale.now(), minutes_per_step * 60, (end_time - start_time) * 60 // minutes_per_step, first=start_time * 60 // minutes_per_step, memoize=False)
+        positions, velocities, errors = self.propagate_history(satellite, times)
+        return self.geodetic_of(positions, times)
+
+    def propagate_history(self, satellite, times):
+        """Propagate a satellite with the archived element set of the nearest epoch at every time, switching sets
+        between epochs, or with its own element set if nothing is archived for it."""
+        archive = self.catalog.archive
+        if archive is not None:
+            result = archive.propagate(satellite.model.satnum, times, self.Timescale.ts)
+            if result is not None:
+                return result
+        return propagate(satellite, times)
+
+
+    def compute_ephemeris(self, query_text, hours=24, minutes_per_step=1, workers=None, output="ephemeris"):
+        """Propagate every satellite of a query or family over a window starting now, sharded across a process pool.
+
+        The ephemeris is written to the directory `output` as .npy files (tt, catalog_ids, names, positions, velocities,
+        errors). The results arrive from the pool in time chunks and are written into the memory-mapped files one chunk
+        at a time, so the window is never held in memory at once. Read them back with np.load(path, mmap_mode="r").
+        """
+        satellites = self.query_CelesTrak(query_text)
+        if not satellites:
+            return None
 
+        count = int(np.ceil(hours * 60 / minutes_per_step))
+        times = self.Timescale.grid(self.Timescale.now(), minutes_per_step * 60, count, memoize=False)
+
+        constellation = ConstellationPropagator.from_satellites(satellites)
+        print(f"Propagating {len(constellation)} satellites over {count} steps.")
+        os.makedirs(output, exist_ok=True)
+        np.save(os.path.join(output, "tt.npy"), times.tt)
+        np.save(os.path.join(output, "catalog_ids.npy"), np.array(constellation.catalog_ids))
+        np.save(os.path.join(output, "names.npy"), np.array(constellation.names, dtype=str))
+        shape = (len(constellation), count)
+        positions = np.lib.format.open_memmap(os.path.join(output, "positions.npy"), "w+", constellation.dtype, shape + (3,))
+        velocities = np.lib.format.open_memmap(os.path.join(output, "velocities.npy"), "w+", constellation.dtype, shape + (3,))
+        errors = np.lib.format.open_memmap(os.path.join(output, "errors.npy"), "w+", np.uint8, shape)
+        with PropagationPool(workers) as pool:
+            for first, last, chunk_positions, chunk_velocities, chunk_errors in pool.chunks(constellation, times):
+                positions[:, first:last], velocities[:, first:last], errors[:, first:last] = chunk_positions, chunk_velocities, chunk_errors
+                for array in (positions, velocities, errors):
+                    array.flush() # written back, the pages of this chunk can be dropped
+        del positions, velocities, errors
+        print(f"Saved ephemeris to {output}")
+        return output
 
 
 def JSONtoDictionary(file_path):
@@ -383,4 +428,6 @@ if __name__ == "__main__":
     if args.query:
         service.query_CelesTrak(args.query)
     if args.locate:
-        service.locate_Satellite(args.locate)
\ No newline at end of file
+        service.locate_Satellite(args.locate)
+    if args.ephemeris:
+        service.compute_ephemeris(args.ephemeris, args.hours, args.step, args.workers, args.output)
\ No newline at end of file
@@ -341,7 +341,8 @@ class TransparentOverlayView(QWidget):
         self.labels["CameraTarget"].setText(f"Target: {name} ({x}, {y}, {z})")
 
     def draw2DCartesianCoordinates(self):
-        coords = self.controller.Earth.get2DCartesianCoordinates(self.controller.current_satellite, self.controller.Timescale.now())
+        geocentric = self.controller.EphemerisCache.geocentric(self.controller.current_satellite, self.controller.Timescale.now())
+        coords = self.controller.Earth.geographicCoordinatesOf(geocentric)
         latitude = coords[0].dstr()
         longitude = coords[1].dstr()
         altitude = coords[2] / self.controller.scale # Convert to km
@@ -516,6 +517,7 @@ class Globe3DView(QOpenGLWidget):
 
         glRotatef(self.Earth.axial_tilt, 0, 1, 0) # Rotate the Earth's axial tilt
         self.drawSatellite(satellite, now=time, color=QColor(255, 255, 255))
+        self.drawConstellation(time)
 
         # elliptical orbit path
         glLineWidth(1)
@@ -552,6 +554,22 @@ class Globe3DView(QOpenGLWidget):
         glDisable(GL_LINE_SMOOTH)
         glEnable(GL_LIGHTING)
 
+    def drawConstellation(self, now):
+        """ Draw every satellite of the constellation as a point, from one vectorized snapshot per frame. """
+        positions = self.controller.get_constellation_positions(now)
+        if positions is None or not len(positions):
+            return
+        glDisable(GL_LIGHTING)
+        glDisable(GL_TEXTURE_2D)
+        glPointSize(3)
+        glColor4f(1.0, 1.0, 0.0, 1.0)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, positions) # the (M,3) float32 array is uploaded as is
+        glDrawArrays(GL_POINTS, 0, len(positions))
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glEnable(GL_TEXTURE_2D)
+        glEnable(GL_LIGHTING)
+
     def drawSatellite(self, satellite, now, color):
         """ Draw the satellite at the given position. """
 
@@ -563,8 +581,8 @@ class Globe3DView(QOpenGLWidget):
         modelview = glGetDoublev(GL_MODELVIEW_MATRIX)
         projection = glGetDoublev(GL_PROJECTION_MATRIX)
 
-        # getECICoordinates returns a numpy array of sat positions if a list of times is passed, but a single position if a single time is passed
-        position = self.Earth.getECICoordinates(satellite, now)
+        # interpolate the position from the ephemeris cache instead of running SGP4 every frame
+        position = self.controller.EphemerisCache.position(satellite, now) * self.Earth.scale
 
         screen_coords = self.get2DScreenCoordsFrom3D(*position)
         x = screen_coords[0]
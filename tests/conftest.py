@@ -0,0 +1,109 @@
+import hashlib
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from services.catalog_service import TLECatalog
+
+# three named element sets, the first epoch is the earliest
+ISS = ("ISS (ZARYA)",
+       "1 25544U 98067A   24109.46469140  .00024408  00000+0  42848-3 0  9996",
+       "2 25544  51.6367 251.5413 0004691  76.0124 284.1386 15.50378340449286")
+VANGUARD = ("VANGUARD 2",
+            "1 00011U 59001A   24111.62523039  .00004952  00000+0  25974-2 0  9994",
+            "2 00011  32.8766 181.2672 1457233 261.8824  81.4465 11.88087943783408")
+SWISSCUBE = ("SWISSCUBE",
+             "1 35932U 09051B   24120.60839556  .00001859  00000+0  40725-3 0  9991",
+             "2 35932  98.4773   2.9416 0008556 105.1761 255.0384 14.58866114775470")
+ELEMENT_SETS = [ISS, VANGUARD, SWISSCUBE]
+
+
+def tle_text(element_sets, named=True):
+    """Join element sets into a 3 line (or 2 line) TLE text."""
+    return "\n".join(line for name, line1, line2 in element_sets for line in ((name, line1, line2) if named else (line1, line2))) + "\n"
+
+
+def with_epoch(element_set, epoch: str):
+    """Return a copy of an element set with another epoch, e.g. '24100.00000000'."""
+    name, line1, line2 = element_set
+    return name, line1[:18] + epoch + line1[32:], line2
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = TLECatalog(str(tmp_path / "catalog.sqlite"))
+    yield catalog
+    catalog.close()
+
+
+class GPServer(ThreadingHTTPServer):
+    """Local stand-in for the Celestrak GP endpoint.
+
+    Bodies are registered per query, e.g. server.bodies[("GROUP", "stations", "TLE")] = b"...". Every body is served with
+    an ETag of its content and answers a matching If-None-Match with a 304. Queries without a body get Celestrak's
+    'No GP data found' with a 200. Statuses queued in server.failures[(key, value)] are answered first, e.g. 429.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), GPHandler)
+        self.bodies = {}
+        self.failures = {}
+        self.requests = [] # (query dict, request headers, response status)
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/gp.php"
+
+    def statuses(self, status: int):
+        return [request for request in self.requests if request[2] == status]
+
+
+class GPHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        query = dict(parse_qsl(urlsplit(self.path).query))
+        key = next((name, query[name]) for name in ("GROUP", "CATNR", "NAME") if name in query)
+        with server.lock:
+            failures = server.failures.get(key)
+            status = failures.pop(0) if failures else None
+        body = server.bodies.get(key + (query.get("FORMAT", "TLE"),))
+        etag = None if body is None else '"' + hashlib.sha1(body).hexdigest() + '"'
+
+        if status is None:
+            status = 304 if etag is not None and self.headers.get("If-None-Match") == etag else 200
+        with server.lock:
+            server.requests.append((query, dict(self.headers), status))
+        self.send_response(status)
+        if status in (429, 503):
+            self.send_header("Retry-After", "0")
+        if status == 200:
+            body = b"No GP data found" if body is None else body
+            if etag is not None:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def gp_server():
+    server = GPServer()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from skyfield.api import EarthSatellite, load
+
+from conftest import ISS, VANGUARD, with_epoch
+
+from services.archive_service import TLEArchive, segment_of
+from services.catalog_service import TLECatalog, record_row, tle_epoch
+from services.propagation_service import propagate
+
+# the same object at three epochs, 2024 days 100, 109.46 and 120
+SETS = [with_epoch(ISS, "24100.00000000"), ISS, with_epoch(ISS, "24120.00000000")]
+EPOCHS = [tle_epoch(line1) for name, line1, line2 in SETS]
+
+
+def rows(element_sets):
+    return [record_row(*element_set, "test", 0.0) for element_set in element_sets]
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return TLEArchive(str(tmp_path / "archive"))
+
+
+def test_segment_of_switches_at_midpoints():
+    epochs = np.array([10.0, 20.0, 40.0])
+    assert segment_of(epochs, [0, 14.9, 15.1, 29.9, 30.1, 99]).tolist() == [0, 0, 1, 1, 2, 2]
+
+
+def test_append_skips_archived_epochs(archive):
+    assert archive.append_rows(rows(SETS)) == 3
+    assert archive.append_rows(rows(SETS)) == 0
+    assert archive.append(*ISS, EPOCHS[1]) is False
+    assert "25544" in archive and "00011" not in archive
+    assert len(archive) == 1
+    assert archive.epochs(25544).tolist() == EPOCHS
+
+
+def test_nearest(archive):
+    archive.append_rows(rows(SETS))
+    assert archive.nearest("25544", EPOCHS[0] - 30) == SETS[0]
+    assert archive.nearest("25544", (EPOCHS[0] + EPOCHS[1]) / 2 - 0.01) == SETS[0]
+    assert archive.nearest("25544", (EPOCHS[0] + EPOCHS[1]) / 2 + 0.01) == SETS[1]
+    assert archive.nearest("25544", EPOCHS[2] + 100) == SETS[2]
+    assert archive.nearest("00011", EPOCHS[0]) is None
+
+
+def test_between(archive):
+    archive.append_rows(rows(SETS))
+    epochs, sets = archive.between("25544", EPOCHS[0], EPOCHS[1])
+    assert epochs.tolist() == EPOCHS[:2] and sets == SETS[:2]
+    epochs, sets = archive.between("25544", EPOCHS[2] + 1, EPOCHS[0] - 1) # either order
+    assert sets == SETS
+    assert archive.between("00011", 0, 1)[1] == []
+
+
+def test_backfill_keeps_the_index_sorted(archive, tmp_path):
+    archive.append_rows(rows([SETS[2]]))
+    archive.append_rows(rows([SETS[0]])) # older than everything archived
+    archive.append_rows(rows([SETS[1]]))
+    assert archive.epochs(25544).tolist() == EPOCHS
+    assert archive.read(25544, [0, 1, 2]) == SETS
+
+    reopened = TLEArchive(str(tmp_path / "archive")) # nothing is kept in memory only
+    assert reopened.epochs(25544).tolist() == EPOCHS
+    assert reopened.nearest(25544, EPOCHS[0]) == SETS[0]
+
+
+def test_propagate_uses_the_nearest_set(archive):
+    archive.append_rows(rows(SETS))
+    ts = load.timescale()
+    times = ts.tt_jd(np.linspace(EPOCHS[0] - 1, EPOCHS[2] + 1, 97))
+    positions, velocities, errors = archive.propagate("25544", times, ts)
+    assert positions.shape == (97, 3) and not errors.any()
+
+    segments = segment_of(np.array(EPOCHS), times.ut1)
+    assert set(segments.tolist()) == {0, 1, 2}
+    for segment, (name, line1, line2) in enumerate(SETS):
+        mask = segments == segment
+        expected_positions, expected_velocities, _ = propagate(EarthSatellite(line1, line2, name, ts), times[mask])
+        np.testing.assert_allclose(positions[mask], expected_positions, atol=1e-6)
+        np.testing.assert_allclose(velocities[mask], expected_velocities, atol=1e-9)
+    assert archive.propagate("00011", times, ts) is None
+
+
+def test_catalog_writes_every_set_to_the_archive(tmp_path, archive):
+    catalog = TLECatalog(str(tmp_path / "catalog.sqlite"), archive)
+    try:
+        catalog.put(*SETS[1])
+        catalog.put(*SETS[0]) # older, the catalog keeps the newer one but the history gets both
+        catalog.write_group("stations", rows([SETS[2], VANGUARD]))
+        assert catalog.get(25544).line1 == SETS[2][1]
+        assert archive.epochs(25544).tolist() == EPOCHS
+        assert archive.nearest(11, 0)[0] == "VANGUARD 2"
+    finally:
+        catalog.close()
+
+
+def test_archives_on_one_directory_share_their_lock(archive, tmp_path):
+    other = TLEArchive(str(tmp_path / "archive"))
+    assert other.lock is archive.lock
+    assert TLEArchive(str(tmp_path / "elsewhere")).lock is not archive.lock
+
+    archive.append_rows(rows([SETS[2]]))
+    other.append_rows(rows([SETS[0]])) # a backfill through the second object
+    archive.append_rows(rows([SETS[1]]))
+    assert archive.epochs(25544).tolist() == other.epochs(25544).tolist() == EPOCHS
+    assert other.read(25544, [0, 1, 2]) == archive.read(25544, [0, 1, 2]) == SETS
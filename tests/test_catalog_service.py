@@ -0,0 +1,162 @@
+import threading
+
+from sgp4.api import Satrec
+
+from conftest import ELEMENT_SETS, ISS, SWISSCUBE, VANGUARD, tle_text, with_epoch
+
+from services.catalog_service import CatalogIndex, norad_id, parse_tle_text, record_row, tle_epoch
+
+
+def test_norad_id_normalizes_padding_and_alpha5():
+    assert norad_id("00544") == norad_id("544") == norad_id(544) == 544
+    assert norad_id("A0001") == 100001
+    assert norad_id("Z9999") == 339999
+
+
+def test_record_row_decodes_alpha5():
+    name, line1, line2 = ISS
+    row = record_row(name, line1[:2] + "A0001" + line1[7:], line2[:2] + "A0001" + line2[7:], None, 0.0)
+    assert row[0] == 100001
+
+
+def test_tle_epoch_matches_sgp4():
+    satrec = Satrec.twoline2rv(ISS[1], ISS[2])
+    assert abs(tle_epoch(ISS[1]) - (satrec.jdsatepoch + satrec.jdsatepochF)) < 1e-8
+
+
+def test_parse_tle_text_mixes_named_and_unnamed_sets():
+    text = tle_text([ISS]) + tle_text([VANGUARD], named=False) + "No GP data found\n"
+    assert list(parse_tle_text(text)) == [ISS, ("00011", VANGUARD[1], VANGUARD[2])]
+
+
+def test_put_many_and_reads(catalog):
+    assert catalog.put_many(ELEMENT_SETS, source="test") == 3
+    assert len(catalog) == 3
+    assert "25544" in catalog and 11 in catalog and "99999" not in catalog
+    assert catalog.lines("25544") == list(ISS)
+    assert [record.norad_id for record in catalog.records()] == [11, 25544, 35932]
+    assert [record.norad_id for record in catalog.records(["35932", "00011", "99999"])] == [11, 35932]
+    assert [record.norad_id for record in catalog.range(20000, 40000)] == [25544, 35932]
+    assert catalog.names() == {"VANGUARD 2": "00011", "ISS (ZARYA)": "25544", "SWISSCUBE": "35932"}
+    assert catalog.get("99999") is None
+
+
+def test_older_element_set_never_replaces_newer(catalog):
+    catalog.put(*ISS)
+    catalog.put(*with_epoch(ISS, "24100.00000000"))
+    assert catalog.get(25544).line1 == ISS[1]
+    newer = with_epoch(ISS, "24120.00000000")
+    catalog.put(*newer)
+    assert catalog.get(25544).line1 == newer[1]
+
+
+def test_write_group_replaces_members(catalog):
+    rows = [record_row(*element_set, "test", 1.0) for element_set in ELEMENT_SETS]
+    assert catalog.write_group("stations", iter(rows), fetched=1.0) == 3
+    assert catalog.group_members("stations") == [11, 25544, 35932]
+    assert catalog.write_group("stations", iter(rows[:1]), fetched=2.0) == 1
+    assert catalog.group_members("stations") == [25544]
+    assert catalog.groups() == {"stations": (2.0, 1)}
+    assert catalog.groups_of(25544) == ["stations"]
+    assert len(catalog) == 3 # leaving a group keeps the element set
+
+
+def test_failed_write_group_keeps_previous_members(catalog):
+    catalog.write_group("stations", [record_row(*ISS, "test", 1.0)])
+
+    def broken():
+        yield record_row(*VANGUARD, "test", 2.0)
+        raise OSError("connection reset")
+
+    try:
+        catalog.write_group("stations", broken())
+    except OSError:
+        pass
+    assert catalog.group_members("stations") == [25544]
+    assert "00011" not in catalog
+
+
+def test_reads_do_not_see_a_write_in_progress(catalog):
+    catalog.put(*ISS)
+    started, resume = threading.Event(), threading.Event()
+
+    def rows():
+        yield record_row(*VANGUARD, "test", 1.0)
+        started.set()
+        resume.wait(5)
+
+    writer = threading.Thread(target=catalog.write_group, args=("group", rows()))
+    writer.start()
+    assert started.wait(5)
+    try:
+        assert "00011" not in catalog # the uncommitted row belongs to the writer's connection
+        assert len(catalog) == 1
+    finally:
+        resume.set()
+        writer.join()
+    assert "00011" in catalog
+
+
+def test_validators(catalog):
+    assert catalog.validators("http://example") == (None, None)
+    catalog.set_validators("http://example", '"abc"', "Mon, 01 Jan 2024 00:00:00 GMT")
+    assert catalog.validators("http://example") == ('"abc"', "Mon, 01 Jan 2024 00:00:00 GMT")
+
+
+def test_index_refresh_returns_each_diff_once(catalog):
+    catalog.put(*ISS)
+    index = CatalogIndex(catalog)
+    assert index.name_dict() == {"ISS (ZARYA)": "25544"}
+    assert index.refresh() == ({}, {}, {})
+
+    catalog.put(*VANGUARD)
+    catalog.put("ISS", ISS[1], ISS[2])
+    added, removed, renamed = index.refresh()
+    assert added == {11: "VANGUARD 2"} and removed == {} and renamed == {25544: ("ISS (ZARYA)", "ISS")}
+    assert index.refresh() == ({}, {}, {})
+
+    catalog.remove(11)
+    assert index.refresh() == ({}, {11: "VANGUARD 2"}, {})
+    assert index.id_of("ISS") == 25544 and index.name_of("00011") is None
+
+
+def test_index_imports_files_overwritten_in_place(catalog, tmp_path):
+    tle_dir = tmp_path / "tle"
+    tle_dir.mkdir()
+    path = tle_dir / "35932.tle"
+    path.write_text(tle_text([SWISSCUBE]))
+    index = CatalogIndex(catalog, str(tle_dir))
+    assert index.name_of(35932) == "SWISSCUBE"
+
+    path.write_text(tle_text([with_epoch(("SWISSCUBE 2",) + SWISSCUBE[1:], "24121.00000000")]))
+    index.scanned -= 1 # the rewrite may fall within the clock resolution of the first scan
+    assert index.refresh()[2] == {35932: ("SWISSCUBE", "SWISSCUBE 2")}
+
+
+def test_index_refresh_reads_only_changed_rows(catalog):
+    catalog.put_many(ELEMENT_SETS)
+    index = CatalogIndex(catalog)
+    seq = index.seq
+    assert seq == catalog.change_seq() > 0
+
+    catalog.put(*with_epoch(ISS, "24200.00000000")) # a newer set, same name
+    assert [row[0] for row in catalog.changes(seq)] == [25544]
+    assert index.refresh() == ({}, {}, {})
+    assert index.epochs[25544] == tle_epoch(with_epoch(ISS, "24200.00000000")[1])
+    assert index.seq > seq
+
+    catalog.put(*ISS) # older than the stored set, nothing changes
+    assert catalog.changes(index.seq) == []
+
+
+def test_index_keeps_shared_names(catalog):
+    catalog.put("DEBRIS", ISS[1], ISS[2])
+    catalog.put("DEBRIS", VANGUARD[1], VANGUARD[2])
+    index = CatalogIndex(catalog)
+    assert index.id_of("DEBRIS") == 25544
+    catalog.remove(25544)
+    index.refresh()
+    assert index.id_of("DEBRIS") == 11
+    catalog.remove(11)
+    index.refresh()
+    assert index.id_of("DEBRIS") is None and index.name_dict() == {}
@@ -0,0 +1,81 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+from conftest import ISS, VANGUARD, tle_text
+
+from services.download_service import FAILED, MISSING, NOT_MODIFIED, UPDATED, TLEDownloader, retry_after
+
+
+@pytest.fixture
+def downloader(catalog, gp_server):
+    downloader = TLEDownloader(catalog, base_url=gp_server.url, max_in_flight=4, max_retries=2, backoff=0.01)
+    yield downloader
+    downloader.close()
+
+
+def serve(gp_server, element_set):
+    gp_server.bodies[("CATNR", str(int(element_set[1][2:7])), "TLE")] = tle_text([element_set]).encode()
+
+
+def test_download_all_outcomes(catalog, gp_server, downloader):
+    serve(gp_server, ISS)
+    serve(gp_server, VANGUARD)
+    gp_server.failures[("CATNR", "20580")] = [500]
+    results = downloader.download_all(["25544", "00011", "11", "99999", "20580"])
+
+    assert sorted(results) == ["00011", "20580", "25544", "99999"] # duplicates are fetched once
+    assert [results[key].status for key in ("25544", "00011", "99999", "20580")] == [UPDATED, UPDATED, MISSING, FAILED]
+    assert results["20580"].error == "HTTP 500"
+    assert catalog.lines("25544") == list(ISS)
+    assert [record.norad_id for record in catalog.records()] == [11, 25544]
+
+
+def test_second_download_is_not_modified(catalog, gp_server, downloader):
+    serve(gp_server, ISS)
+    assert downloader.download_all(["25544"])["25544"].status == UPDATED
+    version = catalog.version()
+
+    result = downloader.download_all(["25544"])["25544"]
+    assert result.status == NOT_MODIFIED and result.count == 0
+    assert gp_server.requests[-1][1].get("If-None-Match") == catalog.validators(downloader.url("25544"))[0]
+    assert catalog.version() == version
+
+
+def test_unknown_catalog_number_is_not_conditional(gp_server, downloader):
+    serve(gp_server, ISS)
+    downloader.download_all(["25544"])
+    downloader.catalog.remove("25544")
+    assert downloader.download_all(["25544"])["25544"].status == UPDATED # the validators alone do not skip a download
+
+
+def test_rate_limit_is_retried(gp_server, downloader):
+    serve(gp_server, ISS)
+    gp_server.failures[("CATNR", "25544")] = [429, 503]
+    assert downloader.download_all(["25544"])["25544"].status == UPDATED
+    assert [request[2] for request in gp_server.requests] == [429, 503, 200]
+
+
+def test_retries_run_out(gp_server, downloader):
+    serve(gp_server, ISS)
+    gp_server.failures[("CATNR", "25544")] = [429, 429, 429]
+    result = downloader.download_all(["25544"])["25544"]
+    assert result.status == FAILED and result.error == "HTTP 429"
+
+
+def test_connection_error_fails(catalog):
+    downloader = TLEDownloader(catalog, base_url="http://127.0.0.1:9/gp.php", max_retries=1, backoff=0.01, timeout=(0.5, 0.5))
+    try:
+        result = downloader.download_all(["25544"])["25544"]
+    finally:
+        downloader.close()
+    assert result.status == FAILED and result.error
+
+
+def test_retry_after():
+    assert retry_after(None) is None
+    assert retry_after("2") == 2.0
+    assert retry_after("-5") == 0.0
+    assert 0 < retry_after(formatdate(time.time() + 60, usegmt=True)) <= 60
+    assert retry_after("soon") is None
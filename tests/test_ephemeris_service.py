@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+from skyfield.api import EarthSatellite, load
+
+from conftest import ISS, SWISSCUBE, VANGUARD
+
+from services.ephemeris_service import EphemerisCache, hermite, iter_ephemeris
+
+
+@pytest.fixture(scope="module")
+def ts():
+    return load.timescale()
+
+
+def satellite_of(element_set, ts):
+    return EarthSatellite(element_set[1], element_set[2], element_set[0], ts)
+
+
+class CountingCache(EphemerisCache):
+    """Records the grid nodes every propagation covers."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.propagated = []
+
+    def propagate_nodes(self, satellite, first, last):
+        self.propagated.append((first, last))
+        return super().propagate_nodes(satellite, first, last)
+
+
+def test_hermite_is_exact_for_cubics():
+    h = 60.0
+    t = np.arange(4) * h
+    coefficients = np.array([[1.0, -2.0, 0.5], [0.1, 0.3, -0.2], [1e-3, 2e-3, 5e-4], [1e-6, -2e-6, 3e-6]])
+    at = lambda t: sum(c * np.asarray(t)[:, None] ** k for k, c in enumerate(coefficients))
+    rate = lambda t: sum(k * c * np.asarray(t)[:, None] ** (k - 1) for k, c in enumerate(coefficients) if k)
+    samples = np.array([10.0, 75.0, 150.0, 179.9])
+    i = (samples // h).astype(int)
+    positions, velocities = hermite(at(t), rate(t), i, (samples / h - i)[:, None], h)
+    np.testing.assert_allclose(positions, at(samples), rtol=1e-12)
+    np.testing.assert_allclose(velocities, rate(samples), rtol=1e-10)
+
+
+@pytest.mark.parametrize("element_set", [ISS, SWISSCUBE], ids=lambda element_set: element_set[0])
+def test_interpolation_within_error_bound(ts, element_set):
+    satellite = satellite_of(element_set, ts)
+    cache = EphemerisCache(ts)
+    times = ts.tt_jd(satellite.epoch.tt + np.linspace(0, 0.05, 1001)) # 72 minutes, most samples between nodes
+    positions, velocities = cache.interpolate(satellite, times)
+    expected = satellite.at(times)
+    error = np.linalg.norm(positions - expected.position.km.T, axis=1)
+    assert error.max() < cache.error_bound(satellite) < 1e-3 # under a metre at the 60 s step
+    np.testing.assert_allclose(velocities, expected.velocity.km_per_s.T, rtol=0, atol=1e-4)
+
+    # the nodes are the SGP4 states, up to the 40 microseconds of a single float Julian date
+    nodes = ts.tt_jd(np.floor(times.tt[:50] / cache.step_days) * cache.step_days)
+    np.testing.assert_allclose(cache.position(satellite, nodes), satellite.at(nodes).position.km.T, rtol=0, atol=5e-4)
+
+
+def test_interpolation_of_an_eccentric_orbit(ts):
+    # SGP4 velocities are not the exact derivative of its positions, for e = 0.15 that costs a few metres
+    satellite = satellite_of(VANGUARD, ts)
+    cache = EphemerisCache(ts)
+    times = ts.tt_jd(satellite.epoch.tt + np.linspace(0, 0.1, 1001))
+    positions = cache.interpolate(satellite, times)[0]
+    assert np.linalg.norm(positions - satellite.at(times).position.km.T, axis=1).max() < 0.01
+    # a ten times smaller step shrinks it by about as much
+    fine = EphemerisCache(ts, step=6)
+    assert np.linalg.norm(fine.interpolate(satellite, times)[0] - satellite.at(times).position.km.T, axis=1).max() < 0.001
+
+
+def test_scalar_time(ts):
+    satellite = satellite_of(ISS, ts)
+    cache = EphemerisCache(ts)
+    time = ts.tt_jd(satellite.epoch.tt + 0.0123)
+    position, velocity = cache.interpolate(satellite, time)
+    assert position.shape == velocity.shape == (3,)
+    np.testing.assert_allclose(position, satellite.at(time).position.km, rtol=0, atol=1e-3)
+
+
+def test_slide_propagates_only_new_nodes(ts):
+    satellite = satellite_of(ISS, ts)
+    cache = CountingCache(ts, step=60, behind=600, ahead=1800)
+    node = int(np.floor(satellite.epoch.tt / cache.step_days))
+    start = ts.tt_jd((node + 0.5) * cache.step_days)
+    table = cache.track(satellite, start)
+    assert cache.propagated == [(node - 10, node + 30)] and table["first_node"] == node - 10
+    assert len(table["positions"]) == 41
+
+    # within the first half of the look-ahead the window stays
+    cache.cover(table, ts.tt_jd((node + 15.5) * cache.step_days))
+    assert len(cache.propagated) == 1
+
+    # past it, only the exposed nodes are propagated and the expired ones dropped
+    cache.cover(table, ts.tt_jd((node + 20.5) * cache.step_days))
+    assert cache.propagated[1:] == [(node + 31, node + 50)]
+    assert table["first_node"] == node + 10 and len(table["positions"]) == 41
+    positions, velocities = EphemerisCache.propagate_nodes(cache, satellite, node + 10, node + 50)
+    np.testing.assert_allclose(table["positions"], positions, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(table["velocities"], velocities, rtol=0, atol=1e-12)
+
+    # going back extends the window at its start, a jump far away propagates the whole window again
+    cache.cover(table, ts.tt_jd((node + 5.5) * cache.step_days))
+    assert cache.propagated[2] == (node - 5, node + 9)
+    cache.cover(table, ts.tt_jd((node + 1000.5) * cache.step_days))
+    assert cache.propagated[3] == (node + 990, node + 1030)
+
+
+def test_slide_covers_a_whole_time_array(ts):
+    satellite = satellite_of(ISS, ts)
+    cache = CountingCache(ts)
+    times = ts.tt_jd(satellite.epoch.tt + np.linspace(0, 1, 25)) # a day, far more than the look-ahead
+    positions = cache.interpolate(satellite, times)[0]
+    assert len(cache.propagated) == 1
+    np.testing.assert_allclose(positions, satellite.at(times).position.km.T, rtol=0, atol=1e-3)
+
+
+def test_iter_ephemeris_chunks(ts):
+    satellite = satellite_of(ISS, ts)
+    start = ts.tt_jd(satellite.epoch.tt)
+    chunks = list(iter_ephemeris(satellite, start, duration=3600, step=60, chunk_size=25))
+    assert [len(chunk.tt) for chunk in chunks] == [25, 25, 11]
+    np.testing.assert_allclose((np.concatenate([chunk.tt for chunk in chunks]) - start.tt) * 86400, np.arange(61) * 60, atol=1e-4)
+    expected = satellite.at(ts.tt_jd(start.whole, start.tt_fraction + np.arange(61) / 1440)).position.km.T
+    np.testing.assert_allclose(np.concatenate([chunk.xyz for chunk in chunks]), expected, rtol=0, atol=1e-9)
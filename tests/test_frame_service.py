@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from skyfield.api import EarthSatellite, load, wgs84
+
+from conftest import ELEMENT_SETS
+
+from services.frame_service import GMST, ITRS, FrameTransformer, ecef_to_geodetic, geodetic_to_ecef
+
+
+@pytest.fixture(scope="module")
+def ts():
+    return load.timescale()
+
+
+def test_rotations_cache_only_repeated_grids(ts):
+    frames = FrameTransformer(max_grids=2)
+    grid = ts.tt_jd(2460420.5 + np.arange(10) / 1440)
+    stack = frames.rotations(grid, ITRS)
+    assert frames.rotations(ts.tt_jd(2460420.5 + np.arange(10) / 1440), ITRS) is stack # an equal grid hits
+
+    # per-frame times pass through without evicting the grid
+    for minute in range(5):
+        frames.rotations(ts.tt_jd(2460421.5 + minute / 1440), ITRS)
+        frames.rotations(ts.tt_jd([2460421.5 + minute / 1440]), GMST)
+        frames.rotations(ts.tt_jd(2460422.5 + np.arange(10) / 1440 + minute), ITRS, memoize=False)
+    assert list(frames.stacks) == [frames.key(grid, ITRS)]
+    assert frames.rotations(grid, ITRS) is stack
+
+
+def test_uncached_rotations_match_cached(ts):
+    frames = FrameTransformer()
+    grid = ts.tt_jd(2460420.5 + np.arange(10) / 1440)
+    vectors = np.random.default_rng(0).normal(size=(10, 3)) * 7000
+    for model in (GMST, ITRS):
+        np.testing.assert_array_equal(frames.eci_to_ecef(vectors, grid, model), frames.eci_to_ecef(vectors, grid, model, memoize=False))
+        scalar = frames.eci_to_ecef(vectors[3], grid[3], model)
+        np.testing.assert_allclose(scalar, frames.eci_to_ecef(vectors, grid, model)[3], atol=1e-9)
+
+
+@pytest.mark.parametrize("element_set", ELEMENT_SETS, ids=lambda element_set: element_set[0])
+def test_ecef_to_geodetic_matches_skyfield(ts, element_set):
+    satellite = EarthSatellite(element_set[1], element_set[2], element_set[0], ts)
+    times = ts.tt_jd(satellite.epoch.tt + np.linspace(0, 1, 289))
+    geocentric = satellite.at(times)
+    latitude, longitude, height = ecef_to_geodetic(FrameTransformer().eci_to_ecef(geocentric.position.km.T, times, ITRS))
+    expected_lat, expected_lon = wgs84.latlon_of(geocentric)
+    np.testing.assert_allclose(latitude, expected_lat.radians, rtol=0, atol=1e-9) # under a centimetre on the ground
+    np.testing.assert_allclose(np.angle(np.exp(1j * (longitude - expected_lon.radians))), 0, atol=1e-9)
+    np.testing.assert_allclose(height, wgs84.height_of(geocentric).km, rtol=0, atol=1e-6)
+
+
+def test_geodetic_round_trip():
+    rng = np.random.default_rng(0)
+    latitude = np.concatenate([rng.uniform(-np.pi / 2, np.pi / 2, 1000), [np.pi / 2, -np.pi / 2, 0]])
+    longitude = np.concatenate([rng.uniform(-np.pi, np.pi, 1000), [0, 1, -np.pi / 2]])
+    height = np.concatenate([rng.uniform(-10, 36000, 1000), [0, 400, 35786]]) # km, from below the surface out to GEO
+    positions = geodetic_to_ecef(latitude, longitude, height)
+    assert positions.shape == (1003, 3)
+
+    back = ecef_to_geodetic(positions)
+    np.testing.assert_allclose(back[0], latitude, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(back[1][:-3], longitude[:-3], rtol=0, atol=1e-12)
+    np.testing.assert_allclose(back[2], height, rtol=0, atol=1e-8) # km, ten micrometres
+
+    # a scaled ellipsoid, e.g. the unit globe of the 3D view
+    unit = ecef_to_geodetic(geodetic_to_ecef(latitude, longitude, height / 6378.137, radius=1), radius=1)
+    np.testing.assert_allclose(unit[0], latitude, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(unit[2], height / 6378.137, rtol=0, atol=1e-12)
+
+
+def test_geodetic_shapes():
+    latitude, longitude, height = ecef_to_geodetic(np.array([6378.137, 0, 0]))
+    assert np.shape(latitude) == () and latitude == 0 and longitude == 0 and abs(height) < 1e-9
+    latitude, longitude, height = ecef_to_geodetic(np.zeros((2, 5, 3)) + [0, 0, 6356.7523142])
+    assert latitude.shape == (2, 5)
+    np.testing.assert_allclose(latitude, np.pi / 2)
+    np.testing.assert_allclose(height, 0, atol=1e-6)
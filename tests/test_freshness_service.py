@@ -0,0 +1,89 @@
+import pytest
+
+from conftest import ELEMENT_SETS, ISS, SWISSCUBE, VANGUARD, tle_text, with_epoch
+
+from services.download_service import FAILED, TLEDownloader
+from services.freshness_service import FreshnessScheduler
+from services.ingest_service import GroupIngestor
+
+NOW = 1714561600.0 # 2024-05-01 11:06 UTC, ISS's element set is 13 days old and due within the 2 day lead
+
+
+@pytest.fixture
+def scheduler(catalog, gp_server):
+    catalog.put(*ISS)
+    downloader = TLEDownloader(catalog, base_url=gp_server.url, max_retries=0, backoff=0.01)
+    yield FreshnessScheduler(catalog, downloader, failure_backoff=300, retry_after=3600)
+    downloader.close()
+
+
+def test_failed_downloads_back_off(scheduler, gp_server):
+    gp_server.failures[("CATNR", "25544")] = [500, 500]
+    assert scheduler.due(NOW) == [25544]
+    event = scheduler.run_once(NOW)
+    assert event.results["25544"].status == FAILED and not event.updated
+
+    assert scheduler.due(NOW + 299) == [] # an offline pass is not retried right away
+    assert scheduler.run_once(NOW + 300).results["25544"].status == FAILED
+    assert scheduler.due(NOW + 300 + 599) == [] # the backoff doubles
+    assert scheduler.due(NOW + 300 + 600) == [25544]
+
+
+def test_success_clears_the_failures(scheduler, gp_server):
+    gp_server.failures[("CATNR", "25544")] = [500]
+    scheduler.run_once(NOW)
+    gp_server.bodies[("CATNR", "25544", "TLE")] = tle_text([ISS]).encode()
+    scheduler.run_once(NOW + 300) # the same epoch again, nothing newer
+    assert 25544 not in scheduler.failed
+    assert scheduler.due(NOW + 600) == [] # now held back by retry_after instead
+    assert scheduler.due(NOW + 300 + 3600) == [25544]
+
+
+def test_explicit_requests_ignore_the_backoff(scheduler, gp_server):
+    gp_server.failures[("CATNR", "25544")] = [500]
+    scheduler.run_once(NOW)
+    scheduler.request(["25544"])
+    assert scheduler.due(NOW + 1) == [25544]
+
+
+def test_old_attempts_are_pruned(scheduler, gp_server):
+    gp_server.failures[("CATNR", "25544")] = [500]
+    scheduler.run_once(NOW)
+    scheduler.attempted[11] = NOW - 3600 # an object that is no longer due, held back long enough
+    scheduler.run_once(NOW + 1)
+    assert 11 not in scheduler.attempted and 25544 in scheduler.failed
+    scheduler.prune(NOW + 3600)
+    assert scheduler.failed == {}
+
+
+def test_mostly_due_groups_are_refreshed_with_one_request(catalog, gp_server):
+    gp_server.bodies[("GROUP", "stations", "TLE")] = tle_text(ELEMENT_SETS).encode()
+    ingestor = GroupIngestor(catalog, base_url=gp_server.url)
+    ingestor.ingest_group("stations")
+    downloader = TLEDownloader(catalog, base_url=gp_server.url, max_retries=0)
+    scheduler = FreshnessScheduler(catalog, downloader, ingestor=ingestor)
+    later = NOW + 8 * 86400 # ISS and VANGUARD 2 are past their margin, SWISSCUBE is not yet due
+    try:
+        assert scheduler.plan(later) == ({"stations": [11, 25544, 35932]}, [])
+
+        fresh = with_epoch(ISS, "24130.00000000")
+        gp_server.bodies[("GROUP", "stations", "TLE")] = tle_text([fresh, VANGUARD, SWISSCUBE]).encode()
+        event = scheduler.run_once(later)
+        assert event.updated == {25544}
+        assert [request[0] for request in gp_server.requests if "CATNR" in request[0]] == []
+        assert catalog.get(25544).line1 == fresh[1]
+        assert set(scheduler.attempted) == {11, 35932} # nothing newer for them, held back like a single download
+    finally:
+        downloader.close()
+
+
+def test_partly_due_groups_are_refreshed_one_by_one(catalog, gp_server):
+    gp_server.bodies[("GROUP", "stations", "TLE")] = tle_text(ELEMENT_SETS).encode()
+    ingestor = GroupIngestor(catalog, base_url=gp_server.url)
+    ingestor.ingest_group("stations")
+    downloader = TLEDownloader(catalog, base_url=gp_server.url, max_retries=0)
+    try:
+        scheduler = FreshnessScheduler(catalog, downloader, ingestor=ingestor)
+        assert scheduler.plan(NOW) == ({}, [25544]) # one of three is due
+    finally:
+        downloader.close()
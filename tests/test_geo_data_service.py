@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("shapely")
+
+from services.geo_data_service import GeoDataService
+
+NAN = np.nan
+
+
+@pytest.fixture(scope="module")
+def service():
+    return GeoDataService()
+
+
+def assert_track(actual, lons, lats):
+    np.testing.assert_allclose(actual[0], lons, atol=1e-12)
+    np.testing.assert_allclose(actual[1], lats, atol=1e-12)
+
+
+def test_antimeridian_crossing(service):
+    # eastward and westward, the break is at the latitude where the segment meets +-180
+    assert_track(service.handle_dateline([170, -170], [0, 2]), [170, 180, NAN, -180, -170], [0, 1, NAN, 1, 2])
+    assert_track(service.handle_dateline([-175, 165], [10, 6]), [-175, -180, NAN, 180, 165], [10, 9, NAN, 9, 6])
+
+
+def test_polar_pass(service):
+    assert_track(service.handle_dateline([10, -170], [86, 87]), [10, 10, NAN, -170, -170], [86, 90, NAN, 90, 87])
+    assert_track(service.handle_dateline([-60, 115], [-80, -82]), [-60, -60, NAN, 115, 115], [-80, -90, NAN, -90, -82])
+
+
+def test_high_latitude_swing_is_kept(service):
+    # a fast swing near the top of the orbit, too short for a pole crossing
+    assert_track(service.handle_dateline([10, 100, 140], [80, 85, 83]), [10, 100, 140], [80, 85, 83])
+    # a large step at low latitude is an antimeridian crossing, not a polar pass
+    edge = 50 + 2 * 60 / 170
+    assert_track(service.handle_dateline([120, -70], [50, 52]), [120, 180, NAN, -180, -70], [50, edge, NAN, edge, 52])
+
+
+def test_batch_tracks_are_joined_with_nan(service):
+    lons = np.array([[170, -170, -160], [0, 10, 20]])
+    lats = np.array([[0, 2, 4], [5, 5, 5]])
+    assert_track(service.handle_dateline(lons, lats), [170, 180, NAN, -180, -170, -160, NAN, 0, 10, 20], [0, 1, NAN, 1, 2, 4, NAN, 5, 5, 5])
+
+    # the same as the tracks one by one, joined by one NaN each
+    joined = [service.handle_dateline(track_lons, track_lats) for track_lons, track_lats in zip(lons, lats)]
+    expected = [np.concatenate([joined[0][axis], [NAN], joined[1][axis]]) for axis in (0, 1)]
+    assert_track(service.handle_dateline(lons, lats), *expected)
+
+
+def test_none_breaks_and_empty_tracks(service):
+    assert_track(service.handle_dateline([0, None, 10], [0, None, 5]), [0, NAN, 10], [0, NAN, 5])
+    lons, lats = service.handle_dateline([], [])
+    assert lons.shape == lats.shape == (0,)
@@ -0,0 +1,171 @@
+import numpy as np
+import pytest
+
+shapely = pytest.importorskip("shapely")
+
+from services.geo_lookup import BOUNDARY, LAND, OCEAN, UNKNOWN, GeoLookup, Location, RegionIndex, grid_cells, region_timeline
+
+
+def synthetic_lookup(land=True):
+    """Two countries sharing the border at lon 10, a strait over that border and a land mass around both."""
+    countries = RegionIndex([shapely.box(0, -10, 10, 10), shapely.box(10, -10, 20, 10)], ["A", "B"])
+    marine = RegionIndex([shapely.box(8, -2, 12, 2)], ["Strait"])
+    continent = RegionIndex([shapely.box(-20, -20, 30, 20)], ["Land"]) if land else None
+    return GeoLookup(countries, marine, continent)
+
+
+@pytest.mark.parametrize("lon, lat, expected", [
+    (9, 0, Location(OCEAN, "A", "Strait")), # marine wins over the country under it
+    (5, 5, Location(LAND, "A", None)),
+    (15, -5, Location(LAND, "B", None)),
+    (25, 0, Location(LAND, None, None)), # only on the land layer
+    (40, 0, Location(OCEAN, None, None)),
+])
+def test_lookup_precedence(lon, lat, expected):
+    assert synthetic_lookup().lookup(lon, lat) == expected
+
+
+def test_lookup_without_land_layer():
+    lookup = synthetic_lookup(land=False)
+    assert lookup.lookup(40, 0) == Location(UNKNOWN, None, None)
+    assert lookup.lookup(5, 5) == Location(LAND, "A", None)
+
+
+def test_points_on_boundaries():
+    lookup = synthetic_lookup()
+    # a point on an edge is inside neither polygon of the edge, contains_xy() excludes the boundary
+    assert lookup.lookup(10, 5) == Location(LAND, None, None)
+    assert lookup.lookup(8, 0) == Location(LAND, "A", None)
+    assert lookup.lookup(-20, 0) == Location(OCEAN, None, None)
+    # just inside, the polygon is found again
+    assert lookup.lookup(10 - 1e-9, 5).country == "A" and lookup.lookup(10 + 1e-9, 5).country == "B"
+    assert lookup.lookup(8 + 1e-9, 0).marine == "Strait"
+
+
+def test_batch_matches_scalar():
+    lookup = synthetic_lookup()
+    rng = np.random.default_rng(0)
+    lons = np.concatenate([rng.uniform(-30, 45, 200), [10, 8, -20, 0, 20]])
+    lats = np.concatenate([rng.uniform(-25, 25, 200), [5, 0, 0, 10, -10]])
+
+    batch = lookup.lookup(lons.reshape(5, -1), lats.reshape(5, -1)) # any shape, here (5, 41)
+    assert all(field.shape == (5, 41) for field in batch)
+    for i, (lon, lat) in enumerate(zip(lons, lats)):
+        assert Location(*(field.ravel()[i] for field in batch)) == lookup.lookup(lon, lat)
+
+    codes = lookup.codes(lons, lats)
+    np.testing.assert_array_equal(lookup.region_names(codes), np.where(batch.marine.ravel() != None, batch.marine.ravel(), np.where(batch.country.ravel() != None, batch.country.ravel(), batch.surface.ravel())))
+
+
+def test_locate_track():
+    from services.geo_data_service import GeoDataService
+
+    service = GeoDataService()
+    service._lookup = synthetic_lookup()
+    surface, country, marine = service.locate_Track([5, 9, 25, 40], [5, 0, 0, 0])
+    assert surface.tolist() == [LAND, OCEAN, LAND, OCEAN]
+    assert country.tolist() == ["A", "A", None, None]
+    assert marine.tolist() == [None, "Strait", None, None]
+    assert service.check_location_land_or_sea(15, -5) == ("Land", "B")
+
+
+def grid_lookup(tmp_path, resolution=1.0):
+    layers = synthetic_lookup()
+    # a round country, its boundary cuts the grid cells at every angle
+    countries = RegionIndex(list(layers.countries.geometries) + [shapely.Point(-10, 30).buffer(7)], ["A", "B", "C"])
+    lookup, exact = GeoLookup(countries, layers.marine, layers.land), GeoLookup(countries, layers.marine, layers.land)
+    lookup.use_grid(resolution, str(tmp_path / "grid.npy"))
+    return lookup, exact
+
+
+def assert_same_lookup(lookup, exact, lons, lats):
+    for actual, expected in zip(lookup.locate(lons, lats), exact.locate(lons, lats)):
+        np.testing.assert_array_equal(actual, expected)
+    np.testing.assert_array_equal(lookup.codes(lons, lats), exact.codes(lons, lats))
+
+
+def test_grid_matches_exact_lookup(tmp_path):
+    lookup, exact = grid_lookup(tmp_path)
+    rng = np.random.default_rng(1)
+    assert_same_lookup(lookup, exact, rng.uniform(-180, 180, 20000), rng.uniform(-90, 90, 20000))
+    assert_same_lookup(lookup, exact, rng.uniform(-35, 45, 20000), rng.uniform(-30, 45, 20000)) # around the polygons
+
+
+def test_grid_boundary_cells(tmp_path):
+    lookup, exact = grid_lookup(tmp_path, resolution=2.0)
+    rng = np.random.default_rng(2)
+    # points around every polygon edge and the circle, on both sides and exactly on it
+    angles = rng.uniform(0, 2 * np.pi, 2000)
+    radius = 7 + rng.uniform(-1, 1, 2000)
+    lons = np.concatenate([-10 + radius * np.cos(angles), np.full(500, 10.0), rng.uniform(-1, 1, 500) + 10, np.full(100, 8.0)])
+    lats = np.concatenate([30 + radius * np.sin(angles), rng.uniform(-10, 10, 500), rng.uniform(-10, 10, 500), rng.uniform(-2, 2, 100)])
+    assert_same_lookup(lookup, exact, lons, lats)
+
+    rows, cols = grid_cells(2.0, lons[:2000], lats[:2000])
+    assert (lookup.grid.grid[0][rows, cols] & BOUNDARY).any() # the circle is flagged in the grid, so those points were tested exactly
+
+
+def test_grid_nan_points(tmp_path):
+    lookup, exact = grid_lookup(tmp_path)
+    lons, lats = np.array([np.nan, 5, -180, np.nan]), np.array([0, 5, np.nan, np.nan])
+    assert_same_lookup(lookup, exact, lons, lats)
+    surface, country, marine = lookup.lookup(lons, lats)
+    assert country.tolist() == [None, "A", None, None] and marine.tolist() == [None] * 4
+    assert lookup.lookup(np.nan, np.nan) == exact.lookup(np.nan, np.nan)
+
+
+def test_grid_is_reused(tmp_path):
+    lookup, exact = grid_lookup(tmp_path)
+    path = tmp_path / "grid.npy"
+    built = path.stat().st_mtime_ns
+    again = GeoLookup(lookup.countries, lookup.marine, lookup.land)
+    again.use_grid(1.0, str(path))
+    assert path.stat().st_mtime_ns == built
+    np.testing.assert_array_equal(again.grid.grid, lookup.grid.grid)
+
+
+def two_regions():
+    """A country from lon 0 to 10 and a sea from lon 20 to 30, nothing else."""
+    return GeoLookup(RegionIndex([shapely.box(0, -10, 10, 10)], ["A"]), RegionIndex([shapely.box(20, -10, 30, 10)], ["Sea"]))
+
+
+EQUATOR_TIMES = np.linspace(0, 1, 61)
+EQUATOR_LONS = -5 + 60 * EQUATOR_TIMES # one degree per sample along the equator
+CROSSINGS = [(UNKNOWN, 0, 5 / 60), ("A", 5 / 60, 15 / 60), (UNKNOWN, 15 / 60, 25 / 60), ("Sea", 25 / 60, 35 / 60), (UNKNOWN, 35 / 60, 1)]
+
+
+def assert_timeline(timeline, expected, tolerance):
+    assert [interval.region for interval in timeline] == [region for region, _, _ in expected]
+    np.testing.assert_allclose([interval[1:] for interval in timeline], [run[1:] for run in expected], atol=tolerance)
+
+
+def test_region_timeline_crossings():
+    lookup = two_regions()
+    lats = np.zeros_like(EQUATOR_LONS)
+    step = EQUATOR_TIMES[1]
+    assert_timeline(region_timeline(lookup, EQUATOR_TIMES, EQUATOR_LONS, lats), CROSSINGS, step / 2**12)
+
+    # on the propagated positions the bisection converges to the exact crossing times
+    def positions(tracks, times):
+        return -5 + 60 * times, np.zeros_like(times)
+
+    timeline = region_timeline(lookup, EQUATOR_TIMES, EQUATOR_LONS, lats, positions, iterations=30)
+    assert_timeline(timeline, CROSSINGS, 1e-9)
+
+
+def test_region_timeline_batch():
+    lookup = two_regions()
+    lons = np.stack([EQUATOR_LONS, EQUATOR_LONS[::-1], np.full(61, 5.0)])
+    lats = np.zeros_like(lons)
+    timelines = region_timeline(lookup, EQUATOR_TIMES, lons, lats)
+    assert len(timelines) == 3
+    for timeline, track_lons, track_lats in zip(timelines, lons, lats):
+        assert timeline == region_timeline(lookup, EQUATOR_TIMES, track_lons, track_lats)
+    assert_timeline(timelines[1], [(region, 1 - t_exit, 1 - t_enter) for region, t_enter, t_exit in CROSSINGS[::-1]], EQUATOR_TIMES[1] / 2**12)
+    assert timelines[2] == [("A", 0.0, 1.0)]
+
+
+def test_region_timeline_empty_tracks():
+    lookup = two_regions()
+    assert region_timeline(lookup, [], np.empty(0), np.empty(0)) == []
+    assert region_timeline(lookup, [], np.empty((2, 0)), np.empty((2, 0))) == [[], []]
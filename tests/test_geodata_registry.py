@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+shapely = pytest.importorskip("shapely")
+
+from services.geodata_registry import GeoLayer, GeoLayerRegistry
+
+
+class ShapefileCounter(GeoLayerRegistry):
+    """A registry whose 'shapefile' is a synthetic layer, counting how often it is parsed."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parsed = 0
+
+    def read_source(self, name, path):
+        self.parsed += 1
+        geometries = np.array([shapely.box(0, 0, 10, 10), shapely.Point(-10, 30).buffer(5)], dtype=object)
+        columns = {"ADMIN": np.array(["A", "C"]), "pop": np.array([3, 4])}
+        return GeoLayer(name, geometries, shapely.bounds(geometries), columns, "EPSG:4326")
+
+
+@pytest.fixture
+def registry(tmp_path):
+    (tmp_path / "assets").mkdir()
+    for suffix in (".shp", ".dbf"):
+        (tmp_path / "assets" / ("countries" + suffix)).write_bytes(b"shape")
+    return lambda: ShapefileCounter(str(tmp_path / "assets"), str(tmp_path / "cache"), {"countries": "countries.shp"})
+
+
+def test_cache_round_trip(registry):
+    first = registry()
+    written = first["countries"]
+    assert first.parsed == 1 and os.path.exists(first.cache_path("countries"))
+
+    second = registry()
+    layer = second["countries"]
+    assert second.parsed == 0 # read from the copy
+    assert layer.crs == "EPSG:4326" and len(layer) == 2
+    assert all(shapely.equals(layer.geometries, written.geometries))
+    np.testing.assert_array_equal(layer.bounds, written.bounds)
+    assert list(layer.columns) == ["ADMIN", "pop"]
+    np.testing.assert_array_equal(layer.column("ADMIN"), ["A", "C"])
+    np.testing.assert_array_equal(layer.column("pop"), [3, 4])
+    assert second["countries"] is layer
+
+
+def test_changed_shapefile_invalidates_the_copy(registry, tmp_path):
+    first = registry()
+    first["countries"]
+    key = first.signature(["countries"])
+    assert first.read_cache("countries", np.array([0, 0, 0, 0])) is None # any other signature is stale
+
+    (tmp_path / "assets" / "countries.dbf").write_bytes(b"a longer attribute table")
+    second = registry()
+    second["countries"]
+    assert second.parsed == 1
+    assert second.signature(["countries"]) != key
+
+    third = registry()
+    third["countries"]
+    assert third.parsed == 0 # the rewritten copy matches the new shapefile
+
+
+@pytest.mark.parametrize("damage", [lambda data: data[:len(data) // 2], lambda data: b"not a zip file"])
+def test_corrupt_copy_is_rebuilt(registry, damage):
+    first = registry()
+    first["countries"]
+    path = first.cache_path("countries")
+    with open(path, "rb") as file:
+        data = file.read()
+    with open(path, "wb") as file:
+        file.write(damage(data))
+
+    second = registry()
+    layer = second["countries"]
+    assert second.parsed == 1 and len(layer) == 2
+    with open(path, "rb") as file:
+        assert file.read() == data # rewritten whole
+
+    third = registry()
+    third["countries"]
+    assert third.parsed == 0
@@ -0,0 +1,185 @@
+import csv
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+from sgp4.api import Satrec
+from sgp4.conveniences import sat_epoch_datetime
+
+from conftest import ELEMENT_SETS, ISS, SWISSCUBE, VANGUARD, tle_text
+
+from services.catalog_service import CatalogIndex
+from services.ingest_service import CSV, JSON, TLE, GroupIngestor, element_sets, iter_json_array
+
+
+def omm_fields(element_set):
+    """Return the OMM fields Celestrak serves for an element set, as strings."""
+    name, line1, line2 = element_set
+    satrec = Satrec.twoline2rv(line1, line2)
+    year = int(line1[9:11])
+    return {
+        "OBJECT_NAME": name,
+        "OBJECT_ID": f"{year + (2000 if year < 57 else 1900)}-{line1[11:14]}{line1[14:17].strip()}",
+        "EPOCH": sat_epoch_datetime(satrec).strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        "MEAN_MOTION": line2[52:63].strip(),
+        "ECCENTRICITY": "0." + line2[26:33],
+        "INCLINATION": line2[8:16].strip(),
+        "RA_OF_ASC_NODE": line2[17:25].strip(),
+        "ARG_OF_PERICENTER": line2[34:42].strip(),
+        "MEAN_ANOMALY": line2[43:51].strip(),
+        "EPHEMERIS_TYPE": "0",
+        "CLASSIFICATION_TYPE": "U",
+        "NORAD_CAT_ID": str(satrec.satnum),
+        "ELEMENT_SET_NO": line1[64:68].strip(),
+        "REV_AT_EPOCH": line2[63:68].strip(),
+        "BSTAR": repr(satrec.bstar),
+        "MEAN_MOTION_DOT": line1[33:43].strip(),
+        "MEAN_MOTION_DDOT": "0",
+    }
+
+
+def csv_body(element_sets):
+    rows = [omm_fields(element_set) for element_set in element_sets]
+    text = io.StringIO()
+    writer = csv.DictWriter(text, fieldnames=list(rows[0]), lineterminator="\r\n")
+    writer.writeheader()
+    writer.writerows(rows)
+    return text.getvalue().encode()
+
+
+def json_body(element_sets):
+    return json.dumps([omm_fields(element_set) for element_set in element_sets], indent=1).encode()
+
+
+BODIES = {TLE: lambda sets: tle_text(sets).encode(), CSV: csv_body, JSON: json_body}
+
+
+def assert_same_orbit(record, element_set):
+    """The stored lines propagate like the served element set, OMM sets go through sgp4's exporter."""
+    jd, fr = np.full(3, 2460420.5), np.array([0.0, 0.25, 0.5])
+    stored = Satrec.twoline2rv(record.line1, record.line2).sgp4_array(jd, fr)[1]
+    served = Satrec.twoline2rv(element_set[1], element_set[2]).sgp4_array(jd, fr)[1]
+    np.testing.assert_allclose(stored, served, atol=1e-3)
+
+
+@pytest.mark.parametrize("fmt", [TLE, CSV, JSON])
+def test_ingest_group(catalog, gp_server, fmt):
+    gp_server.bodies[("GROUP", "stations", fmt)] = BODIES[fmt](ELEMENT_SETS)
+    ingestor = GroupIngestor(catalog, base_url=gp_server.url, fmt=fmt)
+
+    assert ingestor.ingest_group("Stations") == 3
+    records = {record.norad_id: record for record in catalog.records()}
+    assert sorted(records) == [11, 25544, 35932]
+    for name, line1, line2 in ELEMENT_SETS:
+        record = records[int(line1[2:7])]
+        assert record.name == name
+        assert record.source == "celestrak:GROUP=stations"
+        assert_same_orbit(record, (name, line1, line2))
+    assert catalog.group_members("stations") == [11, 25544, 35932]
+    assert catalog.groups()["stations"][1] == 3
+
+
+@pytest.mark.parametrize("fmt", [TLE, CSV, JSON])
+def test_ingest_group_not_modified(catalog, gp_server, fmt):
+    gp_server.bodies[("GROUP", "stations", fmt)] = BODIES[fmt](ELEMENT_SETS)
+    ingestor = GroupIngestor(catalog, base_url=gp_server.url, fmt=fmt)
+    ingestor.ingest_group("stations")
+    version = catalog.version()
+
+    assert ingestor.ingest_group("stations") == 0
+    assert len(gp_server.statuses(304)) == 1
+    assert gp_server.requests[-1][1].get("If-None-Match") is not None
+    assert catalog.version() == version # nothing was written
+    assert catalog.group_members("stations") == [11, 25544, 35932]
+
+    # a changed group is downloaded again and replaces the members
+    gp_server.bodies[("GROUP", "stations", fmt)] = BODIES[fmt]([ISS, SWISSCUBE])
+    assert ingestor.ingest_group("stations") == 2
+    assert catalog.group_members("stations") == [25544, 35932]
+    assert catalog.groups_of(11) == [] and 11 in catalog
+
+
+def test_ingest_group_missing(catalog, gp_server):
+    ingestor = GroupIngestor(catalog, base_url=gp_server.url)
+    assert ingestor.ingest_group("nothing") == 0
+    assert catalog.group_members("nothing") == []
+    assert "nothing" not in catalog.groups()
+    assert len(catalog) == 0
+
+
+@pytest.mark.parametrize("body", [b"No GP data found", b""])
+def test_empty_download_keeps_the_group(catalog, gp_server, body):
+    gp_server.bodies[("GROUP", "stations", TLE)] = BODIES[TLE](ELEMENT_SETS)
+    ingestor = GroupIngestor(catalog, base_url=gp_server.url)
+    ingestor.ingest_group("stations")
+    url = ingestor.url(GROUP="stations")
+    validators = catalog.validators(url)
+    version = catalog.version()
+
+    gp_server.bodies[("GROUP", "stations", TLE)] = body
+    assert ingestor.ingest_group("stations") == 0
+    assert catalog.group_members("stations") == [11, 25544, 35932]
+    assert catalog.groups()["stations"][1] == 3
+    assert catalog.validators(url) == validators
+    assert catalog.version() == version
+
+
+def test_ingest_families_reports_failures(catalog, gp_server):
+    gp_server.bodies[("GROUP", "stations", TLE)] = BODIES[TLE]([ISS])
+    gp_server.failures[("GROUP", "broken")] = [500]
+    ingestor = GroupIngestor(catalog, base_url=gp_server.url)
+    assert ingestor.ingest_families([{"query": "stations"}, {"query": "broken"}]) == {"stations": 1, "broken": None}
+
+
+def test_fetch_does_not_write(catalog, gp_server):
+    gp_server.bodies[("NAME", "ISS", JSON)] = json_body([ISS])
+    ingestor = GroupIngestor(catalog, base_url=gp_server.url)
+    element_sets = ingestor.fetch(JSON, NAME="ISS")
+    assert [name for name, line1, line2 in element_sets] == ["ISS (ZARYA)"]
+    assert len(catalog) == 0
+
+
+def test_ingest_file(catalog, tmp_path):
+    path = tmp_path / "sets.csv"
+    path.write_bytes(b"\xef\xbb\xbf" + csv_body([VANGUARD, SWISSCUBE]))
+    ingestor = GroupIngestor(catalog)
+    assert ingestor.ingest_file(str(path), group="Local") == 2
+    assert catalog.group_members("local") == [11, 35932]
+    assert catalog.get(11).source == "ingest:" + str(path)
+
+
+def test_ingest_file_does_not_move_the_directory_watermark(catalog, tmp_path):
+    tle_dir = tmp_path / "tle_data"
+    tle_dir.mkdir()
+    now = time.time()
+    (tle_dir / "25544.tle").write_text(tle_text([ISS]))
+    os.utime(tle_dir / "25544.tle", (now - 1000, now - 1000))
+    catalog.import_directory(str(tle_dir))
+
+    # ingested now, after a directory file that was copied in with an older modification time
+    path = tmp_path / "sets.tle"
+    path.write_text(tle_text([VANGUARD]))
+    GroupIngestor(catalog).ingest_file(str(path))
+    (tle_dir / "35932.tle").write_text(tle_text([SWISSCUBE]))
+    os.utime(tle_dir / "35932.tle", (now - 500, now - 500))
+
+    index = CatalogIndex(catalog, str(tle_dir))
+    assert sorted(index.names) == [11, 25544, 35932]
+
+
+def test_element_sets_skips_records_without_tle_form():
+    fields = omm_fields(ISS)
+    broken = dict(fields, MEAN_MOTION="fast")
+    body = json.dumps([fields, broken]).encode()
+    assert [name for name, line1, line2 in element_sets(io.BytesIO(body))] == ["ISS (ZARYA)"]
+
+
+def test_iter_json_array_across_chunks():
+    items = [{"index": i, "text": "x" * (i % 7)} for i in range(200)]
+    text = io.StringIO(json.dumps(items))
+    assert list(iter_json_array(text, chunk_size=16)) == items
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('{"a": 1}')))
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from skyfield.api import EarthSatellite, load
+
+from conftest import ELEMENT_SETS, ISS
+
+from services.propagation_service import TEME_to_GCRS, ConstellationPropagator, PropagationPool, propagate, propagate_TEME
+
+
+@pytest.fixture(scope="module")
+def ts():
+    return load.timescale()
+
+
+@pytest.mark.parametrize("element_set", ELEMENT_SETS, ids=lambda element_set: element_set[0])
+def test_propagate_matches_skyfield(ts, element_set):
+    satellite = EarthSatellite(element_set[1], element_set[2], element_set[0], ts)
+    times = ts.tt_jd(satellite.epoch.tt + np.linspace(-2, 5, 337))
+    positions, velocities, errors = propagate(satellite, times)
+    expected = satellite.at(times)
+    assert positions.shape == velocities.shape == (337, 3) and not errors.any()
+    np.testing.assert_allclose(positions, expected.position.km.T, rtol=0, atol=1e-9) # km, a micrometre
+    np.testing.assert_allclose(velocities, expected.velocity.km_per_s.T, rtol=0, atol=1e-12)
+
+    # Terrestrial Time Julian dates and scalar times give the same states
+    np.testing.assert_array_equal(propagate(satellite, times.tt)[0], positions)
+    position, velocity, error = propagate(satellite, times[100])
+    assert position.shape == (1, 3)
+    np.testing.assert_allclose(position[0], positions[100], rtol=0, atol=1e-9)
+
+
+def test_TEME_to_GCRS_scalar_matches_array(ts):
+    satellite = EarthSatellite(ISS[1], ISS[2], ISS[0], ts)
+    times = ts.tt_jd(satellite.epoch.tt + np.arange(4) / 24)
+    teme = propagate_TEME(satellite.model, times.whole, times.tai_fraction - times._leap_seconds() / 86400)
+    positions, velocities = TEME_to_GCRS(teme[0], teme[1], times)
+    for i in range(len(times)):
+        position, velocity = TEME_to_GCRS(teme[0][i:i + 1], teme[1][i:i + 1], times[i])
+        np.testing.assert_allclose(position[0], positions[i], rtol=0, atol=1e-9)
+        np.testing.assert_allclose(velocity[0], velocities[i], rtol=0, atol=1e-12)
+    # a rotation, lengths are kept
+    np.testing.assert_allclose(np.linalg.norm(positions, axis=1), np.linalg.norm(teme[0], axis=1), rtol=1e-14)
+
+
+def constellation(dtype=np.float64):
+    return ConstellationPropagator.from_tle_lines([line for element_set in ELEMENT_SETS for line in element_set], dtype)
+
+
+def test_pool_chunks_match_propagate(ts):
+    propagator = constellation()
+    times = ts.tt_jd(2460420.5 + np.arange(50) / 1440)
+    expected = propagator.propagate(times)
+
+    # a few kilobytes per chunk forces several time chunks and one satellite per shard
+    with PropagationPool(max_workers=2, shards_per_worker=2, chunk_bytes=2048) as pool:
+        chunks = list(pool.chunks(propagator, times))
+        assert len(chunks) > 1
+        assert chunks[0][0] == 0 and chunks[-1][1] == 50
+        assert all(last == following[0] for (_, last, *_), following in zip(chunks, chunks[1:]))
+        gathered = pool.propagate(propagator, times) # the same workers, the element sets are not sent again
+
+    for chunked, whole, actual in zip((2, 3, 4), expected, gathered):
+        np.testing.assert_array_equal(np.concatenate([chunk[chunked] for chunk in chunks], axis=1), whole)
+        np.testing.assert_array_equal(actual, whole)
+
+
+def test_pool_restarts_for_another_constellation(ts):
+    times = ts.tt_jd(2460420.5 + np.arange(5) / 1440)
+    single = ConstellationPropagator.from_tle_lines(list(ISS), np.float32)
+    with PropagationPool(max_workers=1) as pool:
+        pool.propagate(constellation(), times)
+        positions, velocities, errors = pool.propagate(single, times)
+    assert positions.shape == (1, 5, 3) and positions.dtype == np.float32
+    np.testing.assert_array_equal(positions, single.propagate(times)[0])
@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+import pytest
+import skyfield
+from skyfield.api import EarthSatellite, load
+
+from conftest import ISS, with_epoch
+
+from services.sun_service import (
+    PENUMBRA, PENUMBRA_ENTRY, PENUMBRA_EXIT, SUNLIT, UMBRA, UMBRA_ENTRY, UMBRA_EXIT, SunService,
+)
+
+# the DE430 excerpt that ships with Skyfield's own tests, 2015-02-26 to 2015-03-06
+KERNEL = os.path.join(os.path.dirname(skyfield.__file__), "tests", "data", "de430-2015-03-02.bsp")
+
+
+@pytest.fixture(scope="module")
+def ts():
+    return load.timescale()
+
+
+@pytest.fixture(scope="module")
+def ephemeris():
+    if not os.path.exists(KERNEL):
+        pytest.skip("the DE430 excerpt of Skyfield's tests is not installed")
+    return load(KERNEL)
+
+
+@pytest.fixture(scope="module")
+def satellite(ts):
+    element_set = with_epoch(ISS, "15060.00000000") # 2015-03-01, inside the excerpt
+    return EarthSatellite(element_set[1], element_set[2], element_set[0], ts)
+
+
+def test_sun_position(ts, ephemeris):
+    sun = SunService(ts, ephemeris)
+    times = ts.tt_jd(2457083.0 + np.linspace(0, 1, 1001))
+    expected = (ephemeris["sun"] - ephemeris["earth"]).at(times).position.km.T
+    np.testing.assert_allclose(sun.position(times.tt), expected, rtol=0, atol=1e-3) # km, an hourly table
+    assert sun.position(times.tt[5]).shape == (3,)
+    assert sun.position(times.tt.reshape(7, 143)).shape == (7, 143, 3)
+
+
+def test_is_sunlit_matches_skyfield(ts, ephemeris, satellite):
+    sun = SunService(ts, ephemeris)
+    times = ts.tt_jd(2457083.0 + np.arange(8640) / 8640) # a day at 10 s
+    geocentric = satellite.at(times)
+    positions = geocentric.position.km.T
+    sunlit = sun.is_sunlit(positions, times.tt)
+    expected = geocentric.is_sunlit(ephemeris)
+    # Skyfield's shadow is a cylinder through the Earth's centre, the cone differs for a few seconds at each boundary
+    assert 10 <= np.sum(sunlit != expected) <= 60 and sunlit.mean() == pytest.approx(expected.mean(), abs=0.005)
+    assert 0.5 < sunlit.mean() < 0.8
+
+    state = sun.shadow(positions, times.tt)
+    fraction = sun.illumination(positions, times.tt)
+    assert set(np.unique(state)) == {UMBRA, PENUMBRA, SUNLIT}
+    assert np.all(fraction[state == UMBRA] == 0) and np.all(fraction[state == SUNLIT] == 1)
+    assert np.all((fraction[state == PENUMBRA] > 0) & (fraction[state == PENUMBRA] < 1))
+    np.testing.assert_array_equal(sunlit, state != UMBRA)
+
+
+def test_illumination_is_the_overlap_of_two_discs(ts, ephemeris, satellite):
+    sun = SunService(ts, ephemeris)
+    times = ts.tt_jd(2457083.0 + np.arange(8640) / 8640)
+    positions = satellite.at(times).position.km.T
+    penumbra = np.flatnonzero(sun.shadow(positions, times.tt) == PENUMBRA)[:5]
+    a, b, c = sun.cone(positions[penumbra], times.tt[penumbra])
+
+    # the visible part of the solar disc counted on a fine grid in the plane of the two discs
+    for a, b, c, fraction in zip(a, b, c, sun.illumination(positions[penumbra], times.tt[penumbra])):
+        u, v = np.meshgrid(np.linspace(-a, a, 1501), np.linspace(-a, a, 1501))
+        disc = u * u + v * v <= a * a
+        visible = (u + c) ** 2 + v * v > b * b
+        assert fraction == pytest.approx(np.sum(disc & visible) / np.sum(disc), abs=2e-3)
+
+
+def test_find_eclipses(ts, ephemeris, satellite):
+    sun = SunService(ts, ephemeris)
+    start, end = ts.tt_jd(2457083.0), ts.tt_jd(2457083.25) # six hours, about four orbits
+    times, events = sun.find_eclipses(satellite, start, end, step=30, tolerance=0.01)
+    assert len(events) >= 12 and np.all(np.diff(times.tt) > 0)
+    np.testing.assert_array_equal(events[1:], (events[:-1] + 1) % 4) # penumbra, umbra, umbra, penumbra, again
+
+    # every event is a boundary crossing of the state seen just before and just after it
+    expected = {PENUMBRA_ENTRY: (SUNLIT, PENUMBRA), UMBRA_ENTRY: (PENUMBRA, UMBRA), UMBRA_EXIT: (UMBRA, PENUMBRA), PENUMBRA_EXIT: (PENUMBRA, SUNLIT)}
+    around = ts.tt_jd(np.repeat(times.tt, 2) + np.tile([-0.03, 0.03], len(times)) / 86400)
+    states = sun.shadow(satellite.at(around).position.km.T, around.tt).reshape(-1, 2)
+    assert [tuple(state) for state in states] == [expected[event] for event in events]
+
+    # the same transitions as sampling the shadow every second
+    grid = ts.tt_jd(start.tt + np.arange(0, 6 * 3600 + 1) / 86400)
+    state = sun.shadow(satellite.at(grid).position.km.T, grid.tt)
+    changes = np.flatnonzero(state[1:] != state[:-1])
+    assert len(changes) == len(events)
+    np.testing.assert_allclose((times.tt - start.tt) * 86400, changes + 0.5, rtol=0, atol=0.5 + 1e-3)
+
+
+def test_find_eclipses_in_full_sun(ts, ephemeris, satellite):
+    sun = SunService(ts, ephemeris)
+    times, events = sun.find_eclipses(satellite, ts.tt_jd(2457083.0), ts.tt_jd(2457083.1))
+    sunlit = times[np.flatnonzero(events == PENUMBRA_EXIT)[0]].tt + 60 / 86400 # a minute after leaving the shadow
+    times, events = sun.find_eclipses(satellite, ts.tt_jd(sunlit), ts.tt_jd(sunlit + 600 / 86400))
+    assert len(times) == 0 and events.dtype == np.int8
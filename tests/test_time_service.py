@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from skyfield.api import load
+from skyfield.constants import DAY_S
+
+from services.time_service import TimeService, get_timescale
+
+
+@pytest.fixture(scope="module")
+def ts():
+    return load.timescale()
+
+
+def seconds_after(times, start):
+    """Seconds from start to every time, from the whole and fractional parts so no precision is lost."""
+    return ((times.whole - start.whole) + (times.tt_fraction - start.tt_fraction)) * DAY_S
+
+
+def test_grid_spacing(ts):
+    service = TimeService(ts)
+    start = ts.utc(2024, 4, 10, 12, 34, 56.789)
+    grid = service.grid(start, 30, 2880, first=-1440) # a day on each side at 30 s
+    assert grid.shape == (2880,)
+    np.testing.assert_allclose(seconds_after(grid, start), np.arange(-1440, 1440) * 30.0, rtol=0, atol=1e-6)
+    # the same instants as one Time per sample
+    for i in (0, 1440, 2879):
+        np.testing.assert_allclose(grid[i].tt, ts.tt_jd(start.tt + (i - 1440) * 30 / DAY_S).tt, rtol=0, atol=1e-9)
+
+
+def test_grid_memoize(ts):
+    service = TimeService(ts, max_grids=2)
+    start = ts.tt_jd(2460420.5)
+    grid = service.grid(start, 60, 100)
+    assert service.grid(ts.tt_jd(2460420.5), 60, 100) is grid # an equal start hits
+    assert service.grid(start, 60, 100, first=1) is not grid
+
+    # uncached grids neither hit nor evict
+    assert service.grid(start, 60, 100, memoize=False) is not grid
+    assert len(service.grids) == 2
+    service.grid(start, 60, 100) # most recently used
+    service.grid(start, 120, 10)
+    assert service.grid(start, 60, 100) is grid
+
+    service.clear()
+    assert not service.grids and service.grid(start, 60, 100) is not grid
+
+
+def test_lru_eviction(ts):
+    service = TimeService(ts, max_grids=3)
+    start = ts.tt_jd(2460420.5)
+    grids = [service.grid(start, step, 10) for step in (1, 2, 3)]
+    service.grid(start, 1, 10) # touch the oldest
+    service.grid(start, 4, 10) # evicts step 2
+    assert service.grid(start, 1, 10) is grids[0]
+    assert service.grid(start, 3, 10) is grids[2]
+    assert service.grid(start, 2, 10) is not grids[1]
+    assert len(service.grids) == 3
+
+
+def test_nodes_span_and_offsets(ts):
+    service = TimeService(ts)
+    nodes = service.nodes(3543005520, 3543005530, 60) # JD 2460420.5 on, the node index times the step
+    np.testing.assert_allclose(nodes.tt * DAY_S, np.arange(3543005520, 3543005531) * 60.0, rtol=1e-15)
+    assert service.nodes(3543005520, 3543005530, 60) is nodes
+
+    start = ts.tt_jd(2460420.5, 0.25)
+    span = service.span(start, 3600, 7)
+    np.testing.assert_allclose(seconds_after(span, start), np.arange(7) * 600.0, rtol=0, atol=1e-6)
+    assert service.span(start, 3600, 1).shape == (1,)
+
+    offsets = service.offsets(start, [-1.5, 0, 86400])
+    np.testing.assert_allclose(seconds_after(offsets, start), [-1.5, 0, 86400], rtol=0, atol=1e-6)
+    assert len(service.grids) == 3 # the nodes and the two spans, offsets are not memoized
+
+
+def test_timescale_is_shared(ts):
+    assert get_timescale() is get_timescale()
+    service = TimeService()
+    assert service.ts is get_timescale()
+    # the service stands in for the timescale
+    np.testing.assert_array_equal(service.tt_jd([2460420.5, 2460421.5]).tt, ts.tt_jd([2460420.5, 2460421.5]).tt)
+    assert abs(service.now().tt - ts.now().tt) * DAY_S < 60
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from sgp4.api import Satrec
+from sgp4.exporter import export_tle
+
+from conftest import ELEMENT_SETS, ISS, VANGUARD, tle_text
+
+from services.tle_parser import parse_tle, read_tle_file, satrecs_from_elements
+
+FIELDS = ("inclo", "nodeo", "ecco", "argpo", "mo", "no_kozai", "bstar", "ndot", "nddot", "jdsatepoch", "jdsatepochF")
+
+
+def test_fields_match_sgp4():
+    elements = parse_tle(tle_text(ELEMENT_SETS))
+    assert len(elements) == 3
+    assert elements["name"].tolist() == [name for name, line1, line2 in ELEMENT_SETS]
+    assert elements["norad_id"].tolist() == [25544, 11, 35932]
+    assert elements["checksum_ok"].all()
+    for row, (name, line1, line2) in zip(elements, ELEMENT_SETS):
+        satrec = Satrec.twoline2rv(line1, line2)
+        assert row["intldesg"] == satrec.intldesg
+        assert row["epochdays"] == pytest.approx(satrec.epochdays, abs=1e-12)
+        assert row["ecco"] == pytest.approx(satrec.ecco, abs=1e-12)
+        assert row["inclo"] == pytest.approx(np.degrees(satrec.inclo), abs=1e-9)
+        assert row["bstar"] == pytest.approx(satrec.bstar, rel=1e-12)
+
+
+def test_two_line_sets_three_line_sets_and_noise():
+    text = "No GP data found\r\n0 " + tle_text([ISS]) + tle_text([VANGUARD], named=False).replace("\n", "\r\n")
+    elements = parse_tle(text)
+    assert elements["name"].tolist() == ["ISS (ZARYA)", "00011"]
+    assert elements["line2"][1].decode() == VANGUARD[2]
+
+
+def test_empty_input():
+    assert len(parse_tle("")) == 0
+    assert len(parse_tle(b"\n\n")) == 0
+
+
+def test_alpha5_and_bad_checksum():
+    name, line1, line2 = ISS
+    line1 = line1[:2] + "A0001" + line1[7:]
+    line2 = line2[:2] + "A0001" + line2[7:-1] + str((int(line2[-1]) + 1) % 10)
+    elements = parse_tle(tle_text([(name, line1, line2)]))
+    assert elements["norad_id"][0] == 100001
+    assert not elements["checksum_ok"][0]
+
+
+def test_satrecs_propagate_like_twoline2rv():
+    elements = parse_tle(tle_text(ELEMENT_SETS))
+    jd = np.full(5, 2460420.5)
+    fr = np.linspace(0, 1, 5)
+    for satrec, (name, line1, line2) in zip(satrecs_from_elements(elements), ELEMENT_SETS):
+        reference = Satrec.twoline2rv(line1, line2)
+        errors, positions, velocities = satrec.sgp4_array(jd, fr)
+        expected_errors, expected_positions, expected_velocities = reference.sgp4_array(jd, fr)
+        assert not errors.any()
+        np.testing.assert_allclose(positions, expected_positions, atol=1e-6)
+        np.testing.assert_allclose(velocities, expected_velocities, atol=1e-9)
+        assert export_tle(satrec) == export_tle(reference)
+
+
+def test_read_tle_file(tmp_path):
+    path = tmp_path / "sets.tle"
+    path.write_text(tle_text(ELEMENT_SETS))
+    assert read_tle_file(str(path))["norad_id"].tolist() == [25544, 11, 35932]